@@ -1,4 +1,5 @@
 #include <stdio.h>
+#include <stdlib.h>
 #include <string.h>
 #include <sys/types.h>
 #include <unistd.h>
@@ -7,214 +8,187 @@
 #include "mrnet/MRNet.h"
 #define PGDB_PATH "/home/ndryden/PGDB/pgdb/mrnet-filters"
 #define MSG_TAG 3141
-#define COMP_TAG 3142
 
 extern "C" {
 
 	using namespace MRN;
 
 	const char* arec_filter_format_string = "%s";
-	PyThreadState* py_state;
 
+	// Per-stream filter state, kept in the state pointer MRNet provides.
+	// The module and function are resolved once and reused for every batch.
+	struct arec_filter_state {
+		PyObject* module;
+		PyObject* filter_func;
+	};
+
+	// Replace any output with a single error packet, so that no partial
+	// output is sent ahead of it.
 	void send_error_packet(unsigned int stream_id, int tag, std::vector<PacketPtr> &packets_out) {
+		packets_out.clear();
 		PacketPtr err_packet(new Packet(stream_id, tag, "%s", "ERROR"));
 		packets_out.push_back(err_packet);
 	}
 
-	void arec_filter(std::vector<PacketPtr> &packets_in, std::vector<PacketPtr> &packets_out,
-					 std::vector<PacketPtr> &packets_out_reverse, void** state, PacketPtr& config_params,
-					 const TopologyLocalInfo& topo_info) {
-		// Ensure Python is initialized; if it is, this does nothing.
-		Py_Initialize();
-		// We must serialize access to the Python interpreter.
-		// This deals with both the cases where threads are not initialized,
-		// which occurs when running on remote comm nodes, and the case where
-		// they are already initialized, which occurs on the front-end.
-		PyGILState_STATE gstate;
-		if (PyEval_ThreadsInitialized() == 0) {
+	// Initialize the interpreter, if needed. This is done only once.
+	// When the filter runs on remote comm nodes, nothing has initialized
+	// Python, so we do it and release the GIL so that every call can use the
+	// same PyGILState path. On the front-end, the interpreter is already
+	// running with threads initialized.
+	void init_python() {
+		if (!Py_IsInitialized()) {
+			Py_InitializeEx(0);
 			PyEval_InitThreads();
-			py_state = PyThreadState_Get();
+			PyEval_SaveThread();
 		}
-		else {
-			if (py_state != NULL) {
-				PyEval_RestoreThread(py_state);
-			}
-			else {
-				gstate = PyGILState_Ensure();
-			}
+	}
+
+	// Resolve the filter function. The GIL must be held.
+	// Returns NULL on error.
+	arec_filter_state* init_state() {
+		// Add the relevant search path to the Python module search path,
+		// unless it is already there.
+		PyObject* sys_path = PySys_GetObject((char*) "path");
+		PyObject* pgdb_path = PyString_FromString(PGDB_PATH);
+		if (sys_path == NULL || pgdb_path == NULL) {
+			Py_XDECREF(pgdb_path);
+			return NULL;
+		}
+		int has_path = PySequence_Contains(sys_path, pgdb_path);
+		if (has_path == 0) {
+			has_path = PyList_Append(sys_path, pgdb_path) == 0 ? 1 : -1;
+		}
+		Py_DECREF(pgdb_path);
+		if (has_path == -1) {
+			return NULL;
 		}
-		// Add the relevant search path to the Python module search path.
-		PyRun_SimpleString("import sys\n\
-sys.path.append('" PGDB_PATH "')\n");
 		// Load the relevant file.
 		PyObject* module = PyImport_ImportModule("filter_hook");
 		if (module == NULL) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			return;
+			return NULL;
 		}
 		// Get the function to call.
 		PyObject* filter_func = PyObject_GetAttrString(module, "filter_hook");
 		if ((filter_func == NULL) || !PyCallable_Check(filter_func)) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
+			Py_XDECREF(filter_func);
 			Py_DECREF(module);
-			return;
+			return NULL;
 		}
-		// Create the list to pass to the function.
-		PyObject* packet_list = PyList_New(packets_in.size());
+		arec_filter_state* filter_state = new arec_filter_state;
+		filter_state->module = module;
+		filter_state->filter_func = filter_func;
+		return filter_state;
+	}
+
+	// Convert packets to a list of Python strings. The GIL must be held.
+	// The data is copied once, straight from the packet's string element,
+	// using its stored length. Returns NULL on error.
+	PyObject* packets_to_list(std::vector<PacketPtr> &packets_in) {
+		PyObject* packet_list = PyList_New(0);
 		if (packet_list == NULL) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			Py_DECREF(module);
-			Py_DECREF(filter_func);
-			return;
+			return NULL;
 		}
 		for (size_t i = 0; i < packets_in.size(); ++i) {
-			char* packet_buf;
 			PacketPtr cur_packet = packets_in[i];
-			// Check the tag; we only deal with uncompressed data for now.
-			if (cur_packet->get_Tag() == COMP_TAG) {
-				packets_out.push_back(cur_packet);
-				continue;
-			}
-			// Unpack the packet into a buffer.
-			if (cur_packet->unpack("%s", &packet_buf) == -1) {
-				send_error_packet(packets_in[0]->get_StreamId(),
-								  MSG_TAG,
-								  packets_out);
-				Py_DECREF(module);
-				Py_DECREF(filter_func);
+			const DataElement* elem = (*cur_packet)[0];
+			if (elem == NULL || elem->get_Type() != STRING_T || elem->get_string() == NULL) {
+				PyErr_SetString(PyExc_ValueError, "packet is not a string");
 				Py_DECREF(packet_list);
-				return;
+				return NULL;
 			}
-			// Create a string from the packet data.
-			PyObject* unpacked = PyString_FromString(packet_buf);
+			PyObject* unpacked = PyString_FromStringAndSize(elem->get_string(),
+															(Py_ssize_t) elem->array_len);
 			if (unpacked == NULL) {
-				PyErr_Print();
-				send_error_packet(packets_in[0]->get_StreamId(),
-								  MSG_TAG,
-								  packets_out);
-				Py_DECREF(module);
-				Py_DECREF(filter_func);
 				Py_DECREF(packet_list);
-				return;
+				return NULL;
 			}
-			// Unpack allocates a buffer that we need to free.
-			free(packet_buf);
-			// Add the packet to the list.
-			// Note this steals the reference to unpacked.
-			if (PyList_SetItem(packet_list, i, unpacked) != 0) {
-				PyErr_Print();
-				send_error_packet(packets_in[0]->get_StreamId(),
-								  MSG_TAG,
-								  packets_out);
-				Py_DECREF(module);
-				Py_DECREF(filter_func);
+			int ret = PyList_Append(packet_list, unpacked);
+			Py_DECREF(unpacked);
+			if (ret != 0) {
 				Py_DECREF(packet_list);
-				Py_XDECREF(unpacked);
-				return;
+				return NULL;
 			}
 		}
-		// Create the arguments tuple and add the list.
-		PyObject* arguments = PyTuple_New(1);
-		if (arguments == NULL) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			Py_DECREF(module);
-			Py_DECREF(filter_func);
-			Py_DECREF(packet_list);
-			return;
-		}
-		if (PyTuple_SetItem(arguments, 0, packet_list) != 0) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			Py_DECREF(module);
-			Py_DECREF(filter_func);
-			Py_DECREF(packet_list);
-			Py_DECREF(arguments);
-			return;
-		}
-		// Call the Python function.
-		PyObject* ret_list = PyObject_CallObject(filter_func, arguments);
-		if (ret_list == NULL) {
-			PyErr_Print();
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			Py_DECREF(module);
-			Py_DECREF(filter_func);
-			Py_DECREF(packet_list);
-			Py_DECREF(arguments);
-			return;
-		}
+		return packet_list;
+	}
+
+	// Convert the list of (tag, data) tuples returned by the filter hook into
+	// packets. The GIL must be held. Returns false on error.
+	bool list_to_packets(PyObject* ret_list, unsigned int stream_id, std::vector<PacketPtr> &packets_out) {
 		if (!PyList_Check(ret_list)) {
-			send_error_packet(packets_in[0]->get_StreamId(),
-							  MSG_TAG,
-							  packets_out);
-			Py_DECREF(module);
-			Py_DECREF(filter_func);
-			Py_DECREF(packet_list);
-			Py_DECREF(arguments);
-			Py_DECREF(ret_list);
-			return;
+			return false;
 		}
-		// Iterate over each element of the returned list.
 		Py_ssize_t ret_length = PyList_Size(ret_list);
-		for (ssize_t i = 0; i < ret_length; ++i) {
-			// Convert the result to a usable string.
-			// Note this string may not be modified.
-			PyObject* ret_data = PyList_GetItem(ret_list, i);
-			char* python_packet_data = PyString_AsString(ret_data);
-			if (python_packet_data == NULL) {
-				PyErr_Print();
-				send_error_packet(packets_in[0]->get_StreamId(),
-								  MSG_TAG,
-								  packets_out);
-				Py_DECREF(module);
-				Py_DECREF(filter_func);
-				Py_DECREF(packet_list);
-				Py_DECREF(arguments);
-				Py_DECREF(ret_list);
-				return;
+		for (Py_ssize_t i = 0; i < ret_length; ++i) {
+			// Borrowed references; the string may not be modified.
+			PyObject* ret_item = PyList_GetItem(ret_list, i);
+			if (!PyTuple_Check(ret_item) || PyTuple_Size(ret_item) != 2) {
+				return false;
+			}
+			long tag = PyInt_AsLong(PyTuple_GetItem(ret_item, 0));
+			if (tag == -1 && PyErr_Occurred()) {
+				return false;
+			}
+			char* python_packet_data;
+			Py_ssize_t python_packet_len;
+			if (PyString_AsStringAndSize(PyTuple_GetItem(ret_item, 1),
+										 &python_packet_data, &python_packet_len) == -1) {
+				return false;
+			}
+			// The packet needs its own copy, which MRNet frees.
+			char* new_packet_data = (char*) malloc(python_packet_len + 1);
+			if (new_packet_data == NULL) {
+				return false;
 			}
-			char* new_packet_data = (char*) malloc(sizeof(char) * (strlen(python_packet_data) + 1));
-			strcpy(new_packet_data, python_packet_data);
+			memcpy(new_packet_data, python_packet_data, python_packet_len + 1);
 			// Construct the new packet and send it off.
-			// Use MSG_TAG because we removed all COMP_TAG messages above.
-			PacketPtr new_packet(new Packet(packets_in[0]->get_StreamId(),
-											MSG_TAG,
-											"%s",
-											new_packet_data));
+			PacketPtr new_packet(new Packet(stream_id, (int) tag, "%s", new_packet_data));
+			new_packet->set_DestroyData(true);
 			packets_out.push_back(new_packet);
 		}
-		// Release all the Python references.
-		Py_DECREF(module);
-		Py_DECREF(filter_func);
-		Py_DECREF(packet_list);
-		Py_DECREF(arguments);
-		Py_DECREF(ret_list);
-		// Release the Python interpreter.
-		if (py_state != NULL) {
-			py_state = PyEval_SaveThread();
+		return true;
+	}
+
+	void arec_filter(std::vector<PacketPtr> &packets_in, std::vector<PacketPtr> &packets_out,
+					 std::vector<PacketPtr> &packets_out_reverse, void** state, PacketPtr& config_params,
+					 const TopologyLocalInfo& topo_info) {
+		unsigned int stream_id = packets_in[0]->get_StreamId();
+		init_python();
+		// We must serialize access to the Python interpreter.
+		PyGILState_STATE gstate = PyGILState_Ensure();
+		arec_filter_state* filter_state = (arec_filter_state*) *state;
+		if (filter_state == NULL) {
+			filter_state = init_state();
+			if (filter_state == NULL) {
+				PyErr_Print();
+				send_error_packet(stream_id, MSG_TAG, packets_out);
+				PyGILState_Release(gstate);
+				return;
+			}
+			*state = filter_state;
 		}
-		else {
+		// Create the list to pass to the function.
+		PyObject* packet_list = packets_to_list(packets_in);
+		if (packet_list == NULL) {
+			PyErr_Print();
+			send_error_packet(stream_id, MSG_TAG, packets_out);
 			PyGILState_Release(gstate);
+			return;
+		}
+		// Call the Python function.
+		PyObject* ret_list = PyObject_CallFunction(filter_state->filter_func, (char*) "OIi",
+												   packet_list, stream_id,
+												   (int) topo_info.get_Rank());
+		Py_DECREF(packet_list);
+		if (ret_list == NULL || !list_to_packets(ret_list, stream_id, packets_out)) {
+			if (PyErr_Occurred()) {
+				PyErr_Print();
+			}
+			send_error_packet(stream_id, MSG_TAG, packets_out);
 		}
-		/*size_t i;
-		for (i = 0; i < packets_in.size(); ++i) {
-			packets_out.push_back(packets_in[i]);
-		}*/
+		Py_XDECREF(ret_list);
+		// Release the Python interpreter.
+		PyGILState_Release(gstate);
 	}
 
 } /* extern "C" */
@@ -7,41 +7,146 @@ from conf import gdbconf
 gdbconf.set_path()
 import cPickle
 from mi.gdbmiarec import *
+from varstat import combine_varstat_results
+from varcompare import combine_varcompare_results
+from stacktree import combine_stacktree_results
 from gdb_shared import *
 
-def filter_hook(packet_list):
+# Result messages merged for the same request. Maps message types to the
+# attributes identifying the request, the attributes holding the result, the
+# function combining a list of results, and attributes copied unchanged.
+merged_results = {
+    VARPRINT_RES_MSG: (("varprint_id", "page"), ("varobj", "errors"),
+                       combine_varprint_results, ("last",)),
+    VARSTAT_RES_MSG: (("varstat_id",), ("summary", "errors"),
+                      combine_varstat_results, ()),
+    VARCOMPARE_RES_MSG: (("varcompare_id",), ("digests", "values", "errors"),
+                         combine_varcompare_results, ()),
+    STACKTREE_RES_MSG: (("stacktree_id",), ("tree", "errors"),
+                        combine_stacktree_results, ()),
+    }
+
+# Multi-messages being reassembled, indexed by (stream ID, sender).
+# Each entry is [parts remaining, whether to merge, compressed, payloads].
+multi_msgs = {}
+
+def handle_multi_part(stream_id, sender, packet, packets):
+    """Handle one part of a multi-message OUT_MSG.
+
+    Returns the reassembled message once every part of a multi-message being
+    merged has arrived, and None otherwise. Parts of messages larger than
+    gdbconf.filter_merge_len are added to packets unchanged instead.
+
+    """
+    key = (stream_id, sender)
+    if key not in multi_msgs:
+        # The first part is the MULTI_MSG header.
+        msg = cPickle.loads(packet[MSG_HEADER_LEN:])
+        merge = msg.num * gdbconf.multi_len <= gdbconf.filter_merge_len
+        multi_msgs[key] = [msg.num, merge, msg.comp, []]
+        if not merge:
+            packets.append((MSG_TAG, packet))
+        return None
+    entry = multi_msgs[key]
+    entry[0] -= 1
+    if entry[0] == 0:
+        del multi_msgs[key]
+    if not entry[1]:
+        packets.append((MSG_TAG, packet))
+        return None
+    entry[3].append(cPickle.loads(packet[MSG_HEADER_LEN:]).payload)
+    if entry[0]:
+        return None
+    body = "".join(entry[3])
+    if entry[2]:
+        body = decompress_msg_body(body)
+    return cPickle.loads(body)
+
+def merge_result_msgs(msg_type, key, msgs, rank):
+    """Merge result messages of msg_type for the same request.
+
+    key holds the values of the attributes identifying the request, and msgs
+    is a list of (message, (tag, packet)) tuples. Returns a list of (tag,
+    packet) tuples to send on.
+
+    """
+    if len(msgs) == 1:
+        return [msgs[0][1]]
+    key_attrs, result_attrs, combine, copied_attrs = merged_results[msg_type]
+    result = combine([tuple(getattr(msg, attr) for attr in result_attrs)
+                      for msg, _ in msgs])
+    ranks = Interval([])
+    for msg, _ in msgs:
+        ranks += msg.ranks
+    attrs = dict(zip(key_attrs, key))
+    attrs.update(zip(result_attrs, result))
+    for attr in copied_attrs:
+        attrs[attr] = getattr(msgs[0][0], attr)
+    msg = GDBMessage(msg_type, ranks = ranks, **attrs)
+    return serialize_msg(msg, rank, gdbconf.compress_threshold,
+                         gdbconf.multi_len)
+
+def filter_hook(packet_list, stream_id, rank):
     """PGDB deduplication filter for MRNet.
 
-    This is invoked via a C filter called from MRNet.
-    Messages with type OUT_MSG are merged into combined aggregated records.
+    This is invoked via a C filter called from MRNet. It merges:
+    - OUT_MSGs into combined aggregated records.
+    - VARPRINT_RES_MSGs for the same varprint page into one aggregated tree.
+    - VARSTAT_RES_MSGs for the same varstat into one summary.
+    - VARCOMPARE_RES_MSGs for the same varcompare into one map of digests.
+    - STACKTREE_RES_MSGs for the same stacktree or sample into one call tree.
     packet_list is a list of serialized packets provided by MRNet.
-    These packets cannot be compressed.
-    Returns a serialized list of packets to MRNet.
+    stream_id is the stream the packets are on, and rank the MRNet rank of
+    this node.
+    Returns a list of (tag, packet) tuples to send on.
+
+    Only the header of each packet is examined to find mergeable messages.
+    Every other packet is passed through unchanged, without deserializing it.
+    Compressed OUT_MSGs are decompressed, and multi-message OUT_MSGs are
+    reassembled across calls, so that they can be merged too.
 
     """
-    msg_list = map(cPickle.loads, packet_list)
-    # Compute earliest sent time, if messages have them.
-    # Performance must be enabled globally, so only check first message.
-    new_time = None
-    if hasattr(msg_list[0], '_send_time'):
-        new_time = min(msg_list, key = lambda x: x._send_time)
-        new_time = new_time._send_time
     packets = []
     record_msgs = []
-    for msg in msg_list:
-        # Only process messages of type OUT_MSG.
-        if msg.msg_type == OUT_MSG:
-            record_msgs.append(msg)
+    record_packets = []
+    # Mergeable results, indexed by message type and request, with their
+    # packets.
+    result_msgs = {}
+    for packet in packet_list:
+        msg_type, flags, sender = unpack_msg_header(packet)
+        if msg_type in merged_results and not flags & MSG_FLAG_MULTI:
+            msg = deserialize_msg(packet)[3]
+            key = tuple(getattr(msg, attr)
+                        for attr in merged_results[msg_type][0])
+            result_msgs.setdefault((msg_type, key), []).append(
+                (msg, (msg_tag(flags), packet)))
+        elif msg_type != OUT_MSG:
+            packets.append((msg_tag(flags), packet))
+        elif flags & MSG_FLAG_MULTI:
+            msg = handle_multi_part(stream_id, sender, packet, packets)
+            if msg is not None:
+                record_msgs.append(msg)
         else:
-            packets.append(msg)
-    if record_msgs:
-        arec_list = map(lambda x: x.record, record_msgs)
-        new_list = arec_list.pop(0)
-        for l in arec_list:
-            new_list = combine_aggregated_records(new_list + l)
-        packets.append(GDBMessage(OUT_MSG, record = new_list))
-    for i, msg in enumerate(packets):
+            record_msgs.append(deserialize_msg(packet)[3])
+            record_packets.append((msg_tag(flags), packet))
+    if len(record_msgs) == 1 and record_packets:
+        # Nothing to merge with.
+        packets += record_packets
+    elif record_msgs:
+        # Compute earliest sent time, if messages have them.
+        # Performance must be enabled globally, so only check first message.
+        new_time = None
+        if hasattr(record_msgs[0], '_send_time'):
+            new_time = min(msg._send_time for msg in record_msgs)
+        # Merge every child's records at once.
+        arec_list = []
+        for msg in record_msgs:
+            arec_list += msg.record
+        msg = GDBMessage(OUT_MSG, record = combine_aggregated_records(arec_list))
         if new_time:
             msg._send_time = new_time
-        packets[i] = cPickle.dumps(msg, 0)
+        packets += serialize_msg(msg, rank, gdbconf.compress_threshold,
+                                 gdbconf.multi_len)
+    for (msg_type, key), msgs in result_msgs.iteritems():
+        packets += merge_result_msgs(msg_type, key, msgs, rank)
     return packets
@@ -0,0 +1,81 @@
+"""Running GDB commands in steps across all the local ranks.
+
+This is intended for the back-end, for commands such as varprint that need
+several rounds of GDB commands on every rank. Each step sends the commands for
+every rank to GDB in one batch and continues once all their results are in.
+
+"""
+
+class CommandRequest:
+    """The state of one multi-step request across the local ranks.
+
+    ranks is the list of local ranks in the request. pending counts the
+    outstanding GDB commands of the current step, and errors holds error
+    messages for ranks that have failed, indexed by rank.
+
+    """
+
+    def __init__(self, ranks):
+        """Initialize the request on ranks."""
+        self.ranks = ranks
+        self.pending = 0
+        self.errors = {}
+
+    def fail(self, rank, msg):
+        """Record an error for rank; it gets no further results."""
+        if rank not in self.errors:
+            self.errors[rank] = msg
+
+class CommandBatcher:
+    """Base class for running requests in batched steps on the back-end."""
+
+    def __init__(self, be):
+        """Initialization.
+
+        be is the GDBBE associated with this.
+
+        """
+        self.be = be
+        self.comm = be.comm
+        self.run_gdb_command_batch = be.run_gdb_command_batch
+        self.record_handler = be.record_handler
+
+    def _issue(self, req, commands, handler, done, no_thread=False):
+        """Send a step's commands to GDB in one batch.
+
+        commands is a list of (command, rank, data) tuples.
+        handler(req, record, rank, data) is invoked on the result of each
+        command, unless its rank has failed, and done(req) once every result
+        has arrived. If no_thread is True, the commands do not specify a
+        thread.
+
+        """
+        req.pending = 0
+        if not commands:
+            done(req)
+            return
+        tokens = self.run_gdb_command_batch([(command, rank) for command, rank, _
+                                             in commands], no_thread)
+        if tokens is None:
+            for _, rank, _ in commands:
+                req.fail(rank, "Could not send command to GDB.")
+            tokens = [None] * len(commands)
+        for (command, rank, data), token in zip(commands, tokens):
+            if token is None:
+                req.fail(rank, "Rank is not being debugged.")
+                continue
+            req.pending += 1
+            self.record_handler.add_token_handler(self._result_handler, token,
+                                                  (req, handler, done, rank, data))
+        if req.pending == 0:
+            done(req)
+
+    def _result_handler(self, record, **kwargs):
+        """Token handler for the result of a command sent by _issue."""
+        req, handler, done, rank, data = kwargs["data"]
+        if rank not in req.errors:
+            handler(req, record, rank, data)
+        req.pending -= 1
+        if req.pending == 0:
+            done(req)
+        return True
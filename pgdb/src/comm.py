@@ -1,6 +1,6 @@
 """Primary communication class for managing LaunchMON and MRNet communication."""
 
-import cPickle, os, sys, socket, threading, time, traceback, zlib
+import cPickle, os, sys, socket, threading, time, traceback
 from gdb_shared import *
 from conf import gdbconf
 from lmon import lmon
@@ -21,7 +21,9 @@ class Communicator (object):
         self.lmon = None
         self.mrnet = None
         self.been_shutdown = False
-        self.recv_stash = []
+        # Multi-messages being reassembled, indexed by (stream ID, sender).
+        # Each entry is [parts remaining, compressed, payloads].
+        self.multi_msgs = {}
         self.use_locking = locking
         self.packet_count = 0
         self.send_time_sum = 0
@@ -104,6 +106,7 @@ class Communicator (object):
 
     def _init_shared_mrnet(self):
         """Initialze some common MRNet stuff."""
+        self.mrnet_rank = self.mrnet.get_LocalRank()
         self._init_mrnet_streams()
 
     def get_proctab_size(self):
@@ -122,26 +125,6 @@ class Communicator (object):
         """Return an interval of MPI ranks. If on the back-end, this is local only."""
         return Interval(self.mpiranks)
 
-    def _multi_payload_split(self, msg, tag):
-        """Given a message, split it into multi-messages if needed."""
-        if len(msg) > gdbconf.multi_len:
-            split_len = gdbconf.multi_len
-            payloads = [msg[i:i + split_len] for i in range(0, len(msg), split_len)]
-            header_msg = GDBMessage(MULTI_MSG, num = len(payloads), comp = False)
-            if tag == COMP_TAG:
-                header_msg.comp = True
-                tag = MSG_TAG
-            payload_msgs = [header_msg]
-            for payload in payloads:
-                payload_msgs.append(GDBMessage(MULTI_PAYLOAD_MSG, payload = payload))
-            serialized_msgs = []
-            for payload in payload_msgs:
-                serialized_msgs.append(cPickle.dumps(payload, 0))
-            return serialized_msgs, tag
-        else:
-            # Nothing to be done.
-            return [msg], tag
-
     def _get_stream_for_interval(self, interval):
         """Given an interval, get the appropriate stream for it."""
         if interval == self.frontend:
@@ -158,28 +141,28 @@ class Communicator (object):
             # Since multiple MPI ranks correspond to one MRNet rank, eliminate duplicates.
             mrnet_ranks = list(set(mrnet_ranks))
             comm = self.mrnet.new_Communicator(mrnet_ranks)
-            return self.mrnet.new_Stream(comm,
-                                         self.filter_ids[0],
-                                         MRN.SFILTER_WAITFORALL,
-                                         MRN.TFILTER_NULL)
+            return self._new_stream(comm)
 
-    def _compress_msg(self, msg):
-        """Compress a message if it is greater than a certain size.
+    def _new_stream(self, communicator):
+        """Create a new stream on communicator using the PGDB filter.
 
-        Currently, compressed messages are not processed by the MRNet filters.
-        This limitation can be partially removed: compressed messages that are
-        not split into multi-messages can be processed.
+        The upstream synchronization is set by gdbconf.mrnet_sync_mode. In
+        "timeout" mode, commnodes forward whatever has arrived once
+        gdbconf.mrnet_sync_timeout milliseconds have passed, so one slow
+        back-end does not hold up output from the rest.
 
         """
-        tag = MSG_TAG
-        if len(msg) >= gdbconf.compress_threshold:
-            msg = zlib.compress(msg, 1).encode("string_escape")
-            tag = COMP_TAG
-        return msg, tag
-
-    def _decompress_msg(self, msg):
-        """Decompress msg."""
-        return zlib.decompress(msg.decode("string_escape"))
+        sync_modes = {"waitforall": MRN.SFILTER_WAITFORALL,
+                      "timeout": MRN.SFILTER_TIMEOUT,
+                      "dontwait": MRN.SFILTER_DONTWAIT}
+        stream = self.mrnet.new_Stream(communicator,
+                                       self.filter_ids[0],
+                                       sync_modes[gdbconf.mrnet_sync_mode],
+                                       MRN.TFILTER_NULL)
+        if gdbconf.mrnet_sync_mode == "timeout":
+            stream.set_FilterParameters(MRN.FILTER_UPSTREAM_SYNC, "%ud",
+                                        gdbconf.mrnet_sync_timeout)
+        return stream
 
     def send(self, message, targets, stream = None):
         """Send data over MRNet.
@@ -192,13 +175,12 @@ class Communicator (object):
         """
         if gdbconf.mrnet_collect_perf_data:
             message._send_time = time.time()
-        msg = cPickle.dumps(message, 0)
-        msg, tag = self._compress_msg(msg)
+        send_list = serialize_msg(message, self.mrnet_rank,
+                                  gdbconf.compress_threshold, gdbconf.multi_len)
         self._lock()
-        send_list, tag = self._multi_payload_split(msg, tag)
         stream = self._get_stream_for_interval(targets)
-        for payload in send_list:
-            if stream.send(tag, "%s", payload) == -1:
+        for tag, packet in send_list:
+            if stream.send(tag, "%s", packet) == -1:
                 print "Fatal error on stream send."
                 sys.exit(1)
             if stream.flush() == -1:
@@ -207,7 +189,12 @@ class Communicator (object):
         self._unlock()
 
     def _recv(self, blocking = True):
-        """Raw receive function for MRNet."""
+        """Raw receive function for MRNet.
+
+        Returns a (message, stream, sender) tuple, or Nones if nothing was
+        received.
+
+        """
         self._lock()
         ret, tag, packet, stream = self.mrnet.recv(blocking)
         if ret == -1:
@@ -215,7 +202,7 @@ class Communicator (object):
             sys.exit(1)
         if ret == 0:
             self._unlock()
-            return None, None
+            return None, None, None
         ret, serialized = packet.get().unpack("%s")
         if ret == -1:
             print "Could not unpack packet."
@@ -224,9 +211,7 @@ class Communicator (object):
         if serialized == "ERROR":
             print "Filter error!"
             sys.exit(1)
-        if tag == COMP_TAG:
-            serialized = self._decompress_msg(serialized)
-        msg = cPickle.loads(serialized)
+        msg_type, flags, sender, msg = deserialize_msg(serialized)
         # Compute time from sending to receiving.
         if gdbconf.mrnet_collect_perf_data and hasattr(msg, "_send_time"):
             cur = time.time()
@@ -234,43 +219,47 @@ class Communicator (object):
             self.send_time_sum += max(cur - msg._send_time, 0)
             print "Packet time: {0} - {1} = {2}".format(cur, msg._send_time, cur - msg._send_time)
         self._unlock()
-        return msg, stream
-
-    def _recv_multi_message(self, msg):
-        """Handle receiving a multi-message."""
-        payload = ""
-        counter = 0
-        while counter != msg.num:
-            multi_msg = None
-            while not multi_msg:
-                # Block, because we know we should get messages.
-                recvd, stream = self._recv()
-                if not recvd:
-                    # This shouldn't happen and may cause bad things.
-                    continue
-                if recvd.msg_type == MULTI_PAYLOAD_MSG:
-                    multi_msg = recvd
-                else:
-                    self._lock()
-                    self.recv_stash.append(recvd)
-                    self._unlock()
-            payload += multi_msg.payload
-            counter += 1
-        if msg.comp:
-            payload = self._decompress_msg(payload)
+        return msg, stream, sender
+
+    def _recv_multi_part(self, msg, stream, sender):
+        """Handle one part of a multi-message.
+
+        Large messages from different senders may pass through the MRNet
+        filters unmerged, so their parts can be interleaved; parts are
+        reassembled per stream and sender. Returns the message once every
+        part has arrived, and None otherwise.
+
+        """
+        key = (stream.get_Id(), sender)
+        if msg.msg_type == MULTI_MSG:
+            self.multi_msgs[key] = [msg.num, msg.comp, []]
+            return None
+        if key not in self.multi_msgs:
+            print "Dropping a multi-message part from {0} with no header.".format(
+                sender)
+            return None
+        entry = self.multi_msgs[key]
+        entry[0] -= 1
+        entry[2].append(msg.payload)
+        if entry[0]:
+            return None
+        del self.multi_msgs[key]
+        payload = "".join(entry[2])
+        if entry[1]:
+            payload = decompress_msg_body(payload)
         return cPickle.loads(payload)
 
     def recv(self, blocking = True, ret_stream = False):
         """Receive data on MRNet. Automatically handles multi-messages."""
-        self._lock()
-        if len(self.recv_stash) > 0:
-            return self.recv_stash.pop(0)
-        self._unlock()
-        msg, stream = self._recv(blocking)
-        if not msg:
-            return None
-        if msg.msg_type == MULTI_MSG:
-            return self._recv_multi_message(msg)
+        while True:
+            msg, stream, sender = self._recv(blocking)
+            if not msg:
+                return None
+            if msg.msg_type not in (MULTI_MSG, MULTI_PAYLOAD_MSG):
+                break
+            msg = self._recv_multi_part(msg, stream, sender)
+            if msg is not None:
+                break
         if ret_stream:
             return msg, stream
         else:
@@ -520,10 +509,7 @@ class CommunicatorFE (Communicator):
     def _init_mrnet_streams(self):
         """Initialize basic MRNet streams."""
         self.broadcast_communicator = self.mrnet.get_BroadcastCommunicator()
-        self.mrnet_broadcast_stream = self.mrnet.new_Stream(self.broadcast_communicator,
-                                                            self.filter_ids[0],
-                                                            MRN.SFILTER_WAITFORALL,
-                                                            MRN.TFILTER_NULL)
+        self.mrnet_broadcast_stream = self._new_stream(self.broadcast_communicator)
         self.mrnet_frontend_stream = None # Not used here.
 
     def _send_mrnet_hello(self):
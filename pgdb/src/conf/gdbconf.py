@@ -41,6 +41,16 @@ varprint_max_depth = 3
 # The maximum number of children of an object to consider unless explicitly printing the object.
 # (Note, this is just children, not descendants.)
 varprint_max_children = 60
+# The number of children in each page sent when printing a range of children.
+varprint_page_size = 100
+# The largest read, in bytes, done at once when summarizing an array for varstat.
+varstat_chunk_size = 1048576
+# The time, in seconds, to wait for the values fetched by varcompare before reporting the ranks
+# that did not send them. Back-ends discard values not fetched after this long.
+varcompare_fetch_timeout = 30
+# Variable object roots not printed in this many varprints are frozen in GDB, so
+# that updates skip them until they are printed again.
+varprint_freeze_age = 20
 # The branching factor to use when constructing the MRNet topology.
 mrnet_branch_factor = 32
 # The size of each topology broadcast, from the front-end to the back-end master, and the master to
@@ -50,18 +60,36 @@ topology_transmit_size = 32768
 compress_threshold = 10240
 # The maximum length of a message before it is split into smaller messages for transmission over MRNet.
 multi_len = 5242880
+# The largest multi-message OUT_MSG, in bytes, that the MRNet filters reassemble and merge.
+# Larger messages are passed through the filters unmerged.
+filter_merge_len = 67108864
 # A list of tuples of the form (path, function), where path is a path to an MRNet filter
 # and function is the name of the filter function.
 mrnet_filters = [(pgdb_path + "/mrnet-filters/arec_filter.so", "arec_filter")]
+# How MRNet commnodes wait for packets from their children before filtering them.
+# "waitforall" waits for every child, "timeout" waits at most mrnet_sync_timeout milliseconds and
+# forwards a partial aggregate, and "dontwait" forwards packets as they arrive.
+mrnet_sync_mode = "waitforall"
+# The time, in milliseconds, to wait for children when using the "timeout" sync mode.
+# The front-end also waits this long for output from all ranks before printing it.
+mrnet_sync_timeout = 500
 # Whether to enable collection of MRNet performance data or not.
 mrnet_collect_perf_data = True
 # Whether to write a DOT file of the topology. The path of the file if yes, None otherwise.
 mrnet_topology_dot = "/home/ndryden/topo.dot"
-# The length of history to keep.
+# The number of output history items to keep in memory.
 history_length = 100
+# File to spill older output history to, compressed, so that it can still be expanded.
+# None to discard history beyond history_length.
+import tempfile
+history_spill_file = os.path.join(tempfile.gettempdir(),
+                                  "pgdb_history_{0}".format(os.getpid()))
 # Whether to load files using the SBD system.
 use_sbd = True
 # Path to the SBD shared library.
 sbd_bin = pgdb_path + "/load_file.so"
 # Size of shared memory the SBD uses, in bytes. Currently 32 MiB.
 sbd_shmem_size = 33554432
+# Size of the chunks SBD files are sent in, in bytes. This should be less than
+# multi_len, so chunks are not split again.
+sbd_chunk_size = 1048576
@@ -1,6 +1,6 @@
 """Miscellaneous shared things for both the PGDB FE and BE."""
 
-import inspect
+import inspect, cPickle, zlib
 
 class NodeInfo:
     """Stores MRNet node information for braodcast."""
@@ -35,6 +35,16 @@ MULTI_PAYLOAD_MSG = 10
 KILL_MSG = 11
 LOAD_FILE = 12
 FILE_DATA = 13
+BLOCK_MSG = 14
+UNBLOCK_MSG = 15
+FILTER_STATS_MSG = 16
+VARSTAT_MSG = 17
+VARSTAT_RES_MSG = 18
+VARCOMPARE_MSG = 19
+VARCOMPARE_RES_MSG = 20
+STACKTREE_MSG = 21
+STACKTREE_RES_MSG = 22
+SAMPLE_MSG = 23
 
 class GDBMessage:
     """A simple class for transmitting messages and related information."""
@@ -64,3 +74,74 @@ class GDBMessage:
                 # Keep out things like __doc__ and __module__.
                 string += "{0} = {1}, ".format(k, v)
         return "GDBMessage: " + string[:-2]
+
+# Every serialized message sent over MRNet starts with a fixed-size header
+# giving the message type, flags, and MRNet rank of the sender, so that
+# packets can be routed without deserializing them. The header is printable
+# because packets are sent as strings.
+MSG_HEADER_LEN = 12
+# The body is compressed.
+MSG_FLAG_COMPRESSED = 0x1
+# The body is one part of a multi-message.
+MSG_FLAG_MULTI = 0x2
+
+def pack_msg_header(msg_type, flags, sender):
+    """Return the header for a message of msg_type with flags from sender."""
+    return "{0:02x}{1:02x}{2:08x}".format(msg_type, flags, sender)
+
+def unpack_msg_header(packet):
+    """Return a (msg_type, flags, sender) tuple from a packet's header."""
+    return (int(packet[0:2], 16), int(packet[2:4], 16),
+            int(packet[4:MSG_HEADER_LEN], 16))
+
+def msg_tag(flags):
+    """Return the MRNet tag for a packet with the given header flags."""
+    if flags & MSG_FLAG_COMPRESSED:
+        return COMP_TAG
+    return MSG_TAG
+
+def compress_msg_body(body):
+    """Compress a serialized message body."""
+    return zlib.compress(body, 1).encode("string_escape")
+
+def decompress_msg_body(body):
+    """Decompress a serialized message body."""
+    return zlib.decompress(body.decode("string_escape"))
+
+def serialize_msg(message, sender, compress_threshold, multi_len):
+    """Serialize a message into a list of (tag, packet) tuples to send.
+
+    The message is compressed if it is at least compress_threshold long, and
+    split into a multi-message if it is then longer than multi_len.
+
+    """
+    body = cPickle.dumps(message, 0)
+    flags = 0
+    comp = False
+    if len(body) >= compress_threshold:
+        body = compress_msg_body(body)
+        flags = MSG_FLAG_COMPRESSED
+        comp = True
+    if len(body) <= multi_len:
+        header = pack_msg_header(message.msg_type, flags, sender)
+        return [(msg_tag(flags), header + body)]
+    payloads = [body[i:i + multi_len] for i in range(0, len(body), multi_len)]
+    msgs = [GDBMessage(MULTI_MSG, num = len(payloads), comp = comp)]
+    for payload in payloads:
+        msgs.append(GDBMessage(MULTI_PAYLOAD_MSG, payload = payload))
+    # The parts themselves are not compressed.
+    header = pack_msg_header(message.msg_type, MSG_FLAG_MULTI, sender)
+    return [(MSG_TAG, header + cPickle.dumps(msg, 0)) for msg in msgs]
+
+def deserialize_msg(packet):
+    """Deserialize a packet produced by serialize_msg.
+
+    Returns a (msg_type, flags, sender, message) tuple. For parts of multi-
+    messages, message is the MULTI_MSG or MULTI_PAYLOAD_MSG message.
+
+    """
+    msg_type, flags, sender = unpack_msg_header(packet)
+    body = packet[MSG_HEADER_LEN:]
+    if flags & MSG_FLAG_COMPRESSED:
+        body = decompress_msg_body(body)
+    return msg_type, flags, sender, cPickle.loads(body)
@@ -21,7 +21,11 @@ from mi.gdbmiarec import (GDBMIAggregatedRecord, combine_records,
 from mi.gdbmi_recordhandler import GDBMIRecordHandler
 from interval import Interval
 from varprint import VariablePrinter
+from varstat import VariableStatistics
+from varcompare import VariableComparer
+from stacktree import StackTreeBuilder, StackSampler
 from sbd import SBDBE
+from recordfilter import RecordFilter
 import signal
 import os
 import os.path
@@ -29,6 +33,7 @@ import mmap
 import struct
 import time
 import sys
+import re
 import posix_ipc
 
 class GDBBE:
@@ -60,9 +65,10 @@ class GDBBE:
         disable_pagination_cmd = Command("gdb-set", args=["pagination", "off"])
         enable_non_stop_cmd = Command("gdb-set", args=["non-stop", "on"])
         add_inferior_cmd = Command("add-inferior")
-        self.gdb = GDBMachineInterface(gdb=gdbconf.gdb_path,
-                                       gdb_args=["-x", gdbconf.gdb_init_path],
-                                       env=gdb_env)
+        # Raw results are kept only for commands with token handlers.
+        self.gdb = GDBMachineInterface(
+            gdb=gdbconf.gdb_path, gdb_args=["-x", gdbconf.gdb_init_path],
+            env=gdb_env, keep_results=self.record_handler.has_token_handler)
         procs = self.comm.get_proctab()
         # Set up GDB.
         if not self.run_gdb_command(enable_pprint_cmd):
@@ -162,21 +168,46 @@ class GDBBE:
             self.token_rank_map[command.token] = self.comm.get_mpiranks()
             return self.gdb.send(command)
         else:
-            if command.get_opt('--thread') is not None:
-                # If --thread provided, don't override it.
-                no_thread = True
-            for rank in ranks:
-                if rank in self.rank_inferior_map:
-                    # Most recent option with same name takes precedence.
-                    if (not no_thread and
-                        rank in self.rank_thread_map):
-                        command.add_opt('--thread',
-                                        self.rank_thread_map[rank][0])
-                    if not self.gdb.send(command):
-                        return False
-                    self.token_rank_map[command.token] = rank
+            # Generate the command for every local rank, then send them all
+            # at once. Each command gets its own token.
+            commands = [(command, rank) for rank
+                        in ranks.intersect(self.comm.get_mpiranks())]
+            if commands:
+                return self.run_gdb_command_batch(commands, no_thread) is not None
         return True
 
+    def run_gdb_command_batch(self, commands, no_thread=False):
+        """Run GDB commands on ranks with a single write to GDB.
+
+        commands is a list of (command, rank) tuples; a command may appear
+        more than once. Ranks that are not local are skipped.
+        If no_thread is True, this does not specify a particular thread.
+
+        Returns a list of the token used for each tuple (None for skipped
+        ones), or None on error.
+
+        """
+        tokens = []
+        lines = []
+        for command, rank in commands:
+            if rank not in self.rank_inferior_map:
+                tokens.append(None)
+                continue
+            # Map the token before generating, which moves to a new token.
+            tokens.append(command.token)
+            self.token_rank_map[command.token] = rank
+            # If --thread provided, don't override it.
+            if (not no_thread and command.get_opt('--thread') is None and
+                rank in self.rank_thread_map):
+                command.add_opt('--thread', self.rank_thread_map[rank][0])
+                lines.append(command.generate_mi_command())
+                del command.opts['--thread']
+            else:
+                lines.append(command.generate_mi_command())
+        if lines and not self.gdb.send_batch(lines):
+            return None
+        return tokens
+
     def init_handlers(self):
         """Initialize message handlers used on data we receive over MRNet."""
         self.msg_handlers = {
@@ -185,13 +216,26 @@ class GDBBE:
             FILTER_MSG: self.filter_handler,
             UNFILTER_MSG: self.unfilter_handler,
             VARPRINT_MSG: self.varprint_handler,
+            VARSTAT_MSG: self.varstat_handler,
+            VARCOMPARE_MSG: self.varcompare_handler,
+            STACKTREE_MSG: self.stacktree_handler,
+            SAMPLE_MSG: self.sample_handler,
             KILL_MSG: self.kill_handler,
             FILE_DATA: self.file_data_handler,
+            BLOCK_MSG: self.block_handler,
+            UNBLOCK_MSG: self.unblock_handler,
             }
 
     def init_filters(self):
         """Initialize default filters."""
         self.filters = set()
+        # Compiled predicate filters, indexed by filter ID.
+        self.record_filters = {}
+        # Drop counts last reported to the front-end, and when.
+        self.reported_filter_stats = {}
+        self.filter_stats_time = 0
+        # Ranks whose output is blocked.
+        self.blocks = Interval([])
         #an_lower = ASYNC_NOTIFY.lower()
         #self.filters = [
         #    (an_lower, "shlibs-updated"),
@@ -222,6 +266,10 @@ class GDBBE:
         self.init_handlers()
         self.init_filters()
         self.variable_printer = VariablePrinter(self)
+        self.variable_statistics = VariableStatistics(self)
+        self.variable_comparer = VariableComparer(self)
+        self.stack_tree_builder = StackTreeBuilder(self)
+        self.stack_sampler = StackSampler(self)
 
     def shutdown(self):
         """Cleanly shut things down if we have not already done so."""
@@ -268,17 +316,97 @@ class GDBBE:
         self.kill_inferiors()
 
     def filter_handler(self, msg):
-        """Handle a filter message by adding the filter."""
-        self.filters.update(msg.filter_types)
+        """Handle a filter message by adding the filter.
+
+        The message contains either filter_types, a set of record types to
+        filter, or filter_id and spec, a predicate filter to compile.
+
+        """
+        if hasattr(msg, "filter_id"):
+            try:
+                self.record_filters[msg.filter_id] = RecordFilter(msg.spec)
+            except (ValueError, re.error) as e:
+                print("Bad filter {0}: {1}".format(msg.filter_id, e))
+        else:
+            self.filters.update(msg.filter_types)
 
     def unfilter_handler(self, msg):
         """Handle an unfilter message by removing the filter."""
-        self.filters.difference_update(msg.filter_types)
+        if hasattr(msg, "filter_id"):
+            self.record_filters.pop(msg.filter_id, None)
+        else:
+            self.filters.difference_update(msg.filter_types)
+
+    def apply_record_filters(self, record, ranks):
+        """Apply predicate filters to a record from ranks.
+
+        Returns the ranks the record is kept for, or None if it is dropped.
+
+        """
+        for record_filter in self.record_filters.itervalues():
+            ranks = record_filter.apply(record, ranks)
+            if ranks is None:
+                break
+        return ranks
+
+    def report_filter_stats(self):
+        """Send changed filter drop counts to the front-end, at most once a second."""
+        if time.time() - self.filter_stats_time < 1:
+            return
+        counts = dict((filter_id, record_filter.dropped)
+                      for filter_id, record_filter
+                      in self.record_filters.iteritems())
+        if counts != self.reported_filter_stats:
+            self.comm.send(GDBMessage(FILTER_STATS_MSG, counts=counts,
+                                      ranks=self.comm.get_mpiranks()),
+                           self.comm.frontend)
+            self.reported_filter_stats = counts
+        self.filter_stats_time = time.time()
+
+    def block_handler(self, msg):
+        """Handle a block message by blocking output from the ranks."""
+        self.blocks += msg.ranks
+
+    def unblock_handler(self, msg):
+        """Handle an unblock message by unblocking output from the ranks."""
+        self.blocks -= msg.ranks
+
+    def unblocked_ranks(self, ranks):
+        """Return the ranks in ranks whose output is not blocked.
+
+        ranks is a single rank or an Interval. Returns None if every rank is
+        blocked.
+
+        """
+        if isinstance(ranks, int):
+            if ranks in self.blocks:
+                return None
+            return ranks
+        ranks = ranks - self.blocks
+        if ranks.empty():
+            return None
+        return ranks
 
     def varprint_handler(self, msg):
         """Handle the varprint message and begin sequence."""
         self.variable_printer.varprint_handler(msg)
 
+    def varstat_handler(self, msg):
+        """Handle the varstat message by summarizing an array."""
+        self.variable_statistics.varstat_handler(msg)
+
+    def varcompare_handler(self, msg):
+        """Handle the varcompare message by comparing values across ranks."""
+        self.variable_comparer.varcompare_handler(msg)
+
+    def stacktree_handler(self, msg):
+        """Handle the stacktree message by building a tree of the stacks."""
+        self.stack_tree_builder.stacktree_handler(msg)
+
+    def sample_handler(self, msg):
+        """Handle the sample message by starting to sample stacks."""
+        self.stack_sampler.sample_handler(msg)
+
     def is_filterable(self, record):
         """Check whether a given record can be filtered."""
         record_set = record.record_subtypes.union([record.record_type])
@@ -321,17 +449,35 @@ class GDBBE:
             records = []
             ranks = []
             for record in self.gdb.read():
+                # Results for commands with token handlers, such as those
+                # varprint runs, are consumed by the handlers.
+                consumed = (record.token is not None and
+                            record.record_type == mi.gdbmi_records.RESULT and
+                            self.record_handler.has_token_handler(record.token))
                 self.record_handler.handle(record)
+                if consumed:
+                    self.token_rank_map.pop(record.token, None)
+                    continue
+                if self.stack_sampler.consume_record(record):
+                    # Stops and resumes caused by sampling are not shown.
+                    continue
                 if not self.is_filterable(record):
-                    records.append(record)
                     if (record.token is not None and
                         record.token in self.token_rank_map):
-                        ranks.append(self.token_rank_map[record.token])
+                        rank = self.token_rank_map[record.token]
                     elif (hasattr(record, "thread_id") and
                           record.thread_id in self.thread_rank_map):
-                        ranks.append(self.thread_rank_map[record.thread_id])
+                        rank = self.thread_rank_map[record.thread_id]
                     else:
-                        ranks.append(self.comm.get_mpiranks())
+                        rank = self.comm.get_mpiranks()
+                    # Drop output from blocked ranks and filtered records
+                    # before it is sent.
+                    rank = self.unblocked_ranks(rank)
+                    if rank is not None and self.record_filters:
+                        rank = self.apply_record_filters(record, rank)
+                    if rank is not None:
+                        records.append(record)
+                        ranks.append(rank)
             if records:
                 arecs = combine_records(records, ranks)
                 if self.doing_startup:
@@ -348,6 +494,11 @@ class GDBBE:
                         self.comm.send(GDBMessage(OUT_MSG, record=arecs),
                                        self.comm.frontend)
 
+            if self.record_filters:
+                self.report_filter_stats()
+
+            self.stack_sampler.check()
+
             # Sleep a bit to reduce banging on the CPU.
             time.sleep(0.01)
         # Wait for GDB to exit.
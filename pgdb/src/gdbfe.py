@@ -5,19 +5,33 @@ this.
 
 """
 
-import os, os.path, threading, signal
+import os, os.path, threading, signal, time, re
 from collections import deque
 from conf import gdbconf
 from gdb_shared import *
 from comm import *
 from mi.gdbmicmd import GDBMICmd
 from mi.gdbmi_recordhandler import GDBMIRecordHandler
-from mi.varobj import VariableObject, VariableObjectManager
 from mi.commands import Command
-from mi.gdbmiarec import GDBMIAggregatedRecord, combine_aggregated_records
+from mi.gdbmiarec import (GDBMIAggregatedRecord, combine_aggregated_records,
+                          combine_varprint_results)
+from mi.gdbmi_records import (RESULT, RESULT_CLASS_DONE, RESULT_CLASS_RUNNING,
+                              RESULT_CLASS_CONNECTED, RESULT_CLASS_ERROR,
+                              RESULT_CLASS_EXIT)
 from mi.gdbmipprinter import GDBMIPrettyPrinter
 from interval import Interval
 from sbd import SBDFE
+from history import OutputHistory
+from recordfilter import FILTER_KINDS
+from varstat import combine_varstat_results
+from varcompare import combine_varcompare_results
+from stacktree import combine_stacktree_results
+
+# Record types and subtypes, in lowercase, that filters may drop results by.
+RESULT_TYPES = set(t.lower() for t in (RESULT, RESULT_CLASS_DONE,
+                                       RESULT_CLASS_RUNNING,
+                                       RESULT_CLASS_CONNECTED,
+                                       RESULT_CLASS_ERROR, RESULT_CLASS_EXIT))
 
 class GDBFE (GDBMICmd):
     """The front-end to PGDB."""
@@ -30,7 +44,11 @@ class GDBFE (GDBMICmd):
             QUIT_MSG: self.quit_handler,
             OUT_MSG: self.out_handler,
             VARPRINT_RES_MSG: self.varprint_res_handler,
-            LOAD_FILE: self.load_file_handler
+            VARSTAT_RES_MSG: self.varstat_res_handler,
+            VARCOMPARE_RES_MSG: self.varcompare_res_handler,
+            STACKTREE_RES_MSG: self.stacktree_res_handler,
+            LOAD_FILE: self.load_file_handler,
+            FILTER_STATS_MSG: self.filter_stats_handler,
             }
         # Now record handlers.
         self.record_handler = GDBMIRecordHandler()
@@ -56,16 +74,48 @@ class GDBFE (GDBMICmd):
             self.remote_up.set()
             self.interrupt_main()
             return False
-        self.varobjs = {}
-        for rank in self.comm.get_mpiranks():
-            self.varobjs[rank] = VariableObjectManager()
+        # Varprints awaiting results, indexed by varprint ID. Each entry is
+        # [name, ranks, pages, errors printed], where pages maps pages (None
+        # when not printing a range) to [(tree, errors) results, ranks
+        # received].
+        self.varprints = {}
+        self.next_varprint_id = 0
+        # The most recently printed aggregated tree for each variable name.
+        self.varprint_trees = {}
+        # Varstats awaiting results, indexed by varstat ID. Each entry is
+        # [expression, ranks, [(summary, errors) results], ranks received].
+        self.varstats = {}
+        self.next_varstat_id = 0
+        # Varcompares awaiting results, indexed by varcompare ID. Each entry
+        # is [expression, ranks, [(digests, values, errors) results], ranks
+        # received, None or the map of digests to the ranks fetched from,
+        # None or when the values were fetched].
+        self.varcompares = {}
+        self.next_varcompare_id = 0
+        # Stacktrees and samples awaiting results, indexed by stacktree ID.
+        # Each entry is [ranks, [(tree, errors) results], ranks received,
+        # whether to show sample counts].
+        self.stacktrees = {}
+        self.next_stacktree_id = 0
         self.init_handlers()
         self.pprinter = GDBMIPrettyPrinter()
         self.sleep_time = 0.1
-        self.blocks = []
+        # Predicate filters, indexed by filter ID, and the drop counts most
+        # recently reported by each back-end.
+        self.record_filters = {}
+        self.next_filter_id = 0
+        self.filter_drops = {}
+        # The terms of each predicate filter, and the filtered record types,
+        # used to tell which ranks' results may never arrive.
+        self.filter_specs = {}
+        self.filter_types = set()
+        self.blocks = Interval([])
         try:
-            self.blocks += gdbconf.default_blocks
+            self.blocks = Interval(gdbconf.default_blocks)
         except AttributeError: pass
+        if not self.blocks.empty():
+            self.comm.send(GDBMessage(BLOCK_MSG, ranks = self.blocks),
+                           self.comm.broadcast)
         # Initialize the SBD system if needed.
         if gdbconf.use_sbd:
             self.sbd = SBDFE(self.comm)
@@ -84,8 +134,19 @@ class GDBFE (GDBMICmd):
         self.remote_up = threading.Event()
         # Temporary list for building up aggregated records from OUT messages.
         self.arec_list = []
+        # When the first record in arec_list arrived.
+        self.arec_time = None
+        # Ranks that have been sent a command but not yet returned a result,
+        # and when the oldest such command was sent. Ranks still pending after
+        # gdbconf.mrnet_sync_timeout are reported and no longer waited on.
+        # These are only tracked in the "timeout" sync mode, and are updated
+        # from both threads, so are guarded by pending_lock.
+        self.pending_ranks = Interval([])
+        self.pending_time = None
+        self.pending_lock = threading.Lock()
         # Output history for expanding commands.
-        self.output_history = []
+        self.output_history = OutputHistory(gdbconf.history_length,
+                                            gdbconf.history_spill_file)
         # Get our PID for signals.
         self.my_pid = os.getpid()
 
@@ -156,6 +217,7 @@ class GDBFE (GDBMICmd):
         """Shut down the network if not already shut down."""
         if not self.comm.is_shutdown():
             self.comm.shutdown()
+        self.output_history.close()
 
     def __del__(self):
         """Invoke shutdown()."""
@@ -179,15 +241,90 @@ class GDBFE (GDBMICmd):
             self.arec_list = combine_aggregated_records(self.arec_list + msg.record)
         else:
             self.arec_list = msg.record
+            self.arec_time = time.time()
+        with self.pending_lock:
+            for arec in msg.record:
+                if arec.record_type == RESULT:
+                    self.pending_ranks -= arec.get_ranks()
+
+    def result_filtered_ranks(self):
+        """Return the Interval of ranks whose results filters may drop.
+
+        This is every rank if result records are filtered by type, plus the
+        ranks of each predicate filter that can match result records.
+
+        """
+        all_ranks = self.comm.get_mpiranks()
+        if self.filter_types.intersection(RESULT_TYPES):
+            return all_ranks
+        ranks = Interval([])
+        for spec in self.filter_specs.itervalues():
+            filter_ranks = all_ranks
+            for kind, value in spec:
+                if kind == "stream" or (kind == "type" and
+                                        value.lower() not in RESULT_TYPES):
+                    # Never matches a result record.
+                    break
+                if kind == "ranks":
+                    filter_ranks = filter_ranks.intersect(value)
+            else:
+                ranks += filter_ranks
+        return ranks
+
+    def add_pending_ranks(self, ranks):
+        """Note that a command was sent to ranks, which should return results.
+
+        Ranks whose results may be filtered are not waited on.
+
+        """
+        if gdbconf.mrnet_sync_mode != "timeout":
+            return
+        ranks = ranks - self.result_filtered_ranks()
+        with self.pending_lock:
+            if ranks.empty():
+                return
+            if self.pending_ranks.empty():
+                self.pending_time = time.time()
+            self.pending_ranks += ranks
+
+    def out_window_closed(self):
+        """Return whether the temporary arec_list should be printed.
+
+        Output is held for up to gdbconf.mrnet_sync_timeout milliseconds while
+        results from ranks with pending commands arrive, so that records from
+        stragglers are merged with the rest.
+
+        """
+        if not self.arec_list:
+            return False
+        with self.pending_lock:
+            if self.pending_ranks.empty():
+                return True
+        return (time.time() - self.arec_time) * 1000 >= gdbconf.mrnet_sync_timeout
+
+    def check_pending_ranks(self):
+        """Report ranks that are late returning results, and stop waiting.
+
+        Ranks may never return results, such as when they hang, so once they
+        are reported they are cleared; their output is shown whenever it does
+        arrive. Ranks are only pending in the "timeout" sync mode.
+
+        """
+        with self.pending_lock:
+            if self.pending_ranks.empty():
+                return
+            if (time.time() - self.pending_time) * 1000 < gdbconf.mrnet_sync_timeout:
+                return
+            late = self.pending_ranks
+            self.pending_ranks = Interval([])
+        print "Waiting on ranks {0}; their output will be shown when it arrives.".format(
+            late)
 
     def process_out_messages(self):
         """Go through the temporary arec_list and pretty-print records."""
         for arec in self.arec_list:
             # Add the record to the history.
-            self.output_history = [arec] + self.output_history
-            if len(self.output_history) > gdbconf.history_length:
-                # Remove the last (oldest) element.
-                self.output_history.pop()
+            self.output_history.add(arec)
             record_classes = arec.get_record_classes()
             class_key = max(record_classes,
                             key = lambda x: len(record_classes[x]))
@@ -202,14 +339,166 @@ class GDBFE (GDBMICmd):
         self.arec_list = []
 
     def varprint_res_handler(self, msg):
-        """Handle a varprint result message by pretty-printing the variable objects."""
-        if msg.err:
-            print "[{0}] {1}".format(msg.rank, msg.msg)
-        elif msg.varobj:
-            self.varobjs[msg.rank].add_var_obj(msg.varobj)
-            print self.pprinter.varobj_pretty_print(msg.varobj, tag = msg.rank)[:-1]
-        else:
-            print "[{0}] Received a bad varobj!".format(msg.rank)
+        """Handle a varprint result message.
+
+        Results from the back-ends are collected until every rank has
+        reported, then the aggregated tree is printed once, along with any
+        errors. When printing a range of children, this is done for each
+        page.
+
+        """
+        if msg.varprint_id not in self.varprints:
+            print "Received a result for an unknown varprint."
+            return
+        varprint = self.varprints[msg.varprint_id]
+        if msg.page not in varprint[2]:
+            varprint[2][msg.page] = [[], Interval([])]
+        page = varprint[2][msg.page]
+        page[0].append((msg.varobj, msg.errors))
+        page[1] += msg.ranks
+        if varprint[1].intersect(page[1]) != varprint[1]:
+            # Still waiting on some ranks.
+            return
+        del varprint[2][msg.page]
+        if msg.last:
+            del self.varprints[msg.varprint_id]
+        tree, errors = combine_varprint_results(page[0])
+        for err_msg, ranks in errors.iteritems():
+            if (err_msg, ranks) not in varprint[3]:
+                varprint[3].append((err_msg, ranks))
+                print "[{0}] {1}".format(ranks, err_msg)
+        if tree is not None:
+            self.varprint_trees[varprint[0]] = tree
+            if msg.page is not None:
+                print "[{0}] {1}[{2}:{3}]:".format(tree.ranks, varprint[0],
+                                                   msg.page[0], msg.page[1])
+            for line in tree.pretty_print():
+                print "[{0}] {1}".format(tree.ranks, line)
+
+    def varstat_res_handler(self, msg):
+        """Handle a varstat result message.
+
+        Summaries from the back-ends are collected until every rank has
+        reported, then the merged summary is printed.
+
+        """
+        if msg.varstat_id not in self.varstats:
+            print "Received a result for an unknown varstat."
+            return
+        varstat = self.varstats[msg.varstat_id]
+        varstat[2].append((msg.summary, msg.errors))
+        varstat[3] += msg.ranks
+        if varstat[1].intersect(varstat[3]) != varstat[1]:
+            # Still waiting on some ranks.
+            return
+        del self.varstats[msg.varstat_id]
+        summary, errors = combine_varstat_results(varstat[2])
+        for err_msg, ranks in errors.iteritems():
+            print "[{0}] {1}".format(ranks, err_msg)
+        if summary is not None:
+            for line in summary.pretty_print(varstat[0]):
+                print "[{0}] {1}".format(summary.ranks, line)
+
+    def varcompare_res_handler(self, msg):
+        """Handle a varcompare result message.
+
+        Once every rank has sent the digest of its value, one rank with each
+        distinct digest is asked for its value. Once all of those values have
+        arrived, each is printed with the ranks that have it. Values that do
+        not arrive are reported by check_varcompares.
+
+        """
+        if msg.varcompare_id not in self.varcompares:
+            print "Received a result for an unknown varcompare."
+            return
+        varcompare = self.varcompares[msg.varcompare_id]
+        varcompare[2].append((msg.digests, msg.values, msg.errors))
+        if varcompare[4] is None:
+            varcompare[3] += msg.ranks
+            if varcompare[1].intersect(varcompare[3]) != varcompare[1]:
+                # Still waiting on some ranks.
+                return
+            digests, values, errors = combine_varcompare_results(varcompare[2])
+            for err_msg, ranks in errors.iteritems():
+                print "[{0}] {1}".format(ranks, err_msg)
+            if not digests:
+                del self.varcompares[msg.varcompare_id]
+                return
+            varcompare[2] = [(digests, values, {})]
+            varcompare[4] = dict((digest, ranks.get_smallest())
+                                 for digest, ranks in digests.iteritems())
+            varcompare[5] = time.time()
+            # Only the ranks sending values are asked, so no others must reply.
+            fetch_ranks = Interval(list(set(varcompare[4].itervalues())))
+            self.comm.send(GDBMessage(VARCOMPARE_MSG, expr = varcompare[0],
+                                      ranks = fetch_ranks,
+                                      varcompare_id = msg.varcompare_id,
+                                      fetch = varcompare[4]),
+                           fetch_ranks)
+            return
+        digests, values, _ = combine_varcompare_results(varcompare[2])
+        if len(values) < len(varcompare[4]):
+            # Still waiting on some values.
+            return
+        self.print_varcompare(msg.varcompare_id)
+
+    def print_varcompare(self, varcompare_id):
+        """Print the values of a varcompare and stop waiting on it.
+
+        Ranks with a value that was never received are reported.
+
+        """
+        varcompare = self.varcompares.pop(varcompare_id)
+        digests, values, _ = combine_varcompare_results(varcompare[2])
+        if len(digests) > 1:
+            print "{0}: {1} distinct values".format(varcompare[0], len(digests))
+        for digest, ranks in sorted(digests.iteritems(),
+                                    key = lambda x: x[1].get_smallest()):
+            if digest in values:
+                print "[{0}] {1} = {2}".format(ranks, varcompare[0],
+                                               values[digest])
+            else:
+                print "[{0}] {1}: value not received from rank {2}".format(
+                    ranks, varcompare[0], varcompare[4][digest])
+
+    def check_varcompares(self):
+        """Give up on varcompare values not received in time.
+
+        A rank asked for a value may fail or never reply, so after
+        gdbconf.varcompare_fetch_timeout seconds the values received are
+        printed, and the missing ones reported.
+
+        """
+        expired = time.time() - gdbconf.varcompare_fetch_timeout
+        for varcompare_id, varcompare in self.varcompares.items():
+            if varcompare[5] is not None and varcompare[5] < expired:
+                self.print_varcompare(varcompare_id)
+
+    def stacktree_res_handler(self, msg):
+        """Handle a stacktree result message.
+
+        Trees from the back-ends are collected until every rank has
+        reported, then the merged tree is printed.
+
+        """
+        if msg.stacktree_id not in self.stacktrees:
+            print "Received a result for an unknown stacktree."
+            return
+        stacktree = self.stacktrees[msg.stacktree_id]
+        stacktree[1].append((msg.tree, msg.errors))
+        stacktree[2] += msg.ranks
+        if stacktree[0].intersect(stacktree[2]) != stacktree[0]:
+            # Still waiting on some ranks.
+            return
+        del self.stacktrees[msg.stacktree_id]
+        tree, errors = combine_stacktree_results(stacktree[1])
+        for err_msg, ranks in errors.iteritems():
+            print "[{0}] {1}".format(ranks, err_msg)
+        if tree is not None:
+            if stacktree[3]:
+                print "{0} samples".format(tree.count)
+            for line in tree.pretty_print(counts = stacktree[3]):
+                print line
 
     def load_file_handler(self, msg):
         """Handle a load file message by loading the file and broadcasting it."""
@@ -226,24 +515,106 @@ class GDBFE (GDBMICmd):
             return None
         return split
 
+    def filter_stats_handler(self, msg):
+        """Handle a filter stats message by recording the drop counts."""
+        self.filter_drops[str(msg.ranks)] = msg.counts
+
+    def parse_filter_predicate(self, cmd):
+        """Parse a predicate filter specification into a list of terms.
+
+        The specification is a list of "kind value" pairs; see
+        recordfilter.RecordFilter. Returns None on error.
+
+        """
+        split = cmd.split()
+        if len(split) % 2 != 0:
+            print "Bad filter specification."
+            return None
+        spec = []
+        for kind, value in zip(split[0::2], split[1::2]):
+            if kind not in FILTER_KINDS:
+                print "Unknown filter term {0}.".format(kind)
+                return None
+            if kind == "ranks":
+                value = self.parse_proc_spec(value)
+                if not value:
+                    return None
+                if value == -1:
+                    value = self.comm.get_mpiranks()
+            elif kind == "stream":
+                try:
+                    re.compile(value)
+                except re.error as e:
+                    print "Bad stream regex: {0}".format(e)
+                    return None
+            spec.append((kind, value))
+        return spec
+
+    def print_filters(self):
+        """Print the predicate filters and how many records each dropped."""
+        if not self.record_filters:
+            print "No filters."
+            return
+        for filter_id in sorted(self.record_filters):
+            dropped = sum(counts.get(filter_id, 0)
+                          for counts in self.filter_drops.itervalues())
+            print "{0}: {1} ({2} dropped)".format(
+                filter_id, self.record_filters[filter_id], dropped)
+
     def do_filter(self, cmd, targets = None):
         """Tell the back-end daemons to filter something.
 
-        The input is a list of record types and subtypes. A record containing
-        any of these will be filtered.
+        The input is either a list of record types and subtypes, in which case
+        a record containing any of these will be filtered, or a predicate of
+        the form "kind value ...", where kind is one of ranks, thread, stream,
+        func, bkpt, or type. A record matching every term of a predicate is
+        filtered. With no input, list the predicate filters.
 
         """
+        split = cmd.split()
+        if not split:
+            self.print_filters()
+            return
+        if split[0] in FILTER_KINDS:
+            spec = self.parse_filter_predicate(cmd)
+            if not spec:
+                return
+            filter_id = self.next_filter_id
+            self.next_filter_id += 1
+            self.record_filters[filter_id] = cmd.strip()
+            self.filter_specs[filter_id] = spec
+            print "Added filter {0}.".format(filter_id)
+            self.comm.send(GDBMessage(FILTER_MSG, filter_id = filter_id,
+                                      spec = spec),
+                           self.comm.broadcast)
+            return
         record_types = set(self.parse_filter_spec(cmd))
         if not record_types:
             return
+        self.filter_types.update(record_types)
         self.comm.send(GDBMessage(FILTER_MSG, filter_types = record_types),
                        self.comm.broadcast)
 
     def do_unfilter(self, cmd, targets = None):
-        """Tell the back-end daemons to unfilter something."""
+        """Tell the back-end daemons to unfilter something.
+
+        The input is either a list of record types, or a predicate filter ID.
+
+        """
+        if cmd.strip().isdigit():
+            filter_id = int(cmd)
+            if filter_id not in self.record_filters:
+                print "No such filter {0}.".format(filter_id)
+                return
+            del self.record_filters[filter_id]
+            del self.filter_specs[filter_id]
+            self.comm.send(GDBMessage(UNFILTER_MSG, filter_id = filter_id),
+                           self.comm.broadcast)
+            return
         record_types = set(self.parse_filter_spec(cmd))
         if not record_types:
             return
+        self.filter_types.difference_update(record_types)
         self.comm.send(GDBMessage(UNFILTER_MSG, filter_types = record_types),
                        self.comm.broadcast)
 
@@ -286,6 +657,8 @@ class GDBFE (GDBMICmd):
             return
         cmd = self.resolve_gdbmi_command(line, err = False)
         if cmd:
+            # Blocked ranks' output is dropped, so do not wait on them.
+            self.add_pending_ranks(targets - self.blocks)
             self.comm.send(GDBMessage(CMD_MSG, command = cmd, ranks = targets), targets)
         else:
             split = line.split()
@@ -296,37 +669,146 @@ class GDBFE (GDBMICmd):
                 func(rest, targets = targets)
 
     def do_block(self, cmd, targets = None):
-        """Block all output from a subset of nodes."""
+        """Block all output from a subset of nodes.
+
+        The back-ends drop output from blocked nodes, so it is never sent.
+
+        """
         to_block = self.parse_proc_spec(cmd)
         if not to_block:
             return
-        # This is quite inefficient and will not scale.
-        for target in to_block.members():
-            if target not in self.blocks and target in self.comm.get_mpiranks():
-                self.blocks.append(target)
+        if to_block == -1:
+            to_block = self.comm.get_mpiranks()
+        to_block = to_block.intersect(self.comm.get_mpiranks())
+        self.blocks += to_block
+        self.comm.send(GDBMessage(BLOCK_MSG, ranks = to_block),
+                       self.comm.broadcast)
 
     def do_unblock(self, cmd, targets = None):
         """Unblock output from a subset of nodes."""
         to_unblock = self.parse_proc_spec(cmd)
         if not to_unblock:
             return
-        keys = []
-        for k, v in enumerate(self.blocks):
-            if v in to_unblock:
-                keys.append(k)
-        for k in keys:
-            del self.blocks[k]
+        if to_unblock == -1:
+            to_unblock = self.comm.get_mpiranks()
+        self.blocks -= to_unblock
+        self.comm.send(GDBMessage(UNBLOCK_MSG, ranks = to_unblock),
+                       self.comm.broadcast)
 
     def do_varprint(self, cmd, targets = None):
         """Run the varprint command."""
         if not targets:
             targets = self.comm.get_mpiranks()
-        cmd_split = cmd.split(" ")
-        var = cmd
+        var = cmd.strip()
         # Strip quotes, if present.
         if var[0] == '"' and var[-1] == '"':
             var = var[1:-1]
-        self.comm.send(GDBMessage(VARPRINT_MSG, name = var, ranks = targets), targets)
+        # A trailing [from:to] selects a range of children.
+        child_range = None
+        match = re.match(r"^(.+)\[([0-9]+):([0-9]+)\]$", var)
+        if match:
+            var = match.group(1)
+            child_range = (int(match.group(2)), int(match.group(3)))
+            if child_range[0] >= child_range[1]:
+                print "Bad range of children."
+                return
+        varprint_id = self.next_varprint_id
+        self.next_varprint_id += 1
+        self.varprints[varprint_id] = [var, targets, {}, []]
+        self.comm.send(GDBMessage(VARPRINT_MSG, name = var, ranks = targets,
+                                  varprint_id = varprint_id,
+                                  child_range = child_range), targets)
+
+    def do_varstat(self, cmd, targets = None):
+        """Run the varstat command.
+
+        This summarizes a numeric array: varstat array [count]. The count is
+        needed when the array is a pointer.
+
+        """
+        if not targets:
+            targets = self.comm.get_mpiranks()
+        split = cmd.split()
+        if not split:
+            print "varstat format is: varstat array [count]"
+            return
+        count = None
+        if len(split) > 1 and split[-1].isdigit():
+            count = int(split[-1])
+            split = split[:-1]
+        expr = " ".join(split)
+        varstat_id = self.next_varstat_id
+        self.next_varstat_id += 1
+        self.varstats[varstat_id] = [expr, targets, [], Interval([])]
+        self.comm.send(GDBMessage(VARSTAT_MSG, expr = expr, count = count,
+                                  ranks = targets, varstat_id = varstat_id),
+                       targets)
+
+    def do_varcompare(self, cmd, targets = None):
+        """Run the varcompare command.
+
+        This finds which ranks have equal values of an expression, and prints
+        each distinct value once: varcompare expr.
+
+        """
+        if not targets:
+            targets = self.comm.get_mpiranks()
+        expr = cmd.strip()
+        if not expr:
+            print "varcompare format is: varcompare expr"
+            return
+        varcompare_id = self.next_varcompare_id
+        self.next_varcompare_id += 1
+        self.varcompares[varcompare_id] = [expr, targets, [], Interval([]), None,
+                                           None]
+        self.comm.send(GDBMessage(VARCOMPARE_MSG, expr = expr, ranks = targets,
+                                  varcompare_id = varcompare_id, fetch = None),
+                       targets)
+
+    def do_stacktree(self, cmd, targets = None):
+        """Run the stacktree command.
+
+        This prints the stacks of every rank merged into a tree of call
+        paths: stacktree [lines]. With lines, frames are distinguished by
+        source line as well as function.
+
+        """
+        if not targets:
+            targets = self.comm.get_mpiranks()
+        arg = cmd.strip()
+        if arg not in ("", "lines"):
+            print "stacktree format is: stacktree [lines]"
+            return
+        stacktree_id = self.next_stacktree_id
+        self.next_stacktree_id += 1
+        self.stacktrees[stacktree_id] = [targets, [], Interval([]), False]
+        self.comm.send(GDBMessage(STACKTREE_MSG, ranks = targets,
+                                  lines = arg == "lines",
+                                  stacktree_id = stacktree_id), targets)
+
+    def do_sample(self, cmd, targets = None):
+        """Run the sample command.
+
+        This samples the stacks of the running processes periodically, and
+        prints how often each call path was seen: sample hz seconds.
+
+        """
+        if not targets:
+            targets = self.comm.get_mpiranks()
+        try:
+            hz, duration = [float(arg) for arg in cmd.split()]
+        except ValueError:
+            print "sample format is: sample hz seconds"
+            return
+        if hz <= 0 or duration <= 0:
+            print "The rate and duration must be positive."
+            return
+        stacktree_id = self.next_stacktree_id
+        self.next_stacktree_id += 1
+        self.stacktrees[stacktree_id] = [targets, [], Interval([]), True]
+        self.comm.send(GDBMessage(SAMPLE_MSG, ranks = targets, hz = hz,
+                                  duration = duration,
+                                  stacktree_id = stacktree_id), targets)
 
     def do_varassign(self, cmd, targets = None):
         """Run the varassign command."""
@@ -340,16 +822,31 @@ class GDBFE (GDBMICmd):
         if var[0] == '"' and var[-1] == '"':
             var = var[1:-1]
         val = split[1].strip()
-        for rank in targets.members():
-            full_name = self.varobjs[rank].get_full_name(var)
-            if not full_name:
-                print "Variable not found on rank {0}.".format(rank)
+        # Group ranks by the full name of the variable, which is almost always
+        # the same everywhere, and send one command per group. The full names
+        # come from the printed tree of the variable or its closest ancestor.
+        groups = {}
+        path = var.split(".")
+        for i in range(len(path), 0, -1):
+            tree = self.varprint_trees.get(".".join(path[:i]))
+            if tree is not None:
+                groups = tree.get_full_names(path[i:])
+                break
+        found = Interval([])
+        for ranks in groups.itervalues():
+            found += ranks
+        not_found = targets - found
+        if not not_found.empty():
+            print "Variable not found on ranks {0}.".format(not_found)
+        for full_name, ranks in groups.iteritems():
+            ranks = ranks.intersect(targets)
+            if ranks.empty():
                 continue
             self.comm.send(GDBMessage(CMD_MSG,
                                       command = Command("var-assign",
                                                         args = ('"' + full_name + '"', '"' + val + '"')),
-                                      ranks = rank),
-                           rank)
+                                      ranks = ranks),
+                           ranks)
 
     def do_help(self, cmd, targets = None):
         """Run the help command."""
@@ -381,13 +878,13 @@ class GDBFE (GDBMICmd):
         """
         if not targets:
             targets = self.comm.get_mpiranks()
-        split = cmd.split(" ")
+        split = cmd.split()
         history_item = 0
-        if len(split) > 1:
-            if not split[1].isdigit():
+        if split:
+            if not split[0].isdigit():
                 print "Incorrect history specificiation."
                 return
-            history_item = int(split[1])
+            history_item = int(split[0])
         if history_item >= len(self.output_history):
             print "No such history item {0}".format(history_item)
             return
@@ -397,10 +894,52 @@ class GDBFE (GDBMICmd):
         for vid in ids:
             self.pprinter.pretty_print(arec.get_record(vid), Interval(vid))
 
+    def do_history(self, cmd, targets = None):
+        """Query the output history.
+
+        Use: [proc <processor-spec>] history search <query>
+        The query is a list of terms of the form "type <type>", "func <name>",
+        "file <name>", or "ranks <processor-spec>", all of which must match.
+        Names may be shell-style globs. For example:
+        history search type stopped func MPI_Wait ranks 1000-2000
+
+        """
+        split = cmd.split()
+        if not split or split[0] != "search" or len(split) % 2 != 1:
+            print "history format is: history search [type|func|file|ranks value] ..."
+            return
+        query = []
+        ranks = targets
+        for kind, value in zip(split[1::2], split[2::2]):
+            if kind == "ranks":
+                spec_ranks = self.parse_proc_spec(value)
+                if not spec_ranks:
+                    return
+                if spec_ranks == -1:
+                    continue
+                if ranks:
+                    ranks = ranks.intersect(spec_ranks)
+                else:
+                    ranks = spec_ranks
+            elif kind in ("type", "func", "file"):
+                query.append((kind, value))
+            else:
+                print "Unknown history search term {0}.".format(kind)
+                return
+        results = self.output_history.search(query, ranks)
+        if not results:
+            print "No matching history items."
+            return
+        for item, record_type, subtypes, matched in results:
+            print "{0}: {1} {2} on {3}".format(item, record_type.lower(),
+                                               ",".join(sorted(str(s) for s in subtypes)),
+                                               matched)
+
     def dispatch_gdbmi_command(self, command):
         """Send a GDB command to every rank (use proc to send to subsets)."""
         if self.comm.is_shutdown():
             return False
+        self.add_pending_ranks(self.comm.get_mpiranks() - self.blocks)
         return self.comm.send(GDBMessage(CMD_MSG, command = command),
                               self.comm.broadcast)
 
@@ -438,7 +977,10 @@ class GDBFE (GDBMICmd):
 
             # Keep from beating up the CPU too much.
             if not recvd:
-                self.process_out_messages()
+                if self.out_window_closed():
+                    self.process_out_messages()
+                self.check_pending_ranks()
+                self.check_varcompares()
                 time.sleep(self.sleep_time)
         self.shutdown()
         print "Remote shut down."
@@ -0,0 +1,233 @@
+"""Front-end output history.
+
+This keeps the most recent aggregated records in memory, and spills older
+ones to a compressed, append-only file so that they can still be expanded.
+Every item is indexed as it is added, so the history can be searched without
+reading it back.
+
+"""
+
+import os, zlib, cPickle, fnmatch, threading
+from collections import deque
+from mi.gdbmi_records import GDBMIFrame
+
+class HistoryIndex:
+    """Inverted index over history items.
+
+    Items are identified by sequence number, in the order they were added.
+    For each kind of term ("type", "func", and "file"), this maps each term
+    to the items it appears in, and for each item the Interval of ranks it
+    appears for. Types are the record type and subtypes, functions and files
+    come from frames and from "func", "file", and "fullname" fields.
+
+    """
+
+    kinds = ("type", "func", "file")
+
+    def __init__(self):
+        """Initialize the index."""
+        # Maps kinds to terms to sequence numbers to Intervals.
+        self.terms = dict((kind, {}) for kind in self.kinds)
+        # Maps sequence numbers to (record type, subtypes, ranks).
+        self.items = {}
+
+    def _add_term(self, kind, term, seq, ranks):
+        """Note that term appears in item seq for ranks."""
+        if term is None:
+            return
+        items = self.terms[kind].setdefault(term, {})
+        if seq in items:
+            items[seq] = items[seq] + ranks
+        else:
+            items[seq] = ranks
+
+    def _add_value(self, value, key, seq, ranks):
+        """Add the terms from one value of a substitution."""
+        if isinstance(value, GDBMIFrame):
+            self._add_term("func", value.func, seq, ranks)
+            self._add_term("file", value.source_file, seq, ranks)
+            self._add_term("file", value.fullname, seq, ranks)
+        elif key == "func":
+            self._add_term("func", value, seq, ranks)
+        elif key in ("file", "fullname"):
+            self._add_term("file", value, seq, ranks)
+
+    def _add_data(self, data, key, seq):
+        """Add the terms from an aggregated record's field data."""
+        if isinstance(data, list):
+            for d in data:
+                self._add_data(d, key, seq)
+        elif isinstance(data, dict):
+            for k, d in data.iteritems():
+                self._add_data(d, k, seq)
+        else:
+            for value, ranks in data.groups():
+                self._add_value(value, key, seq, ranks)
+
+    def add(self, seq, arec):
+        """Index aggregated record arec as item seq."""
+        ranks = arec.get_ranks()
+        self.items[seq] = (arec.record_type, arec.record_subtypes, ranks)
+        self._add_term("type", arec.record_type.lower(), seq, ranks)
+        for subtype in arec.record_subtypes:
+            # Stack results have the stack depth as an integer subtype.
+            self._add_term("type", str(subtype).lower(), seq, ranks)
+        for field in arec.fields:
+            self._add_data(getattr(arec, field), field, seq)
+
+    def remove(self, seq):
+        """Remove item seq from the index."""
+        del self.items[seq]
+        for terms in self.terms.itervalues():
+            for term in terms.keys():
+                if terms[term].pop(seq, None) is not None and not terms[term]:
+                    del terms[term]
+
+    def _match(self, kind, pattern):
+        """Return a map from items to ranks for terms matching pattern.
+
+        pattern may be a shell-style glob.
+
+        """
+        terms = self.terms[kind]
+        if pattern in terms:
+            return terms[pattern]
+        matches = {}
+        for term in fnmatch.filter(terms.keys(), pattern):
+            for seq, ranks in terms[term].iteritems():
+                if seq in matches:
+                    matches[seq] = matches[seq] + ranks
+                else:
+                    matches[seq] = ranks
+        return matches
+
+    def search(self, query, ranks=None):
+        """Find the items matching a query.
+
+        query is a list of (kind, pattern) tuples, all of which must match.
+        ranks is an optional Interval to restrict the ranks matched.
+        Returns a map from item sequence numbers to the Interval of ranks for
+        which every term matched.
+
+        """
+        results = None
+        for kind, pattern in query:
+            matches = self._match(kind, pattern)
+            if results is None:
+                results = dict(matches)
+            else:
+                for seq in results.keys():
+                    if seq in matches:
+                        results[seq] = results[seq].intersect(matches[seq])
+                    else:
+                        del results[seq]
+        if results is None:
+            results = dict((seq, item[2])
+                           for seq, item in self.items.iteritems())
+        if ranks is not None:
+            for seq in results.keys():
+                results[seq] = results[seq].intersect(ranks)
+        for seq in results.keys():
+            if results[seq].empty():
+                del results[seq]
+        return results
+
+class OutputHistory:
+    """History of aggregated records.
+
+    Items are numbered from newest to oldest, so item 0 is the most recent
+    record. The newest hot_length items are kept in memory. Older items are
+    appended to spill_path, each compressed separately, and an index of
+    (offset, length) pairs is kept so any of them can be read back directly.
+    If spill_path is None, older items are discarded.
+
+    Items are added from the thread receiving output and read from the
+    command loop, so every access holds a lock; this keeps reads and appends
+    to the shared spill file from interleaving.
+
+    """
+
+    def __init__(self, hot_length, spill_path=None):
+        """Initialize the history."""
+        self.hot_length = hot_length
+        self.hot = deque()
+        self.spill_path = spill_path
+        self.spill_file = None
+        # Offsets and lengths of spilled items, oldest first.
+        self.spill_index = []
+        # Number of items discarded when not spilling.
+        self.dropped = 0
+        self.index = HistoryIndex()
+        # Number of items ever added, used as sequence numbers.
+        self.added = 0
+        self.lock = threading.RLock()
+
+    def _spill(self, item):
+        """Append item to the spill file."""
+        if self.spill_file is None:
+            self.spill_file = open(self.spill_path, "w+b")
+        data = zlib.compress(cPickle.dumps(item, cPickle.HIGHEST_PROTOCOL), 1)
+        self.spill_file.seek(0, os.SEEK_END)
+        self.spill_index.append((self.spill_file.tell(), len(data)))
+        self.spill_file.write(data)
+
+    def _load(self, spill_idx):
+        """Read the spilled item at spill_idx from the spill file."""
+        offset, length = self.spill_index[spill_idx]
+        self.spill_file.flush()
+        self.spill_file.seek(offset)
+        return cPickle.loads(zlib.decompress(self.spill_file.read(length)))
+
+    def add(self, item):
+        """Add item as the newest history item."""
+        with self.lock:
+            self.hot.appendleft(item)
+            self.index.add(self.added, item)
+            self.added += 1
+            if len(self.hot) > self.hot_length:
+                oldest = self.hot.pop()
+                if self.spill_path:
+                    self._spill(oldest)
+                else:
+                    self.index.remove(self.dropped)
+                    self.dropped += 1
+
+    def search(self, query, ranks=None):
+        """Search the history; see HistoryIndex.search.
+
+        Returns a list of (history item, record type, subtypes, ranks) tuples,
+        newest first.
+
+        """
+        results = []
+        with self.lock:
+            for seq, matched in self.index.search(query, ranks).iteritems():
+                record_type, subtypes = self.index.items[seq][0:2]
+                results.append((self.added - 1 - seq, record_type, subtypes,
+                                matched))
+        results.sort()
+        return results
+
+    def close(self):
+        """Close and remove the spill file, if any."""
+        with self.lock:
+            if self.spill_file is not None:
+                self.spill_file.close()
+                self.spill_file = None
+                os.remove(self.spill_path)
+            self.spill_index = []
+
+    def __len__(self):
+        """Return the number of items available."""
+        with self.lock:
+            return len(self.hot) + len(self.spill_index)
+
+    def __getitem__(self, i):
+        """Return history item i, where 0 is the newest."""
+        with self.lock:
+            if i < 0 or i >= len(self):
+                raise IndexError(i)
+            if i < len(self.hot):
+                return self.hot[i]
+            # Spilled items are stored oldest first.
+            return self._load(len(self) - 1 - i)
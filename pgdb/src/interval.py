@@ -18,7 +18,7 @@ class Interval(object):
         src - the data to construct the interval from. One of the following:
          - a single integer
          - an Interval
-         - a list of disjoint intervals as tuples
+         - a list of intervals as tuples (overlapping intervals are merged)
          - a list of integers
         These should all be non-negative.
         is_sorted - whether the aforementioned lists are already sorted or not.
@@ -51,10 +51,10 @@ class Interval(object):
             cur_min = src[0]
             cur_max = src[0]
             for i in src[1:]:
-                if i == cur_max + 1:
-                    # We have another contiguous integer.
+                if i <= cur_max + 1:
+                    # We have another contiguous (or repeated) integer.
                     # Add it to the current interval.
-                    cur_max += 1
+                    cur_max = max(cur_max, i)
                 else:
                     # Not contiguous, store the present interval and start anew.
                     self.intervals.append((cur_min, cur_max))
@@ -66,9 +66,9 @@ class Interval(object):
             # Interval compression for existing intervals.
             cur = src[0]
             for interval in src[1:]:
-                if interval[0] == cur[1] + 1:
-                    # The intervals are contiguous.
-                    cur = (cur[0], interval[1])
+                if interval[0] <= cur[1] + 1:
+                    # The intervals are contiguous or overlap.
+                    cur = (cur[0], max(cur[1], interval[1]))
                 else:
                     # Not contiguous, store cur.
                     self.intervals.append(cur)
@@ -218,9 +218,9 @@ class Interval(object):
 
         """
         if not len(other):
-            return self.intervals
+            return self
         if not len(self):
-            return Interval([], is_sorted=True)
+            return other
         i = 1
         k = 0
         new = []
@@ -322,7 +322,7 @@ class Interval(object):
                 else:
                     # No intersection, advance to next in other and possibly
                     # add what's left of the current interval and advance.
-                    if interval[1] < other[k][0]:
+                    if interval[1] < other.intervals[k][0]:
                         # Other is to the right of interval, add what's left
                         # and advance interval.
                         new.append(interval)
@@ -379,7 +379,7 @@ class Interval(object):
         """Return true if two intervals are precisely the same."""
         if not isinstance(other, Interval):
             return NotImplemented
-        return all([x == y for x, y in zip(self.intervals, other.intervals)])
+        return self.intervals == other.intervals
 
     def __ne__(self, other):
         """Return the negation of what __eq__ returns."""
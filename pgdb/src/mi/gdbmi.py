@@ -9,8 +9,12 @@ from gdbmi_parser import GDBMIParser
 class GDBMachineInterface:
     """Manages the GDB Machine Interface."""
 
-    def __init__(self, gdb="gdb", gdb_args=None, env=None):
-        """Initialize a new machine interface session with GDB."""
+    def __init__(self, gdb="gdb", gdb_args=None, env=None, keep_results=None):
+        """Initialize a new machine interface session with GDB.
+
+        keep_results is passed to the parser; see GDBMIParser.
+
+        """
         gdb_args = gdb_args or []
         env = env or {}
         env.update(os.environ)
@@ -26,7 +30,8 @@ class GDBMachineInterface:
         fcntl.fcntl(self.process.stdout, fcntl.F_SETFL, flags | os.O_NONBLOCK)
 
         self.buffer = "" # Buffer for output from GDB.
-        self.parser = GDBMIParser() # Parser for output from GDB.
+        # Parser for output from GDB.
+        self.parser = GDBMIParser(keep_results)
 
     def _read(self, timeout=0):
         """A generator to read data from GDB's stdout."""
@@ -59,6 +64,15 @@ class GDBMachineInterface:
         """
         return self._write(command.generate_mi_command())
 
+    def send_batch(self, commands):
+        """Send several commands to GDB with a single write.
+
+        commands is a list of MI command strings, as generated by
+        Command.generate_mi_command.
+
+        """
+        return self._write("\n".join(commands))
+
     def read(self, timeout=0):
         """Generator to read, parse, and return data from GDB."""
         for data in self._read(timeout):
@@ -29,13 +29,23 @@ class GDBMIParser:
                    "@": STREAM_TARGET,
                    "&": STREAM_LOG}
 
-    def __init__(self):
-        """Set up the parser."""
+    def __init__(self, keep_results=None):
+        """Set up the parser.
+
+        keep_results is an optional function of a token that returns whether
+        to keep the raw results of that command's result record, for handlers
+        of output that is not parsed into fields.
+
+        """
+        self.keep_results = keep_results
         self.output_re = re.compile(r"([0-9]*)(" + "|".join(
             ["\\" + item for item in self._all_record_symbols]) + ")(.*)")
         self.result_re = re.compile(r"(" + "|".join(
             self._result_class.keys()) + ")(.*)")
         self.async_re = re.compile(r"([a-zA-Z0-9_\-]*)(\,.*)?")
+        # Matches a whole string, or one of the characters that delimit
+        # values.
+        self._token_re = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{},=]')
         self._value_parsers = {'{': self.parse_tuple,
                                '[': self.parse_list,
                                '"': self.parse_const}
@@ -77,10 +87,13 @@ class GDBMIParser:
         result_class, results = parts.groups()
         if not result_class:
             raise ValueError(src)
+        keep_results = (token is not None and self.keep_results is not None and
+                        self.keep_results(token))
         return GDBMIResultRecord.create_record(
             token,
             self._result_class[result_class],
-            self.parse_result_list(results[1:]))
+            self.parse_result_list(results[1:]),
+            keep_results)
 
     def parse_oob_record(self, token, symbol, src):
         """Parse an out-of-band record, either an async or a stream record."""
@@ -147,34 +160,40 @@ class GDBMIParser:
         if src == "[]":
             return []
         src = src[1:-1]
+        entries, has_results = self._split_entries(src)
+        if has_results:
+            # We have a list of results, so use that logic instead.
+            return self.parse_result_list(src)
+        return [self.parse_value(entry) for entry in entries if entry]
+
+    def _split_entries(self, src):
+        """Split a list of values or results at its top-level commas.
+
+        Returns a list of the entries, and whether there is a top-level "="
+        (meaning the entries are results). Strings are skipped whole with a
+        regular expression, so long strings cost little.
+
+        """
+        entries = []
         brackets = 0
-        in_quote = False
-        end = 0
         start = 0
-        prev_char = ""
-        results = []
-        # The structure of this is similar to parse_result_list.
-        # But we may have a list of values instead, so we need to identify that.
-        for char in src:
-            if (char == "{" or char == "[") and not in_quote:
+        has_results = False
+        for match in self._token_re.finditer(src):
+            char = match.group()[0]
+            if char == '"':
+                continue
+            if char == "{" or char == "[":
                 brackets += 1
-            elif (char == "}" or char == "]") and not in_quote:
+            elif char == "}" or char == "]":
                 brackets -= 1
-            elif char == '"' and prev_char != "\\":
-                in_quote = not in_quote
-            elif char == "=" and brackets == 0 and not in_quote:
-                # We have a list of results, so use that logic instead.
-                return self.parse_result_list(src)
-            elif char == "," and brackets == 0 and not in_quote:
-                # Found end of entry.
-                results.append(self.parse_value(src[start:end]))
-                start = end + 1
-            end += 1
-            prev_char = char
-        # Parse the last value, if needed.
-        if src[start:end]:
-            results.append(self.parse_value(src[start:end]))
-        return results
+            elif brackets == 0:
+                if char == ",":
+                    entries.append(src[start:match.start()])
+                    start = match.end()
+                else:
+                    has_results = True
+        entries.append(src[start:])
+        return entries, has_results
 
     def parse_const(self, src):
         """Parse a constant and return its value."""
@@ -183,57 +202,22 @@ class GDBMIParser:
 
     def parse_result_list(self, src):
         """Parse a result list into a dict of results."""
-        length = 0
-        brackets = 0
-        in_quote = False
         results = {}
         variable_counts = {}
-        variable = None
-        right = ""
-        prev_char = ""
-        while True:
-            (variable, sep, right) = src.partition("=")
-            if not sep:
-                break
-            # Seek forward until we find the end of the value.
-            # Account for nested lists and tuples.
-            for char in right:
-                if (char == "{" or char == "[") and not in_quote:
-                    brackets += 1
-                elif (char == "}" or char == "]") and not in_quote:
-                    brackets -= 1
-                elif char == '"' and prev_char != "\\":
-                    # Ignore the \" escape sequence.
-                    in_quote = not in_quote
-                elif char == "," and brackets == 0 and not in_quote:
-                    # Found the end of the value.
-                    value = self.parse_value(right[:length])
-                    # Add it to the results dict.
-                    if variable in variable_counts:
-                        if variable_counts[variable] == 1:
-                            # Convert entry to list.
-                            results[variable] = [results[variable], value]
-                        else:
-                            results[variable].append(value)
-                        variable_counts[variable] += 1
-                    else:
-                        results[variable] = value
-                        variable_counts[variable] = 1
-                    src = right[length + 1:]
-                    length = 0
-                    break
-                length += 1
-                prev_char = char
-            if length >= len(right):
-                break
-        # Parse last entry.
-        if variable and right:
+        for entry in self._split_entries(src)[0]:
+            variable, sep, right = entry.partition("=")
+            if not sep or not right:
+                continue
             value = self.parse_value(right)
+            # Add it to the results dict.
             if variable in variable_counts:
                 if variable_counts[variable] == 1:
+                    # Convert entry to list.
                     results[variable] = [results[variable], value]
                 else:
                     results[variable].append(value)
+                variable_counts[variable] += 1
             else:
                 results[variable] = value
+                variable_counts[variable] = 1
         return results
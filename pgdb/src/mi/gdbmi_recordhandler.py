@@ -1,5 +1,7 @@
 """A simple interface for invoking callbacks based on records."""
 
+from mi.gdbmi_records import RESULT
+
 class GDBMIRecordHandler:
     """Invoke callbacks based on record identifications.
 
@@ -20,6 +22,7 @@ class GDBMIRecordHandler:
         func is the function to invoke.
         token is the token to invoke this handler on.
         data is passed to func in the keyword argument data.
+        The handler is removed once the result record for token is handled.
 
         Returns a handler ID.
 
@@ -58,27 +61,30 @@ class GDBMIRecordHandler:
         hid is the handler ID returned by add_{token,type}_handler.
 
         """
-        key = None
-        for k in self.token_handlers:
-            if self.token_handlers[k][0] == hid:
-                key = k
-                break
-        if key is not None:
-            del self.token_handlers[k]
-        for k in self.type_handlers:
-            if self.type_handlers[k][0] == hid:
-                key = k
-                break
-        if key is not None:
-            del self.type_handlers[k]
+        for handlers in (self.token_handlers, self.type_handlers):
+            for k in handlers.keys():
+                handlers[k] = [h for h in handlers[k] if h[0] != hid]
+                if not handlers[k]:
+                    del handlers[k]
+
+    def has_token_handler(self, token):
+        """Return whether there are handlers for token."""
+        return token in self.token_handlers
 
     def handle(self, record, **kwargs):
         """Handle a record, passing any keyword arguments to the handlers."""
         ret = []
         if record.token in self.token_handlers:
-            tup = self.token_handlers[record.token]
-            kwargs["data"] = tup[2]
-            ret.append(tup[1](record, **kwargs))
+            handlers = self.token_handlers[record.token]
+            if record.record_type == RESULT:
+                # A command has only one result, so its handlers are done.
+                del self.token_handlers[record.token]
+            for handler in handlers:
+                kwargs["data"] = handler[2]
+                ret.append(handler[1](record, **kwargs))
+            if hasattr(record, "results"):
+                # The raw results are kept only for the token handlers.
+                del record.results
         types = record.record_subtypes.union([record.record_type])
         for k in self.type_handlers:
             if k.issubset(types):
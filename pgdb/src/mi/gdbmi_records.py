@@ -105,6 +105,89 @@ def _make_list(item):
         return item
     return [item]
 
+# Canonical field-name tuples and subtype sets, shared by all records.
+_interned_fields = {}
+_interned_subtypes = {}
+
+def _intern_fields(fields):
+    """Return the shared tuple of field names equal to fields."""
+    fields = tuple(fields)
+    return _interned_fields.setdefault(fields, fields)
+
+def _intern_subtypes(subtypes):
+    """Return the shared frozenset of record subtypes equal to subtypes."""
+    subtypes = frozenset(subtypes)
+    return _interned_subtypes.setdefault(subtypes, subtypes)
+
+def _intern_str(s):
+    """Intern s if it is a string, so repeated values share memory."""
+    if type(s) is str:
+        return intern(s)
+    return s
+
+class _CompactObject(object):
+    """Base for fixed-shape objects stored in records.
+
+    Subclasses list their attributes in __slots__. Pickled state is a bitmask
+    of the attributes that are not None plus a tuple of their values, so the
+    many attributes that are usually None cost nothing.
+
+    These objects are not modified after construction, so their hash is
+    computed once from _key() and cached.
+
+    """
+    __slots__ = ("_hash",)
+
+    def _key(self):
+        """Return a key defining the object. Should be over-ridden."""
+        raise NotImplementedError
+
+    def __eq__(self, other):
+        """Equality check, comparing cached hashes first."""
+        if self is other:
+            return True
+        if not isinstance(other, _CompactObject):
+            return NotImplemented
+        if hash(self) != hash(other):
+            return False
+        return self._key() == other._key()
+
+    def __ne__(self, other):
+        """Inequality check."""
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
+    def __hash__(self):
+        """Return the cached hash."""
+        try:
+            return self._hash
+        except AttributeError:
+            self._hash = hash(self._key())
+            return self._hash
+
+    def __getstate__(self):
+        """Return the compact state, eliding None attributes."""
+        mask = 0
+        values = []
+        for i, attr in enumerate(self.__slots__):
+            val = getattr(self, attr)
+            if val is not None:
+                mask |= 1 << i
+                values.append(val)
+        return (mask, tuple(values))
+
+    def __setstate__(self, state):
+        """Restore from the state returned by __getstate__."""
+        mask, values = state
+        values = iter(values)
+        for i, attr in enumerate(self.__slots__):
+            if mask & (1 << i):
+                setattr(self, attr, next(values))
+            else:
+                setattr(self, attr, None)
+
 class GDBMIRecord(object):
     """The top-level GDB record class."""
 
@@ -115,13 +198,61 @@ class GDBMIRecord(object):
         self.token = None
         self.fields = []
 
+    def __getstate__(self):
+        """Return a compact state holding only the fields of the record."""
+        return (self.record_type, self.record_subtypes, self.token,
+                self.fields, tuple(getattr(self, f) for f in self.fields))
+
+    def __setstate__(self, state):
+        """Restore from the state returned by __getstate__."""
+        (self.record_type, subtypes, self.token, fields, values) = state
+        self.record_subtypes = _intern_subtypes(subtypes)
+        self.fields = _intern_fields(fields)
+        for field, val in zip(self.fields, values):
+            setattr(self, field, val)
+
+    def _finalize(self):
+        """Share the field names and subtypes with other records.
+
+        Called once a record has been fully constructed.
+
+        """
+        self.fields = _intern_fields(self.fields)
+        self.record_subtypes = _intern_subtypes(self.record_subtypes)
+        return self
+
     def pretty_print(self):
         """Default pretty printer for records."""
         return [str(self)]
 
+    def __setattr__(self, name, value):
+        """Set an attribute, invalidating the cached key."""
+        d = self.__dict__
+        if "_cached_key" in d:
+            del d["_cached_key"]
+            del d["_cached_hash"]
+        d[name] = value
+
+    def invalidate_key(self):
+        """Drop the cached key.
+
+        Setting an attribute does this automatically; this is only needed
+        after modifying a field value in place.
+
+        """
+        self.__dict__.pop("_cached_key", None)
+        self.__dict__.pop("_cached_hash", None)
+
     def __key(self):
-        """Return a key defining the record."""
-        l = [self.record_type] + list(self.record_subtypes) + [self.token]
+        """Return a key defining the record.
+
+        The key is computed once and cached until the record is modified.
+
+        """
+        d = self.__dict__
+        if "_cached_key" in d:
+            return d["_cached_key"]
+        l = [self.record_type, frozenset(self.record_subtypes), self.token]
         for field in self.fields:
             val = getattr(self, field)
             if isinstance(val, list):
@@ -129,15 +260,34 @@ class GDBMIRecord(object):
             elif isinstance(val, dict):
                 val = tuple(val.items())
             l.append(val)
-        return tuple(l)
+        key = tuple(l)
+        d["_cached_key"] = key
+        d["_cached_hash"] = hash(key)
+        return key
 
     def __eq__(self, other):
-        """Equality check."""
+        """Equality check, comparing cached hashes first."""
+        if self is other:
+            return True
+        if not isinstance(other, GDBMIRecord):
+            return NotImplemented
+        if hash(self) != hash(other):
+            return False
         return self.__key() == other.__key()
 
+    def __ne__(self, other):
+        """Inequality check."""
+        eq = self.__eq__(other)
+        if eq is NotImplemented:
+            return eq
+        return not eq
+
     def __hash__(self):
-        """Hash."""
-        return hash(self.__key())
+        """Return the cached hash."""
+        d = self.__dict__
+        if "_cached_hash" not in d:
+            self.__key()
+        return d["_cached_hash"]
 
     def _str_fields(self):
         s = ""
@@ -164,7 +314,10 @@ class GDBMIAsyncRecord(GDBMIRecord):
             record.frame = GDBMIFrame(output["frame"])
             record.fields += ["frame"]
         if record_type == ASYNC_EXEC:
-            record.thread_id = int(output["thread-id"])
+            record.thread_id = output["thread-id"]
+            # This is "all" when every thread is affected.
+            if record.thread_id.isdigit():
+                record.thread_id = int(record.thread_id)
             record.fields += ["thread_id"]
             if output_class == ASYNC_EXEC_STOPPED:
                 record.reason = output.get("reason")
@@ -294,7 +447,7 @@ class GDBMIAsyncRecord(GDBMIRecord):
                 record.length = output["len"]
                 record.mem_type = output.get("type")
                 record.fields += ["thread_group_id", "addr", "length", "mem_type"]
-        return record
+        return record._finalize()
 
     def pretty_print(self):
         """Return a list of strings (one per line) for pretty-printing."""
@@ -424,7 +577,7 @@ class GDBMIStreamRecord(GDBMIRecord):
         record.token = None
         record.string = src
         record.fields = ["string"]
-        return record
+        return record._finalize()
 
     def pretty_print(self):
         """Return a list of strings for pretty-printing by GDBMIPrettyPrinter."""
@@ -443,12 +596,21 @@ class GDBMIResultRecord(GDBMIRecord):
     """A result record."""
 
     @staticmethod
-    def create_record(token, result_class, results):
-        """Create a new result record."""
+    def create_record(token, result_class, results, keep_results=False):
+        """Create a new result record.
+
+        If keep_results is True, the raw results are kept in the results
+        attribute, for commands such as the var-* commands whose output is not
+        parsed into fields. They are not part of the record's fields, so are
+        not sent or aggregated.
+
+        """
         record = GDBMIResultRecord()
         record.record_type = RESULT
         record.record_subtypes.add(result_class)
         record.token = token
+        if keep_results:
+            record.results = results
         if result_class == RESULT_CLASS_ERROR:
             record.msg = results[RESULT_MSG]
             if RESULT_CODE in results:
@@ -573,10 +735,15 @@ class GDBMIResultRecord(GDBMIRecord):
             record.fields += ["register_values"]
         if RESULT_MEMORY in results:
             record.record_subtypes.add(RESULT_MEMORY)
-            record.begin = results[RESULT_MEMORY]["begin"]
-            record.offset = results[RESULT_MEMORY]["offset"]
-            record.end = results[RESULT_MEMORY]["end"]
-            record.contents = results[RESULT_MEMORY]["contents"]
+            memory = results[RESULT_MEMORY]
+            if isinstance(memory, list):
+                # One block per readable region; the first is kept here,
+                # all are in the raw results.
+                memory = memory[0] if memory else {}
+            record.begin = memory.get("begin")
+            record.offset = memory.get("offset")
+            record.end = memory.get("end")
+            record.contents = memory.get("contents")
             record.fields += ["begin", "offset", "end", "contents"]
         if RESULT_TRACE_VARIABLES in results:
             record.record_subtypes.add(RESULT_TRACE_VARIABLES)
@@ -633,7 +800,7 @@ class GDBMIResultRecord(GDBMIRecord):
             record.user = results[RESULT_TIME]["user"]
             record.system = results[RESULT_TIME]["system"]
             record.fields += ["wallclock", "user", "system"]
-        return record
+        return record._finalize()
 
     def pretty_print(self):
         """Return a list of strings for pretty-printing by GDBMIPrettyPrinter."""
@@ -788,18 +955,20 @@ class GDBMIUnknownRecord(GDBMIRecord):
         """Return a basic string representation."""
         return "{0} UNKNOWN: {1}".format(self.token, self.output)
 
-class GDBMIFrame:
+class GDBMIFrame(_CompactObject):
     """A stack frame."""
+    __slots__ = ("level", "addr", "func", "source_file", "fullname", "line",
+                 "binary_file", "args")
 
     def __init__(self, frame):
         """Initialize the frame from output data."""
-        self.level = frame.get("level")
-        self.addr = frame.get("addr")
-        self.func = frame.get("func")
-        self.source_file = frame.get("file")
-        self.fullname = frame.get("fullname")
-        self.line = frame.get("line")
-        self.binary_file = frame.get("from")
+        self.level = _intern_str(frame.get("level"))
+        self.addr = _intern_str(frame.get("addr"))
+        self.func = _intern_str(frame.get("func"))
+        self.source_file = _intern_str(frame.get("file"))
+        self.fullname = _intern_str(frame.get("fullname"))
+        self.line = _intern_str(frame.get("line"))
+        self.binary_file = _intern_str(frame.get("from"))
         if "args" in frame:
             self.args = {}
             for arg in frame["args"]:
@@ -830,18 +999,20 @@ class GDBMIFrame:
         """Return a basic string representation."""
         return "GDBMIFrame: level = {0}, addr = {1}, func = {2}, fullname = {3}, line = {4}, args = {5}".format(self.level, self.addr, self.func, self.fullname, self.line, self.args)
 
-    def __key(self):
+    def _key(self):
+        """Return a key defining the frame."""
         return (self.level, self.addr, self.func, self.source_file,
                 self.line, self.binary_file)
 
-    def __eq__(self, other):
-        return self.__key() == other.__key()
-
-    def __hash__(self):
-        return hash(self.__key())
-
-class GDBMIBreakpoint:
+class GDBMIBreakpoint(_CompactObject):
     """A breakpoint."""
+    __slots__ = ("number", "breakpoint_type", "catch_type", "disposition",
+                 "enabled", "addr", "func", "filename", "fullname", "line",
+                 "at", "pending", "evaluated_by", "thread", "task", "cond",
+                 "ignore", "enable", "timeframe_usage",
+                 "static_tracepoint_marker_string_id", "mask", "pass_count",
+                 "original_location", "times", "installed", "what",
+                 "thread_groups")
 
     def __init__(self, bkpt):
         self.number = bkpt["number"]
@@ -849,11 +1020,11 @@ class GDBMIBreakpoint:
         self.catch_type = bkpt.get("catch-type")
         self.disposition = bkpt["disp"]
         self.enabled = bkpt["enabled"]
-        self.addr = bkpt.get("addr")
-        self.func = bkpt.get("func")
-        self.filename = bkpt.get("filename")
-        self.fullname = bkpt.get("fullname")
-        self.line = bkpt.get("line")
+        self.addr = _intern_str(bkpt.get("addr"))
+        self.func = _intern_str(bkpt.get("func"))
+        self.filename = _intern_str(bkpt.get("filename"))
+        self.fullname = _intern_str(bkpt.get("fullname"))
+        self.line = _intern_str(bkpt.get("line"))
         self.at = bkpt.get("at")
         self.pending = bkpt.get("pending")
         self.evaluated_by = bkpt.get("evaluated-by")
@@ -866,7 +1037,7 @@ class GDBMIBreakpoint:
         self.static_tracepoint_marker_string_id = bkpt.get("static-tracepoint-marker-string-id")
         self.mask = bkpt.get("mask")
         self.pass_count = bkpt.get("pass")
-        self.original_location = bkpt.get("original-location")
+        self.original_location = _intern_str(bkpt.get("original-location"))
         self.times = bkpt.get("times")
         self.installed = bkpt.get("installed")
         self.what = bkpt.get("what")
@@ -880,7 +1051,8 @@ class GDBMIBreakpoint:
         """Return a basic string representation."""
         return "GDBMIBreakpoint: no = {0}, type = {1}, enabled = {2}, addr = {3}, func = {4}, fullname = {5}, line = {6}, at = {7}".format(self.number, self.breakpoint_type, self.enabled, self.addr, self.func, self.fullname, self.line, self.at)
 
-    def __key(self):
+    def _key(self):
+        """Return a key defining the breakpoint."""
         return (self.number,
                 self.breakpoint_type,
                 self.catch_type,
@@ -909,14 +1081,10 @@ class GDBMIBreakpoint:
                 self.what,
                 self.thread_groups)
 
-    def __eq__(self, other):
-        return self.__key() == other.__key()
-
-    def __hash__(self):
-        return hash(self.__key())
-
-class GDBMIThread:
+class GDBMIThread(_CompactObject):
     """A thread."""
+    __slots__ = ("thread_id", "target_id", "details", "name", "state",
+                 "current", "core", "frame")
 
     def __init__(self, thread):
         self.thread_id = int(thread["id"])
@@ -956,12 +1124,7 @@ class GDBMIThread:
         """Return a basic string representation."""
         return "GDBMIThread: id = {0}, target = {1}, state = {2}, frame = {3}".format(self.thread_id, self.target_id, self.state, self.frame)
 
-    def __key(self):
+    def _key(self):
+        """Return a key defining the thread."""
         return (self.thread_id, self.target_id, self.details, self.name,
                 self.state, self.current, self.core)
-
-    def __eq__(self, other):
-        return self.__key() == other.__key()
-
-    def __hash__(self):
-        return hash(self.__key())
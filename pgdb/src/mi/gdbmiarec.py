@@ -1,10 +1,11 @@
 """Handles aggregated records."""
 
-import copy
+import re
 from collections import defaultdict
 from mi.gdbmi_parser import *
 from mi.gdbmi_records import *
 from interval import Interval
+from mi.varobj import VariableObjectManager
 
 def _is_dict(v):
     """Check whether an object is a dictionary."""
@@ -26,6 +27,10 @@ def _is_int(v):
     """Check whether an object is an integer."""
     return isinstance(v, int)
 
+def _is_object(v):
+    """Check whether an object is a frame, breakpoint, or thread."""
+    return isinstance(v, (GDBMIFrame, GDBMIBreakpoint, GDBMIThread))
+
 def _is_primitive(v):
     """Check whether an object is a primitive.
 
@@ -36,162 +41,219 @@ def _is_primitive(v):
     return (_is_str(v) or _is_int(v) or (v is None) or
             (_is_list(v) and all([_is_primitive(x) for x in v])))
 
+def _record_type_key(record):
+    """Return a key identifying records (or aggregated records) of one type.
+
+    This is immutable and should identify records that can be aggregated.
+
+    """
+    return (record.record_type, frozenset(record.record_subtypes),
+            frozenset(record.fields))
+
+def _rank_list(ranks):
+    """Return a list of the ranks in ranks (an Interval or single rank)."""
+    if isinstance(ranks, Interval):
+        return list(ranks.members())
+    return [ranks]
+
 def combine_records(records, ranks):
     """Combine a list of records into the smallest set of aggregated records.
 
     records is a list of records.
-    ranks is a list of associated ranks, in the same order.
+    ranks is a list of associated ranks, in the same order. Each entry is
+    either a single rank or an Interval of ranks.
     Returns a list of aggregated records.
 
+    Records of the same type are aggregated in a single pass. If a rank has
+    more than one record of a type, its later records go into further
+    aggregated records so that none are lost.
+
     """
+    # Maps type keys to a list of [records, rank lists, rank set] groups.
     type_dict = defaultdict(list)
-    arecs = []
     for record, rank in zip(records, ranks):
-        # This is immutable and should identify records of the same type.
-        t = tuple([record.record_type] + list(record.record_subtypes))
-        type_dict[t].append((rank, record))
-    for t in type_dict:
-        first_rec = type_dict[t].pop(0)
-        arec = GDBMIAggregatedRecord(first_rec[0], first_rec[1])
-        for rank, record in type_dict[t]:
-            other_arec = GDBMIAggregatedRecord(rank, record)
-            arec.merge(other_arec)
-        arecs.append(arec)
+        rank_list = _rank_list(rank)
+        groups = type_dict[_record_type_key(record)]
+        for group in groups:
+            if group[2].isdisjoint(rank_list):
+                break
+        else:
+            group = [[], [], set()]
+            groups.append(group)
+        group[0].append(record)
+        group[1].append(rank_list)
+        group[2].update(rank_list)
+    arecs = []
+    for groups in type_dict.itervalues():
+        for group_records, rank_lists, _ in groups:
+            arec = GDBMIAggregatedRecord()
+            arec.init_records(group_records, rank_lists)
+            arecs.append(arec)
     return arecs
 
 def combine_aggregated_records(arecs):
-    """Combine a list of aggregated records into the smallest such set."""
-    type_dict = defaultdict(list)
-    new_arecs = []
+    """Combine a list of aggregated records into the smallest such set.
+
+    This is a k-way merge: the records are bucketed by type once, and each
+    bucket is merged in a single pass. Aggregated records of the same type
+    whose ranks overlap are kept separate, as in combine_records.
+
+    """
+    # Maps type keys to a list of [ranks, aggregated records] groups.
+    type_dict = {}
+    type_order = []
     for arec in arecs:
-        t = tuple([arec.record_type] + list(arec.record_subtypes))
-        type_dict[t].append(arec)
-    for t in type_dict:
-        first_arec = type_dict[t].pop(0)
-        for arec in type_dict[t]:
-            first_arec.merge(arec)
-        new_arecs.append(first_arec)
+        t = _record_type_key(arec)
+        if t not in type_dict:
+            type_dict[t] = []
+            type_order.append(t)
+        for group in type_dict[t]:
+            if group[0].intersect(arec.ranks).empty():
+                group[0] += arec.ranks
+                group[1].append(arec)
+                break
+        else:
+            type_dict[t].append([arec.ranks, [arec]])
+    new_arecs = []
+    for t in type_order:
+        for ranks, group_arecs in type_dict[t]:
+            first_arec = group_arecs[0]
+            if len(group_arecs) > 1:
+                first_arec.merge_many(group_arecs[1:])
+            new_arecs.append(first_arec)
     return new_arecs
 
+def _value_key(v):
+    """Return a hashable key for a substitution value.
+
+    Lists and dictionaries are converted to tuples, recursively.
+
+    """
+    if _is_list(v):
+        return tuple([_value_key(x) for x in v])
+    if _is_dict(v):
+        return tuple(sorted([(k, _value_key(x)) for k, x in v.items()]))
+    return v
+
 class _Substitution:
     """Substitution for aggregated records.
 
-    This stores substitutions using the following system:
-    - A default value, which is the value taken by the majority of the records.
-    - The remaining values, stored in a dictionary indexed by rank.
+    This groups ranks by the value they take: every distinct value maps to
+    the Interval of ranks with that value and a count of those ranks. The
+    default value is the one taken by the most ranks. Counts only grow, so
+    the default is maintained in O(1) as values are added.
 
-    The record that stores this will have an Interval of all ranks. This is
-    passed in as needed.
+    Adding or merging costs time proportional to the number of distinct
+    values involved, not the number of ranks. The ranks added must not
+    already be present in the substitution.
 
     """
 
-    def __init__(self, data):
-        """Initialize the substitution, with initial data."""
+    def __init__(self, data, ranks):
+        """Initialize the substitution, with initial data for ranks."""
+        ranks = Interval(ranks)
+        key = _value_key(data)
+        # Maps value keys to [value, ranks, count].
+        self.entries = {key: [data, ranks, ranks.count()]}
+        self.default_key = key
         self.default = data
-        self.other = {}
 
-    def add(self, data, rank, ranks):
-        """Add an entry to the substitution.
-
-        Cases:
-        - data is the same as current default: do nothing
-        - data differs:
-          - check whether a different entry should become default
-          - if yes, replace default
-          - if no, add to other
-
-        """
-        if self.default == data:
-            # Same as current default: do nothing.
-            return
-        default_count = len(ranks) - len(self.other)
-        _data = data
-        if _is_list(_data):
-            _data = tuple(_data)
-        counter_dict = {_data: 1}
-        for v in self.other.values():
-            if _is_list(v):
-                v = tuple(v)
-            if v in counter_dict:
-                counter_dict[v] += 1
-            else:
-                counter_dict[v] = 1
-        # We know that data is the only thing that could cause a change.
-        max_count = counter_dict[data]
-        if default_count >= max_count:
-            # No change to default.
-            self.other[rank] = data
+    def _add_entry(self, key, data, ranks, count):
+        """Add count ranks to the entry for key, updating the default."""
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = [data, ranks, count]
+            self.entries[key] = entry
         else:
-            # Replace default with data.
-            new_other = {}
-            for r in ranks:
-                if r not in self.other:
-                    new_other[r] = self.default
-                else:
-                    if self.other[r] != data:
-                        new_other[r] = self.other[r]
-            self.default = data
-            self.other = new_other
+            entry[1] = entry[1] + ranks
+            entry[2] += count
+        if (key != self.default_key and
+            entry[2] > self.entries[self.default_key][2]):
+            self.default_key = key
+            self.default = entry[0]
+
+    def add(self, data, ranks):
+        """Add the value data for ranks (an Interval or single rank)."""
+        ranks = Interval(ranks)
+        self._add_entry(_value_key(data), data, ranks, ranks.count())
+
+    def merge(self, other):
+        """Merge other substitution into this one."""
+        for key, entry in other.entries.iteritems():
+            self._add_entry(key, entry[0], entry[1], entry[2])
 
-    def merge(self, other, my_ranks, other_ranks):
-        """Merge other substitution into this one.
+    def merge_many(self, others):
+        """Merge a list of other substitutions into this one.
 
-        To keep things simple, this presently just does a full rebuild.
+        The ranks of each distinct value are unioned once, rather than once
+        per substitution merged.
 
         """
-        my_default_count = len(my_ranks) - len(self.other)
-        other_default_count = len(other_ranks) - len(other.other)
-        my_default = self.default
-        other_default = other.default
-        if _is_list(my_default):
-            my_default = tuple(my_default)
-        if _is_list(other_default):
-            other_default = tuple(other_default)
-        counter_dict = {my_default: my_default_count,
-                        other_default: other_default_count}
-        for v in self.other.values():
-            if _is_list(v):
-                # Convert for immutability.
-                v = tuple(v)
-            if v in counter_dict:
-                counter_dict[v] += 1
-            else:
-                counter_dict[v] = 1
-        for v in other.other.values():
-            if _is_list(v):
-                # Convert for immutability.
-                v = tuple(v)
-            if v in counter_dict:
-                counter_dict[v] += 1
-            else:
-                counter_dict[v] = 1
-        max_value = max(counter_dict.keys(), key=lambda x: counter_dict[x])
-        new_other = {}
-        for r in my_ranks:
-            if r in self.other:
-                if self.other[r] != max_value:
-                    new_other[r] = self.other[r]
-            else:
-                new_other[r] = self.default
-        for r in other_ranks:
-            if r in other.other:
-                if other.other[r] != max_value:
-                    new_other[r] = other.other[r]
-            else:
-                new_other[r] = other.default
-        self.default = max_value
-        self.other = new_other
+        # Maps value keys to [value, list of rank intervals, count].
+        pieces = {}
+        for sub in [self] + others:
+            for key, entry in sub.entries.iteritems():
+                piece = pieces.get(key)
+                if piece is None:
+                    pieces[key] = [entry[0], list(entry[1].intervals),
+                                   entry[2]]
+                else:
+                    piece[1] += entry[1].intervals
+                    piece[2] += entry[2]
+        self.entries = {}
+        for key, piece in pieces.iteritems():
+            self.entries[key] = [piece[0], Interval(piece[1]), piece[2]]
+        self.default_key = max(self.entries,
+                               key=lambda k: self.entries[k][2])
+        self.default = self.entries[self.default_key][0]
 
     def get_substitution(self, rank):
         """Return the substitution for the rank."""
-        if rank in self.other:
-            return self.other[rank]
-        else:
-            return self.default
+        for key, entry in self.entries.iteritems():
+            if key != self.default_key and rank in entry[1]:
+                return entry[0]
+        return self.default
+
+    def groups(self):
+        """Return a list of (value, ranks) tuples, one per distinct value."""
+        return [(entry[0], entry[1]) for entry in self.entries.itervalues()]
+
+    def __len__(self):
+        """Return the number of distinct values."""
+        return len(self.entries)
 
     def __str__(self):
-        return "_Substitution: default = {0}\nothers = {1}".format(self.default,
-                                                                   self.other)
+        others = ["{0}: {1}".format(entry[1], entry[0])
+                  for key, entry in self.entries.iteritems()
+                  if key != self.default_key]
+        return "_Substitution: default = {0}\nothers = {1}".format(
+            self.default, ", ".join(others))
+
+def _bulk_substitution(data, ranks):
+    """Return a substitution for many values at once.
+
+    data is a list of values, and ranks the corresponding list of rank
+    lists. Values are grouped by equality first, so the substitution is
+    built with one add per distinct value.
+
+    """
+    # Maps value keys to [value, ranks], in first-seen order.
+    groups = {}
+    order = []
+    for d, rank_list in zip(data, ranks):
+        key = _value_key(d)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [d, list(rank_list)]
+            order.append(key)
+        else:
+            group[1] += rank_list
+    value, value_ranks = groups[order[0]]
+    sub = _Substitution(value, Interval(value_ranks))
+    for key in order[1:]:
+        value, value_ranks = groups[key]
+        sub.add(value, Interval(value_ranks))
+    return sub
 
 class GDBMIAggregatedRecord:
     """Aggregated GDBMIRecord making use of substitutions.
@@ -200,8 +262,14 @@ class GDBMIAggregatedRecord:
 
     """
 
-    def __init__(self, rank, record):
-        self.init_record(rank, record)
+    def __init__(self, rank=None, record=None):
+        """Initialize from a single record, if given.
+
+        Otherwise init_records should be used to initialize this.
+
+        """
+        if record is not None:
+            self.init_record(rank, record)
 
     def create_structure(self, data):
         """Return a structure based upon data.
@@ -218,12 +286,12 @@ class GDBMIAggregatedRecord:
 
         """
         if _is_primitive(data):
-            return _Substitution(data)
+            return _Substitution(data, self.ranks)
         if _is_list(data):
             struct = []
             for d in data:
                 if _is_primitive(data):
-                    struct.append(_Substitution(d))
+                    struct.append(_Substitution(d, self.ranks))
                 else:
                     struct.append(self.create_structure(d))
             return struct
@@ -231,39 +299,80 @@ class GDBMIAggregatedRecord:
             struct = {}
             for k, v in data.items():
                 if _is_primitive(v):
-                    struct[k] = _Substitution(v)
+                    struct[k] = _Substitution(v, self.ranks)
                 else:
                     struct[k] = self.create_structure(v)
             return struct
-        if isinstance(data, GDBMIFrame):
-            return _Substitution(copy.copy(data))
-        if isinstance(data, GDBMIBreakpoint):
-            return _Substitution(copy.copy(data))
-        if isinstance(data, GDBMIThread):
-            return _Substitution(copy.copy(data))
+        if _is_object(data):
+            # These are immutable, so they can be shared.
+            return _Substitution(data, self.ranks)
         raise ValueError(data)
 
+    def create_structure_bulk(self, data, ranks):
+        """Return a structure based upon the data of many records at once.
+
+        data is a list of values at the same position in each record, and
+        ranks is the corresponding list of rank lists. This is like
+        create_structure, except that the values at each position are
+        grouped by equality first, so every substitution is built with one
+        add per distinct value.
+
+        """
+        first = data[0]
+        if _is_primitive(first) or _is_object(first):
+            return _bulk_substitution(data, ranks)
+        if _is_list(first):
+            length = min([len(d) for d in data])
+            if length != max([len(d) for d in data]):
+                print "Warning: List lengths differ; not supported!"
+            return [self.create_structure_bulk([d[i] for d in data], ranks)
+                    for i in range(length)]
+        if _is_dict(first):
+            struct = {}
+            for k in first:
+                struct[k] = self.create_structure_bulk([d[k] for d in data],
+                                                       ranks)
+            return struct
+        raise ValueError(first)
+
     def copy_structure(self, rank, field, data):
-        if isinstance(field, _Subsitution):
-            field.add(data, rank, self.ranks)
+        if isinstance(field, _Substitution):
+            field.add(data, rank)
         elif _is_list(field):
             for d1, d2 in zip(field, data):
-                copy_structure(rank, d1, d2, False)
+                self.copy_structure(rank, d1, d2)
         elif _is_dict(field):
             for k in field:
-                copy_structure(rank, field[k], data[k], False)
+                self.copy_structure(rank, field[k], data[k])
 
     def init_record(self, rank, record):
         self.record_type = record.record_type
         self.record_subtypes = record.record_subtypes
         self.fields = record.fields
         self.ranks = Interval(rank)
+        self._record_classes = None
         for field in self.fields:
             other_attr = getattr(record, field)
             setattr(self, field, self.create_structure(other_attr))
 
+    def init_records(self, records, ranks):
+        """Initialize from a list of records of the same type.
+
+        ranks is a list of the ranks for each record, in the same order.
+        Each entry is a list of ranks, and no rank may appear twice.
+
+        """
+        first = records[0]
+        self.record_type = first.record_type
+        self.record_subtypes = first.record_subtypes
+        self.fields = first.fields
+        self.ranks = Interval([r for rank_list in ranks for r in rank_list])
+        self._record_classes = None
+        for field in self.fields:
+            data = [getattr(record, field) for record in records]
+            setattr(self, field, self.create_structure_bulk(data, ranks))
+
     def add_record(self, rank, record):
-        self.ranks += Interval(rank)
         if ((record.record_type != self.record_type) or
             (record.record_subtypes != self.record_subtypes)):
             raise ValueError(record)
@@ -271,30 +380,62 @@ class GDBMIAggregatedRecord:
             self.copy_structure(rank, getattr(self, field),
                                 getattr(record, field))
         self.ranks += Interval(rank)
+        self._record_classes = None
 
-    def merge_recursive(self, field, other_field, other_ranks):
+    def merge_recursive(self, field, other_field):
         if isinstance(field, _Substitution):
-            field.merge(other_field, self.ranks, other_ranks)
+            field.merge(other_field)
         elif _is_list(field):
             if len(field) != len(other_field):
                 print "Warning: List lengths differ; not supported!"
             for d1, d2 in zip(field, other_field):
-                self.merge_recursive(d1, d2, other_ranks)
+                self.merge_recursive(d1, d2)
         elif _is_dict(field):
             if len(field) != len(other_field):
                 print "Warning: Dict lengths differ; not supported!"
             for k in field:
-                self.merge_recursive(field[k], other_field[k], other_ranks)
+                self.merge_recursive(field[k], other_field[k])
 
     def merge(self, other):
         if ((self.record_type != other.record_type) or
             (self.record_subtypes != other.record_subtypes)):
-            raise ValueError(record)
+            raise ValueError(other)
         for field in self.fields:
             self.merge_recursive(getattr(self, field),
-                                 getattr(other, field),
-                                 other.ranks)
+                                 getattr(other, field))
         self.ranks += other.ranks
+        self._record_classes = None
+
+    def merge_many_recursive(self, field, other_fields):
+        if isinstance(field, _Substitution):
+            field.merge_many(other_fields)
+        elif _is_list(field):
+            if any([len(field) != len(f) for f in other_fields]):
+                print "Warning: List lengths differ; not supported!"
+            for i, d in enumerate(field):
+                self.merge_many_recursive(d, [f[i] for f in other_fields])
+        elif _is_dict(field):
+            if any([len(field) != len(f) for f in other_fields]):
+                print "Warning: Dict lengths differ; not supported!"
+            for k in field:
+                self.merge_many_recursive(field[k],
+                                          [f[k] for f in other_fields])
+
+    def merge_many(self, others):
+        """Merge a list of other aggregated records into this one."""
+        for other in others:
+            if ((self.record_type != other.record_type) or
+                (self.record_subtypes != other.record_subtypes)):
+                raise ValueError(other)
+        for field in self.fields:
+            self.merge_many_recursive(getattr(self, field),
+                                      [getattr(other, field)
+                                       for other in others])
+        intervals = list(self.ranks.intervals)
+        for other in others:
+            intervals += other.ranks.intervals
+        self.ranks = Interval(intervals)
+        self._record_classes = None
 
     def reconstruct_recursive(self, rank, data):
         if isinstance(data, _Substitution):
@@ -328,6 +469,22 @@ class GDBMIAggregatedRecord:
                     self.reconstruct_recursive(rank, getattr(self, field)))
         return record
 
+    def get_substitutions(self, data=None):
+        """Return a list of every substitution in this record's fields."""
+        subs = []
+        if data is None:
+            for field in self.fields:
+                subs += self.get_substitutions(getattr(self, field))
+        elif isinstance(data, _Substitution):
+            subs.append(data)
+        elif _is_list(data):
+            for d in data:
+                subs += self.get_substitutions(d)
+        elif _is_dict(data):
+            for k in data:
+                subs += self.get_substitutions(data[k])
+        return subs
+
     def get_record_classes(self):
         """Get the classes of records in this aggregated record.
 
@@ -336,19 +493,66 @@ class GDBMIAggregatedRecord:
 
         This returns a dictionary indexed by records, containing ranks.
 
+        The classes are computed by partition refinement: starting from all
+        ranks, each substitution with more than one value splits the current
+        classes by the ranks of each of its values. Only one record per class
+        is reconstructed. The result is cached until the record changes.
+
         """
+        if self._record_classes is not None:
+            return self._record_classes
+        classes = [self.ranks]
+        seen = set()
+        for sub in self.get_substitutions():
+            if len(sub) == 1:
+                continue
+            groups = [ranks for value, ranks in sub.groups()]
+            # Many substitutions (e.g. every frame of a stack) partition the
+            # ranks identically; only refine once per distinct partition.
+            key = frozenset(groups)
+            if key in seen:
+                continue
+            seen.add(key)
+            new_classes = []
+            for cls in classes:
+                remaining = cls.count()
+                for ranks in groups:
+                    part = cls.intersect(ranks)
+                    if not part.empty():
+                        new_classes.append(part)
+                        remaining -= part.count()
+                        if not remaining:
+                            break
+            classes = new_classes
         class_dict = {}
-        for rank in self.ranks:
-            record = self.get_record(rank)
+        for cls in classes:
+            record = self.get_record(cls.get_smallest())
             if record in class_dict:
-                class_dict[record] += Interval(rank)
+                class_dict[record] += cls
             else:
-                class_dict[record] = Interval(rank)
+                class_dict[record] = cls
+        self._record_classes = class_dict
         return class_dict
 
     def get_ranks(self):
         return self.ranks
 
+    def __getstate__(self):
+        """Return the state to pickle, without the cached record classes.
+
+        The cache holds a reconstructed record per class, so it is rebuilt
+        when needed instead of being sent or spilled.
+
+        """
+        state = self.__dict__.copy()
+        state.pop("_record_classes", None)
+        return state
+
+    def __setstate__(self, state):
+        """Restore from the state returned by __getstate__."""
+        self.__dict__.update(state)
+        self._record_classes = None
+
     def __str__(self):
         return "AggregatedRecord({0}, {1})".format(self.record_type,
                                                    self.record_subtypes)
@@ -358,3 +562,184 @@ class GDBMIAggregatedRecord:
                 "ranks = {2})>").format(self.record_type,
                                         self.record_subtypes,
                                         self.ranks)
+
+def _interval_union(intervals):
+    """Return the union of a list of Intervals, computed at once."""
+    pieces = []
+    for ranks in intervals:
+        pieces += ranks.intervals
+    return Interval(pieces)
+
+def _child_sort_key(name):
+    """Sort array elements by index and other children by name."""
+    if re.match(r"\[?[0-9]+\]?$", name):
+        return (0, int(name.strip("[]")), name)
+    return (1, 0, name)
+
+class AggregatedVariableObject:
+    """A variable object tree aggregated across ranks.
+
+    Every node has the Interval of ranks it is present for and substitutions
+    for its full name, type, and value, so ranks with identical subtrees share
+    one tree with a single value at each node. more_children is the Interval
+    of ranks for which not every child of the node was listed. children maps
+    the short names of children to their aggregated nodes.
+
+    """
+
+    def __init__(self, varobjs=None, ranks=None):
+        """Initialize from VariableObjects and their ranks, if given.
+
+        Otherwise, init_varobjs should be used to initialize this.
+
+        """
+        if varobjs:
+            self.init_varobjs(varobjs, ranks)
+
+    def init_varobjs(self, varobjs, ranks):
+        """Initialize from a list of VariableObjects, one per rank in ranks.
+
+        The variable objects must all be at the same position in their trees.
+
+        """
+        rank_lists = [[rank] for rank in ranks]
+        self.name = varobjs[0].get_name()
+        self.ranks = Interval(list(ranks))
+        self.full_names = _bulk_substitution([v.name for v in varobjs],
+                                             rank_lists)
+        self.types = _bulk_substitution([v.vartype for v in varobjs],
+                                        rank_lists)
+        self.values = _bulk_substitution([v.value for v in varobjs],
+                                         rank_lists)
+        self.more_children = Interval([rank for v, rank in zip(varobjs, ranks)
+                                       if v.more_children])
+        # Maps child names to [child varobjs, their ranks].
+        groups = {}
+        for varobj, rank in zip(varobjs, ranks):
+            for name, child in varobj.children.iteritems():
+                group = groups.get(name)
+                if group is None:
+                    groups[name] = [[child], [rank]]
+                else:
+                    group[0].append(child)
+                    group[1].append(rank)
+        self.children = {}
+        for name, (children, child_ranks) in groups.iteritems():
+            self.children[name] = AggregatedVariableObject(children,
+                                                           child_ranks)
+
+    def merge_many(self, others):
+        """Merge a list of other trees for disjoint ranks into this one."""
+        self.ranks = _interval_union([self.ranks] +
+                                     [other.ranks for other in others])
+        self.full_names.merge_many([other.full_names for other in others])
+        self.types.merge_many([other.types for other in others])
+        self.values.merge_many([other.values for other in others])
+        self.more_children = _interval_union(
+            [self.more_children] + [other.more_children for other in others])
+        # Maps child names to the children to merge into the first.
+        groups = {}
+        for other in others:
+            for name, child in other.children.iteritems():
+                if name in self.children:
+                    groups.setdefault(name, []).append(child)
+                else:
+                    self.children[name] = child
+        for name, children in groups.iteritems():
+            self.children[name].merge_many(children)
+
+    def get_full_names(self, path):
+        """Return the full varobj names of a descendant for each rank.
+
+        path is a list of the short names of the descendant's ancestors
+        below this node, then its own, not including pseudochildren.
+        Returns a dict mapping full names to the Interval of ranks using
+        them.
+
+        """
+        nodes = [(self, self.ranks)]
+        for part in path:
+            next_nodes = []
+            for node, ranks in nodes:
+                candidates = [node.children.get(part)]
+                for pseudo in VariableObjectManager.pseudochildren:
+                    if pseudo in node.children:
+                        candidates.append(
+                            node.children[pseudo].children.get(part))
+                for child in candidates:
+                    if child is not None:
+                        child_ranks = ranks.intersect(child.ranks)
+                        if not child_ranks.empty():
+                            next_nodes.append((child, child_ranks))
+            nodes = next_nodes
+        full_names = {}
+        for node, ranks in nodes:
+            for full_name, name_ranks in node.full_names.groups():
+                name_ranks = name_ranks.intersect(ranks)
+                if name_ranks.empty():
+                    continue
+                if full_name in full_names:
+                    full_names[full_name] = full_names[full_name] + name_ranks
+                else:
+                    full_names[full_name] = name_ranks
+        return full_names
+
+    def pretty_print(self, indent=0, parent_ranks=None):
+        """Return a list of lines showing the tree.
+
+        Values that differ between ranks are each shown with their ranks, as
+        are nodes that are not present on every rank of their parent.
+
+        """
+        prefix = "   " * indent
+        name = self.name
+        if self.types.default:
+            name = "{0} {1}".format(self.types.default, name)
+        if parent_ranks is not None and self.ranks != parent_ranks:
+            name = "[{0}] {1}".format(self.ranks, name)
+        lines = []
+        if self.children:
+            lines.append("{0}{1} = {{".format(prefix, name))
+            for child_name in sorted(self.children, key=_child_sort_key):
+                lines += self.children[child_name].pretty_print(indent + 1,
+                                                                self.ranks)
+            if not self.more_children.empty():
+                lines.append("{0}   ... [{1}]".format(prefix,
+                                                     self.more_children))
+            lines.append(prefix + "}")
+        elif len(self.values) == 1:
+            lines.append("{0}{1} = {2}".format(prefix, name,
+                                               self.values.default))
+        else:
+            lines.append("{0}{1} =".format(prefix, name))
+            for value, ranks in sorted(self.values.groups(),
+                                       key=lambda g: g[1].get_smallest()):
+                lines.append("{0}   [{1}] {2}".format(prefix, ranks, value))
+        return lines
+
+    def __repr__(self):
+        return "<AggregatedVariableObject(name = {0}, ranks = {1})>".format(
+            self.name, self.ranks)
+
+def combine_varprint_results(results):
+    """Combine varprint results from disjoint sets of ranks.
+
+    results is a list of (tree, errors) tuples, where tree is an
+    AggregatedVariableObject or None, and errors maps error messages to the
+    Interval of ranks that got them. Returns one such tuple.
+
+    """
+    trees = [tree for tree, _ in results if tree is not None]
+    tree = None
+    if trees:
+        tree = trees[0]
+        if len(trees) > 1:
+            tree.merge_many(trees[1:])
+    # Maps error messages to lists of Intervals.
+    error_ranks = {}
+    for _, errors in results:
+        for msg, ranks in errors.iteritems():
+            error_ranks.setdefault(msg, []).append(ranks)
+    errors = dict((msg, _interval_union(intervals))
+                  for msg, intervals in error_ranks.iteritems())
+    return tree, errors
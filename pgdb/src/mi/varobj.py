@@ -32,6 +32,12 @@ class VariableObject:
         self.num_child = num_child
         self.listed = False
         self.more_children = False
+        # For roots: the generation of the inferior when last updated, the
+        # varprint in which the root was last printed, and whether GDB has
+        # frozen it.
+        self.generation = None
+        self.last_viewed = 0
+        self.frozen = False
 
     def get_parent(self):
         """Return the name of the parent of this variable object."""
@@ -72,12 +78,29 @@ class VariableObject:
         return self.get_name()
 
 class VariableObjectManager:
-    """A top-level manager for variable objects."""
+    """A top-level manager for variable objects.
+
+    Besides the tree of variable objects, this keeps two flat indices: one
+    from full names to variable objects, and one from short paths, the names
+    a user would write, which omit the pseudochildren. Both are updated when
+    variable objects are added or removed, so lookups need not walk the tree.
+
+    """
     pseudochildren = ["public", "protected", "private"]
 
     def __init__(self):
         """Initialization."""
         self.varobjs = {}
+        # Maps full names to variable objects.
+        self.full_index = {}
+        # Maps short paths to variable objects.
+        self.short_index = {}
+
+    @staticmethod
+    def get_short_path(name):
+        """Return the short path of a name, without any pseudochildren."""
+        return ".".join([part for part in name.split(".")
+                         if part not in VariableObjectManager.pseudochildren])
 
     def get_child(self, varobj, name):
         """A helper function to get the child of a variable object based on a name.
@@ -101,84 +124,86 @@ class VariableObjectManager:
                 return None # Not present at all.
 
     def get_var_obj(self, name):
-        """Get a variable object based on a name."""
-        name_parts = name.split(".")
-        if len(name_parts) == 1:
-            if name in self.varobjs:
-                return self.varobjs[name]
-            return None
-        if name_parts[0] not in self.varobjs:
-            return None
-        varobj = self.varobjs[name_parts[0]]
-        for part in name_parts[1:]:
-            varobj = self.get_child(varobj, part)
-            if varobj is None:
-                return None
+        """Get a variable object based on a full name or short path."""
+        varobj = self.full_index.get(name)
+        if varobj is None:
+            varobj = self.short_index.get(name)
         return varobj
 
+    def _index(self, varobj):
+        """Add a variable object and its descendants to the indices."""
+        self.full_index[varobj.name] = varobj
+        if not self.is_pseudochild(varobj):
+            self.short_index[self.get_short_path(varobj.name)] = varobj
+        for child in varobj.children.itervalues():
+            self._index(child)
+
+    def _unindex(self, varobj):
+        """Remove a variable object and its descendants from the indices."""
+        if self.full_index.get(varobj.name) is varobj:
+            del self.full_index[varobj.name]
+        short_path = self.get_short_path(varobj.name)
+        if self.short_index.get(short_path) is varobj:
+            del self.short_index[short_path]
+        for child in varobj.children.itervalues():
+            self._unindex(child)
+
     def add_var_obj(self, newvarobj):
-        """Add a variable object to the manager."""
-        name_parts = newvarobj.name.split(".")
+        """Add a variable object to the manager.
+
+        This replaces any existing variable object with the same name.
+
+        """
+        name_parts = newvarobj.name.rsplit(".", 1)
         if len(name_parts) == 1:
-            self.varobjs[newvarobj.name] = newvarobj
-            return True
-        parent = self.get_var_obj(".".join(name_parts[:-1]))
-        if parent:
-            parent.children[name_parts[-1]] = newvarobj
-            return True
-        return False
+            siblings = self.varobjs
+        else:
+            parent = self.full_index.get(name_parts[0])
+            if not parent:
+                return False
+            siblings = parent.children
+        if name_parts[-1] in siblings:
+            self._unindex(siblings[name_parts[-1]])
+        siblings[name_parts[-1]] = newvarobj
+        self._index(newvarobj)
+        return True
 
     def del_var_obj(self, varobj):
         """Remove a variable object from the manager."""
-        name_parts = varobj.name.split(".")
+        name_parts = varobj.name.rsplit(".", 1)
         if len(name_parts) == 1:
-            del self.varobjs[varobj.name]
-            return True
-        parent = self.get_var_obj(".".join(name_parts[:-1]))
-        if parent:
-            del parent.children[name_parts[-1]]
-            return True
-        return False
+            siblings = self.varobjs
+        else:
+            parent = self.full_index.get(name_parts[0])
+            if not parent:
+                return False
+            siblings = parent.children
+        if name_parts[-1] not in siblings:
+            return False
+        self._unindex(siblings.pop(name_parts[-1]))
+        return True
+
+    def clear_children(self, varobj):
+        """Remove all the children of a variable object from the manager."""
+        for child in varobj.children.itervalues():
+            self._unindex(child)
+        varobj.children = {}
 
     def get_lowest_ancestor(self, name):
         """Get the lowest ancestor of a name that the manager has a variable object for."""
         name_parts = name.split(".")
-        if name_parts[0] not in self.varobjs:
-            return None
-        varobj = self.varobjs[name_parts[0]]
-        for part in name_parts[1:]:
-            child = self.get_child(varobj, part)
-            if child is None:
+        for i in range(len(name_parts), 0, -1):
+            varobj = self.get_var_obj(".".join(name_parts[:i]))
+            if varobj is not None:
                 return varobj
-            varobj = child
-        return varobj
+        return None
 
     def get_full_name(self, name):
         """Get the full name from a provided name, including the pseudochildren in the name."""
-        full_name = ""
-        name_parts = name.split(".")
-        if name_parts[0] not in self.varobjs:
+        varobj = self.get_var_obj(name)
+        if varobj is None:
             return None
-        full_name += name_parts[0]
-        varobj = self.varobjs[name_parts[0]]
-        for part in name_parts[1:]:
-            if part in varobj.children:
-                full_name += "." + part
-                varobj = varobj.children[part]
-            else:
-                # Check the pseduo-children.
-                if "public" in varobj.children and part in varobj.children["public"].children:
-                    full_name += ".public." + part
-                    varobj = varobj.children["public"].children[part]
-                elif "protected" in varobj.children and part in varobj.children["protected"].children:
-                    full_name += ".protected." + part
-                    varobj = varobj.children["protected"].children[part]
-                elif "private" in varobj.children and part in varobj.children["private"].children:
-                    full_name += ".private." + part
-                    varobj = varobj.children["private"].children[part]
-                else:
-                    return None # Not present at all.
-        return full_name
+        return varobj.name
 
     @staticmethod
     def get_name_depth(name):
@@ -0,0 +1,175 @@
+"""Benchmarks for GDB/MI records and record aggregation.
+
+Run from the src directory, e.g. "python misc/arec_bench.py".
+
+"""
+
+from __future__ import print_function
+import sys, os.path, time, cPickle
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from mi.gdbmi_parser import GDBMIParser
+from mi.gdbmiarec import (GDBMIAggregatedRecord, combine_records,
+                          combine_aggregated_records)
+
+# Shape of the stack corpus: num_stacks records of stack_depth frames each.
+num_stacks = 1000
+stack_depth = 100
+# Number of ranks on a node for the combine benchmark.
+ranks_per_node = 256
+# Fan-ins and ranks per child for the filter merge benchmark.
+fan_ins = [8, 32, 128]
+ranks_per_child = 16
+
+def deep_sizeof(obj, seen=None):
+    """Return the approximate memory used by obj and everything it references."""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            size += deep_sizeof(k, seen) + deep_sizeof(v, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for v in obj:
+            size += deep_sizeof(v, seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_sizeof(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for slot in cls.__dict__.get("__slots__", ()):
+            if slot in ("__dict__", "__weakref__"):
+                continue
+            if hasattr(obj, slot):
+                size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+def make_stack_output(stack_id, depth):
+    """Return the MI output of a -stack-list-frames command."""
+    frames = []
+    for level in range(depth):
+        # Keep frames mostly shared between stacks, as in a real job.
+        func = "func{0}".format(level if level else stack_id % 7)
+        frames.append(('frame={{level="{0}",addr="0x{1:016x}",func="{2}",'
+                       'file="file{3}.c",fullname="/src/file{3}.c",'
+                       'line="{4}"}}').format(level, 0x400000 + level * 16,
+                                              func, level % 10, level + 10))
+    return "^done,stack=[" + ",".join(frames) + "]"
+
+def make_stack_corpus(stacks=num_stacks, depth=stack_depth):
+    """Return a list of parsed stack records."""
+    parser = GDBMIParser()
+    records = []
+    for i in range(stacks):
+        records += parser.parse_output(make_stack_output(i, depth))
+    return records
+
+def make_stop_output(rank, divergent):
+    """Return the MI output of a breakpoint stop for rank.
+
+    If divergent, every rank stops at a different line, thread, and core.
+
+    """
+    line = 100 + (rank if divergent else 0)
+    return ('*stopped,reason="breakpoint-hit",disp="keep",bkptno="1",'
+            'frame={{addr="0x{0:016x}",func="compute",args=[{{name="n",'
+            'value="{1}"}}],file="compute.c",fullname="/src/compute.c",'
+            'line="{1}"}},thread-id="{2}",stopped-threads="all",'
+            'core="{3}"').format(0x400000 + line * 4, line,
+                                 rank + 1 if divergent else 1,
+                                 rank % 16 if divergent else 0)
+
+def combine_records_merge(records, ranks):
+    """Combine records by merging one aggregated record at a time.
+
+    This is the old approach used by combine_records, for comparison.
+
+    """
+    arec = GDBMIAggregatedRecord(ranks[0], records[0])
+    for rank, record in zip(ranks[1:], records[1:]):
+        arec.merge(GDBMIAggregatedRecord(rank, record))
+    return [arec]
+
+def bench_combine():
+    """Time combining one stop per rank on a node."""
+    parser = GDBMIParser()
+    ranks = range(ranks_per_node)
+    for divergent in [False, True]:
+        records = []
+        for rank in ranks:
+            records += parser.parse_output(make_stop_output(rank, divergent))
+        print("Combine {0} {1} stops:".format(
+            ranks_per_node, "divergent" if divergent else "identical"))
+        for name, func in [("merge", combine_records_merge),
+                           ("bulk", combine_records)]:
+            start = time.time()
+            for i in range(10):
+                arecs = func(records, ranks)
+            print("  {0:6} {1:.3f} ms, {2} classes".format(
+                name + ":", (time.time() - start) * 100,
+                len(arecs[0].get_record_classes())))
+
+def combine_aggregated_records_pairwise(arecs):
+    """Combine aggregated records by merging them one at a time.
+
+    This is the old approach used by combine_aggregated_records.
+
+    """
+    type_dict = {}
+    for arec in arecs:
+        t = (arec.record_type, frozenset(arec.record_subtypes))
+        if t in type_dict:
+            type_dict[t].merge(arec)
+        else:
+            type_dict[t] = arec
+    return type_dict.values()
+
+def make_child_arecs(parser, fan_in):
+    """Return a list of aggregated records from each of fan_in children."""
+    children = []
+    for child in range(fan_in):
+        records = []
+        ranks = []
+        for i in range(ranks_per_child):
+            rank = child * ranks_per_child + i
+            records += parser.parse_output(make_stop_output(rank, True))
+            records += parser.parse_output(make_stack_output(rank % 4, 10))
+            ranks += [rank, rank]
+        children.append(combine_records(records, ranks))
+    return children
+
+def bench_fan_in():
+    """Time merging children's aggregated records at a commnode."""
+    parser = GDBMIParser()
+    for fan_in in fan_ins:
+        print("Merge at fan-in {0}:".format(fan_in))
+        # Merging modifies the records, so use a fresh copy each time.
+        pickled = cPickle.dumps(make_child_arecs(parser, fan_in), 0)
+        children = cPickle.loads(pickled)
+        start = time.time()
+        arec_list = children.pop(0)
+        for l in children:
+            arec_list = combine_aggregated_records_pairwise(arec_list + l)
+        print("  pairwise: {0:.3f} ms".format((time.time() - start) * 1000))
+        children = cPickle.loads(pickled)
+        start = time.time()
+        arec_list = combine_aggregated_records(sum(children, []))
+        print("  k-way:    {0:.3f} ms".format((time.time() - start) * 1000))
+
+def bench_memory():
+    """Measure in-memory and pickled size of a stack record corpus."""
+    start = time.time()
+    records = make_stack_corpus()
+    parse_time = time.time() - start
+    mem = deep_sizeof(records)
+    pickled = len(cPickle.dumps(records, 0))
+    print("Stack corpus: {0} records, {1} frames".format(
+        len(records), len(records) * stack_depth))
+    print("  parse time:  {0:.3f} s".format(parse_time))
+    print("  memory:      {0} bytes".format(mem))
+    print("  pickle size: {0} bytes".format(pickled))
+
+if __name__ == "__main__":
+    bench_memory()
+    bench_combine()
+    bench_fan_in()
@@ -0,0 +1,137 @@
+"""Record filter predicates evaluated on the back-end.
+
+Filters are sent from the front-end as a list of (kind, value) terms, all of
+which must match for a record to be dropped, and compiled once when they are
+installed.
+
+"""
+
+import re, fnmatch
+from interval import Interval
+from mi.gdbmi_records import (GDBMIFrame, STREAM_CONSOLE, STREAM_TARGET,
+                              STREAM_LOG)
+
+# The kinds of terms a filter may have.
+FILTER_KINDS = ("ranks", "thread", "stream", "func", "bkpt", "type")
+
+def record_frames(record):
+    """Return a list of the frames in a record."""
+    frames = []
+    for field in ("frame", "stack"):
+        data = getattr(record, field, None)
+        if isinstance(data, GDBMIFrame):
+            frames.append(data)
+        elif isinstance(data, list):
+            frames += [f for f in data if isinstance(f, GDBMIFrame)]
+    return frames
+
+class RecordFilter:
+    """A compiled filter.
+
+    A record is dropped for the filter's ranks (or all ranks, if the filter
+    has no ranks term) when every other term matches it:
+    thread - the record's thread ID is the value.
+    stream - the record is a stream record whose output matches the regular
+    expression value.
+    func - a frame in the record has a function matching the glob value.
+    bkpt - the record refers to breakpoint number value.
+    type - the record's type or one of its subtypes is value.
+
+    dropped counts the records dropped, one per rank.
+
+    """
+
+    def __init__(self, spec):
+        """Compile the filter from spec, a list of (kind, value) tuples.
+
+        The value of a ranks term is an Interval; others are strings.
+
+        """
+        self.spec = spec
+        self.ranks = None
+        self.tests = []
+        self.dropped = 0
+        for kind, value in spec:
+            if kind == "ranks":
+                if self.ranks is None:
+                    self.ranks = value
+                else:
+                    self.ranks = self.ranks.intersect(value)
+            elif kind == "thread":
+                self.tests.append(self._thread_test(value))
+            elif kind == "stream":
+                self.tests.append(self._stream_test(re.compile(value)))
+            elif kind == "func":
+                self.tests.append(self._func_test(
+                    re.compile(fnmatch.translate(value))))
+            elif kind == "bkpt":
+                self.tests.append(self._bkpt_test(value))
+            elif kind == "type":
+                self.tests.append(self._type_test(value.lower()))
+            else:
+                raise ValueError(kind)
+
+    @staticmethod
+    def _thread_test(thread_id):
+        def test(record):
+            return str(getattr(record, "thread_id", None)) == thread_id
+        return test
+
+    @staticmethod
+    def _stream_test(regex):
+        def test(record):
+            return (record.record_type in (STREAM_CONSOLE, STREAM_TARGET,
+                                           STREAM_LOG) and
+                    regex.search(record.string) is not None)
+        return test
+
+    @staticmethod
+    def _func_test(regex):
+        def test(record):
+            for frame in record_frames(record):
+                if frame.func and regex.match(frame.func):
+                    return True
+            return False
+        return test
+
+    @staticmethod
+    def _bkpt_test(number):
+        def test(record):
+            if str(getattr(record, "breakpoint_id", None)) == number:
+                return True
+            bkpt = getattr(record, "breakpoint", None)
+            return bkpt is not None and str(bkpt.number) == number
+        return test
+
+    @staticmethod
+    def _type_test(record_type):
+        def test(record):
+            # Stack results have the stack depth as an integer subtype.
+            return (record.record_type.lower() == record_type or
+                    record_type in [str(subtype).lower() for subtype
+                                    in record.record_subtypes])
+        return test
+
+    def apply(self, record, ranks):
+        """Apply the filter to a record from ranks.
+
+        ranks is a single rank or an Interval. Returns the ranks the record
+        is kept for, or None if it is dropped for every rank.
+
+        """
+        for test in self.tests:
+            if not test(record):
+                return ranks
+        if isinstance(ranks, int):
+            if self.ranks is None or ranks in self.ranks:
+                self.dropped += 1
+                return None
+            return ranks
+        if self.ranks is None:
+            kept = Interval([])
+        else:
+            kept = ranks - self.ranks
+        self.dropped += ranks.count() - kept.count()
+        if kept.empty():
+            return None
+        return kept
@@ -5,7 +5,7 @@ This handles deploying files via MRNet instead of the parallel filesystem.
 """
 
 from __future__ import print_function
-import os.path, mmap, struct, re, socket
+import os.path, mmap, struct, re, socket, tempfile, shutil
 import posix_ipc
 from gdb_shared import GDBMessage, FILE_DATA, LOAD_FILE
 from conf import gdbconf
@@ -27,6 +27,8 @@ class SBDFE:
 
         This will attempt to load a file, and broadcasts either the file or an
         error notice. If the file has already been loaded, this does nothing.
+        The file is memory-mapped and sent in chunks of gdbconf.sbd_chunk_size
+        bytes, each with its offset and the file's size.
 
         """
         if filename in self.loaded_files:
@@ -49,19 +51,63 @@ class SBDFE:
                            self.comm.broadcast)
             return
         try:
-            data = sbd_file.read()
-        except IOError as e:
+            size = os.fstat(sbd_file.fileno()).st_size
+            if size:
+                data = mmap.mmap(sbd_file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # Empty files cannot be mapped.
+                data = ""
+        except (OSError, mmap.error) as e:
             print("Cannot read {0} for SBD load file: {1}.".format(filename,
                                                                    e.strerror))
+            sbd_file.close()
             self.comm.send(GDBMessage(FILE_DATA, filename=filename,
                                       data=None, error=True),
                            self.comm.broadcast)
             return
-        sbd_file.close()
         self.loaded_files.add(filename)
-        self.comm.send(GDBMessage(FILE_DATA, filename=filename,
-                                  data=data, error=False),
-                       self.comm.broadcast)
+        # Send the file a chunk at a time, so only one chunk is copied out of
+        # the mapping at once. There is always at least one chunk.
+        chunk_size = gdbconf.sbd_chunk_size
+        for offset in range(0, max(size, 1), chunk_size):
+            self.comm.send(GDBMessage(FILE_DATA, filename=filename,
+                                      offset=offset, size=size,
+                                      data=data[offset:offset + chunk_size],
+                                      error=False),
+                           self.comm.broadcast)
+        if size:
+            data.close()
+        sbd_file.close()
+
+class _SBDFile:
+    """A file received on the back-end.
+
+    Chunks are written to a spill file as they arrive. received counts the
+    bytes received of the file's size. in_shmem counts the bytes at the start
+    of the file already written to shared memory for the current request.
+
+    """
+
+    def __init__(self, path, size):
+        """Initialize the file, spilling it to path."""
+        self.path = path
+        self.size = size
+        self.received = 0
+        self.in_shmem = 0
+        self.spill_file = open(path, "w+b")
+
+    def write(self, offset, data):
+        """Write a chunk of the file at offset."""
+        self.spill_file.seek(offset)
+        self.spill_file.write(data)
+        self.received += len(data)
+        if self.complete():
+            self.spill_file.close()
+            self.spill_file = None
+
+    def complete(self):
+        """Return whether every chunk has been received."""
+        return self.received >= self.size
 
 class SBDBE:
     """Back-end SBD system."""
@@ -76,9 +122,12 @@ class SBDBE:
         # Regex for checking whether to load a file.
         self.load_file_re = re.compile(r".*\.so.*")
         # Stores data for LOAD_FILE/FILE_DATA. Indexed by filename.
-        # Entries are None when there is no data, False when error was received,
-        # and data otherwise.
+        # Entries are None when there is no data, "error" when error was
+        # received, and an _SBDFile otherwise.
         self.load_files = {}
+        # Directory that received files are spilled to.
+        self.spill_dir = tempfile.mkdtemp(prefix="pgdb-sbd-")
+        self.spill_count = 0
         # Set of executable names for all processes.
         self.load_file_bins = set()
         self.current_load_file = None
@@ -139,12 +188,20 @@ class SBDBE:
     def load_file(self, filename):
         """Send a request for a file to be loaded."""
         filename = os.path.abspath(filename)
-        if filename in self.load_files:
+        entry = self.load_files.get(filename)
+        if entry is not None and entry != "error":
+            # Shared memory has been reused since anything was written to it.
+            entry.in_shmem = 0
+        if entry == "error" or (entry is not None and entry.complete()):
             self.file_data_respond(filename)
             self.gdb_semaphore.release()
             return
-        self.load_files[filename] = None
         self.current_load_file = filename
+        if entry is not None:
+            # The file is already on its way; anything received so far is
+            # copied to shared memory when the rest arrives.
+            return
+        self.load_files[filename] = None
         self.comm.send(GDBMessage(LOAD_FILE, filename=filename,
                                   rank=self.comm.get_mpiranks()),
                        self.comm.frontend)
@@ -189,24 +246,71 @@ class SBDBE:
         return struct.pack_into("=I{0}s".format(size + 1), self.gdb_mem, 2,
                                 size, data)
 
+    def shmem_capacity(self):
+        """Return the largest file that fits in shared memory."""
+        return self.gdb_shmem.size - 6
+
+    def write_memory_chunk(self, offset, data):
+        """Write part of a file to the GDB process at offset in its data."""
+        self.gdb_mem[6 + offset:6 + offset + len(data)] = data
+
+    def finish_memory(self, size):
+        """Tell the GDB process that size bytes of file data were written."""
+        struct.pack_into("=I", self.gdb_mem, 2, size)
+        # Set PGDB-DW flag.
+        struct.pack_into("=B", self.gdb_mem, 0, 1)
+
     def file_data_respond(self, filename):
         """Write the loaded file to shared memory.
 
-        Assumes the file data is in self.load_files[filename] and the semaphore
-        has been acquired. This does not release it.
+        Assumes the file data has been received and the semaphore has been
+        acquired. This does not release it. The part of the file not already
+        in shared memory is copied from the spill file a chunk at a time.
+        Files too large for shared memory are reported as errors, so GDB
+        reads them from the file system instead.
 
         """
-        if filename not in self.load_files or self.load_files[filename] is None:
+        entry = self.load_files.get(filename)
+        if entry is None:
             return False
-        self.write_memory(self.load_files[filename])
+        if entry == "error" or entry.size > self.shmem_capacity():
+            self.write_memory("error")
+            return True
+        chunk_size = gdbconf.sbd_chunk_size
+        with open(entry.path, "rb") as spill_file:
+            spill_file.seek(entry.in_shmem)
+            for offset in range(entry.in_shmem, entry.size, chunk_size):
+                self.write_memory_chunk(offset, spill_file.read(chunk_size))
+        entry.in_shmem = entry.size
+        self.finish_memory(entry.size)
+        return True
 
     def file_data_handler(self, msg):
-        """Handle a response with file data."""
+        """Handle a response with a chunk of file data.
+
+        Chunks of the currently-requested file are also written straight to
+        shared memory, while they arrive in order.
+
+        """
         filename = msg.filename
         if msg.error:
             self.load_files[filename] = "error"
         else:
-            self.load_files[filename] = msg.data
+            entry = self.load_files.get(filename)
+            if entry is None or entry == "error":
+                self.spill_count += 1
+                entry = _SBDFile(os.path.join(self.spill_dir,
+                                              str(self.spill_count)),
+                                 msg.size)
+                self.load_files[filename] = entry
+            entry.write(msg.offset, msg.data)
+            if (self.current_load_file == filename and
+                entry.size <= self.shmem_capacity() and
+                entry.in_shmem == msg.offset):
+                self.write_memory_chunk(msg.offset, msg.data)
+                entry.in_shmem += len(msg.data)
+            if not entry.complete():
+                return
         if self.current_load_file != filename:
             # Got response, but not for the currently-requested file.
             return
@@ -240,3 +344,7 @@ class SBDBE:
         self.gdb_mem.close()
         self.gdb_shmem.unlink()
         self.gdb_shmem.close_fd()
+        for entry in self.load_files.itervalues():
+            if isinstance(entry, _SBDFile) and entry.spill_file is not None:
+                entry.spill_file.close()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,455 @@
+"""Call-prefix trees of stack traces, for the stacktree command.
+
+Stack traces are merged into a tree where each path from the root is a call
+path, outermost frame first, and each node has the Interval of ranks whose
+stacks pass through it. Ranks whose stacks differ only in their innermost
+frames share every node above the point where they diverge. Back-ends build
+trees for their ranks, and the trees are merged in the MRNet tree by union,
+so the front-end receives a single tree.
+
+The same trees hold the counts of periodic stack samples, for the sample
+command.
+
+"""
+
+import time
+from mi.commands import Command
+from mi.gdbmi_records import (RESULT_CLASS_ERROR, ASYNC_EXEC,
+                              ASYNC_EXEC_RUNNING, ASYNC_EXEC_STOPPED,
+                              ASYNC_STOPPED_SIGNAL_RECEIVED)
+from interval import Interval
+from cmdbatch import CommandRequest, CommandBatcher
+from gdb_shared import *
+
+def frame_label(frame, lines=False):
+    """Return the label of a GDBMIFrame in a call tree.
+
+    This is the function name, or the address if that is unknown. If lines is
+    True, the source file and line are included, when known.
+
+    """
+    label = frame.func or frame.addr or "??"
+    if lines and frame.source_file and frame.line is not None:
+        label = "{0} at {1}:{2}".format(label, frame.source_file, frame.line)
+    return label
+
+class CallTree:
+    """A node in a call-prefix tree.
+
+    label is the frame's label, or None for the root. ranks is the Interval of
+    ranks with a stack through the node, and count the number of stacks
+    through it. children maps labels of callees to their nodes.
+
+    """
+
+    def __init__(self, label=None):
+        """Initialize an empty node."""
+        self.label = label
+        self.ranks = Interval([])
+        self.count = 0
+        self.children = {}
+
+    def add_stack(self, labels, ranks, count=1):
+        """Add a stack for ranks.
+
+        labels is the list of frame labels, outermost first, and count the
+        number of stacks to add.
+
+        """
+        node = self
+        node.ranks = node.ranks + ranks
+        node.count += count
+        for label in labels:
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = CallTree(label)
+            child.ranks = child.ranks + ranks
+            child.count += count
+            node = child
+
+    def merge_many(self, others):
+        """Merge a list of other trees into this one."""
+        pieces = list(self.ranks.intervals)
+        for other in others:
+            pieces += other.ranks.intervals
+            self.count += other.count
+        self.ranks = Interval(pieces)
+        # Maps labels to the children to merge into ours.
+        groups = {}
+        for other in others:
+            for label, child in other.children.iteritems():
+                if label in self.children:
+                    groups.setdefault(label, []).append(child)
+                else:
+                    self.children[label] = child
+        for label, children in groups.iteritems():
+            self.children[label].merge_many(children)
+
+    def pretty_print(self, indent=0, parent_ranks=None, counts=False):
+        """Return a list of lines showing the tree below this node.
+
+        Each node is shown indented under its caller, with its ranks if it
+        is outermost or they differ from its caller's. If counts is True, the
+        number of stacks through each node is shown too.
+
+        """
+        lines = []
+        ranks = None
+        if self.label is not None:
+            line = "   " * indent + self.label
+            if parent_ranks is None or self.ranks != parent_ranks:
+                line += " [{0}]".format(self.ranks)
+            if counts:
+                line += " ({0})".format(self.count)
+            lines.append(line)
+            indent += 1
+            ranks = self.ranks
+        for child in sorted(self.children.itervalues(),
+                            key=lambda c: (c.ranks.get_smallest(), c.label)):
+            lines += child.pretty_print(indent, ranks, counts)
+        return lines
+
+    def __repr__(self):
+        return "<CallTree(label = {0}, ranks = {1})>".format(self.label,
+                                                             self.ranks)
+
+def combine_stacktree_results(results):
+    """Combine stacktree results from disjoint sets of ranks.
+
+    results is a list of (tree, errors) tuples, where tree is a CallTree or
+    None, and errors maps error messages to the Interval of ranks that got
+    them. Returns one such tuple.
+
+    """
+    trees = [tree for tree, _ in results if tree is not None]
+    tree = None
+    if trees:
+        tree = trees[0]
+        if len(trees) > 1:
+            tree.merge_many(trees[1:])
+    errors = {}
+    for _, other_errors in results:
+        for msg, ranks in other_errors.iteritems():
+            if msg in errors:
+                errors[msg] = errors[msg] + ranks
+            else:
+                errors[msg] = ranks
+    return tree, errors
+
+class _StacktreeRequest(CommandRequest):
+    """The state of one stacktree across the local ranks."""
+
+    def __init__(self, stacktree_id, lines, ranks):
+        """Initialize the request stacktree_id on ranks.
+
+        lines is whether to label frames with their source lines.
+
+        """
+        CommandRequest.__init__(self, ranks)
+        self.stacktree_id = stacktree_id
+        self.lines = lines
+        self.tree = CallTree()
+
+class StackTreeBuilder(CommandBatcher):
+    """Build call-prefix trees of the stacks of the local ranks."""
+
+    def stacktree_handler(self, msg):
+        """Handle a stacktree message.
+
+        The message has the fields
+        ranks - the ranks to query.
+        lines - whether to label frames with source lines.
+        stacktree_id - an ID for the request, returned with the result.
+
+        """
+        ranks = list(msg.ranks.intersect(self.comm.get_mpiranks()))
+        if not ranks:
+            return
+        req = _StacktreeRequest(msg.stacktree_id, msg.lines, ranks)
+        self._issue(req, [(Command("stack-list-frames"), rank, None)
+                          for rank in ranks],
+                    self._stack_result, self._finish)
+
+    def _stack_result(self, req, record, rank, data):
+        """Add the stack of rank to the tree."""
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+            return
+        frames = getattr(record, "stack", [])
+        req.tree.add_stack([frame_label(frame, req.lines)
+                            for frame in reversed(frames)],
+                           Interval([rank]))
+
+    def _finish(self, req):
+        """Send the tree of every rank to the front-end."""
+        errors = {}
+        for rank, msg in req.errors.iteritems():
+            errors.setdefault(msg, []).append(rank)
+        errors = dict((msg, Interval(ranks))
+                      for msg, ranks in errors.iteritems())
+        tree = req.tree
+        if tree.ranks.empty():
+            tree = None
+        self.comm.send(GDBMessage(STACKTREE_RES_MSG,
+                                  stacktree_id = req.stacktree_id,
+                                  tree = tree, errors = errors,
+                                  ranks = Interval(req.ranks)),
+                       self.comm.frontend)
+
+class _SampleRequest(CommandRequest):
+    """The state of one sample across the local ranks.
+
+    The ranks are sampled every period seconds until end_time. tree holds
+    the counts of the samples, and sampled the ranks sampled at least once.
+
+    """
+
+    def __init__(self, sample_id, ranks, period, end_time):
+        """Initialize the request sample_id on ranks."""
+        CommandRequest.__init__(self, ranks)
+        self.sample_id = sample_id
+        self.period = period
+        self.end_time = end_time
+        self.next_time = time.time()
+        self.tree = CallTree()
+        self.sampled = set()
+
+class _SampleRound(CommandRequest):
+    """One round of sampling: interrupt, list stacks, and resume.
+
+    stopping is the set of ranks interrupted whose stop has not arrived yet,
+    and stopped the list of those that have stopped. waiting is True once
+    every interrupt was sent, while stops are awaited.
+
+    """
+
+    def __init__(self, ranks):
+        """Initialize the round on ranks."""
+        CommandRequest.__init__(self, ranks)
+        self.start = time.time()
+        self.stopping = set(ranks)
+        self.stopped = []
+        self.waiting = False
+
+class StackSampler(CommandBatcher):
+    """Periodically sample the stacks of the running local ranks.
+
+    Each round interrupts every running rank in one batch, lists the stacks
+    of those that stopped in one batch, and resumes them in one batch. The
+    stops and resumes caused by sampling are hidden from the front-end; the
+    counts are kept in a CallTree and sent once sampling ends.
+
+    """
+
+    def __init__(self, be):
+        """Initialization.
+
+        be is the GDBBE associated with this.
+
+        """
+        CommandBatcher.__init__(self, be)
+        self.sampling = None
+        self.round = None
+        # Ranks whose inferiors are running, as far as we have seen.
+        self.running = set()
+        # Numbers of stopped and running records still expected from sampling,
+        # indexed by rank.
+        self.expected_stops = {}
+        self.expected_runs = {}
+
+    def sample_handler(self, msg):
+        """Handle a sample message.
+
+        The message has the fields
+        ranks - the ranks to sample.
+        hz - the number of samples to take each second.
+        duration - the number of seconds to sample for.
+        stacktree_id - an ID for the request, returned with the result.
+
+        """
+        ranks = list(msg.ranks.intersect(self.comm.get_mpiranks()))
+        if not ranks:
+            return
+        if self.sampling is not None:
+            self.comm.send(GDBMessage(STACKTREE_RES_MSG,
+                                      stacktree_id = msg.stacktree_id,
+                                      tree = None,
+                                      errors = {"Already sampling.": Interval(ranks)},
+                                      ranks = Interval(ranks)),
+                           self.comm.frontend)
+            return
+        self.sampling = _SampleRequest(msg.stacktree_id, ranks, 1.0 / msg.hz,
+                                       time.time() + msg.duration)
+
+    def check(self):
+        """Start a round of sampling when one is due, and finish sampling.
+
+        This is called regularly from the back-end's main loop.
+
+        """
+        sampling = self.sampling
+        if sampling is None:
+            return
+        now = time.time()
+        if self.round is None:
+            if now >= sampling.end_time:
+                self._finish()
+            elif now >= sampling.next_time:
+                self._start_round(now)
+        elif self.round.waiting and (not self.round.stopping or
+                                     now - self.round.start > sampling.period):
+            # Do not wait longer than a period on ranks that did not stop.
+            self.round.waiting = False
+            self._list_stacks(self.round)
+
+    def _threads(self, rank):
+        """Return the number of threads of rank."""
+        return max(len(self.be.rank_thread_map.get(rank, [])), 1)
+
+    def _start_round(self, now):
+        """Interrupt the running ranks being sampled."""
+        sampling = self.sampling
+        sampling.next_time += sampling.period
+        if sampling.next_time < now:
+            # Skip samples we are too late for.
+            sampling.next_time = now + sampling.period
+        ranks = [rank for rank in sampling.ranks if rank in self.running]
+        if not ranks:
+            return
+        self.round = _SampleRound(ranks)
+        commands = []
+        for rank in ranks:
+            self.expected_stops[rank] = self._threads(rank)
+            commands.append((Command("exec-interrupt",
+                                     opts = {"--thread-group":
+                                             self.be.rank_inferior_map[rank]}),
+                             rank, None))
+        self._issue(self.round, commands, self._interrupt_result,
+                    self._interrupted, no_thread = True)
+
+    def _interrupt_result(self, req, record, rank, data):
+        """Stop waiting for ranks that could not be interrupted."""
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+            req.stopping.discard(rank)
+            self.expected_stops.pop(rank, None)
+
+    def _interrupted(self, req):
+        """Wait for the interrupted ranks to stop; see check."""
+        req.waiting = True
+
+    def _list_stacks(self, req):
+        """List the stacks of the ranks that stopped."""
+        self._issue(req, [(Command("stack-list-frames"), rank, None)
+                          for rank in req.stopped],
+                    self._stack_result, self._sampled)
+
+    def _stack_result(self, req, record, rank, data):
+        """Count the sample of rank."""
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            return
+        frames = getattr(record, "stack", [])
+        self.sampling.tree.add_stack([frame_label(frame)
+                                      for frame in reversed(frames)],
+                                     Interval([rank]))
+        self.sampling.sampled.add(rank)
+
+    def _sampled(self, req):
+        """Resume the ranks that stopped, ending the round.
+
+        Ranks still stopping are resumed when their stop arrives.
+
+        """
+        self._resume([rank for rank in req.stopped if rank in self.running])
+        self.round = None
+
+    def _resume(self, ranks):
+        """Continue ranks that sampling stopped."""
+        commands = []
+        for rank in ranks:
+            self.expected_runs[rank] = self._threads(rank)
+            commands.append((Command("exec-continue",
+                                     opts = {"--thread-group":
+                                             self.be.rank_inferior_map[rank]}),
+                             rank, None))
+        self._issue(CommandRequest(ranks), commands,
+                    lambda req, record, rank, data: None,
+                    lambda req: None, no_thread = True)
+
+    def _record_ranks(self, record):
+        """Return the ranks an exec record is for.
+
+        Also returns whether the record is for the first thread of each rank.
+
+        """
+        if record.thread_id == "all":
+            return self.be.rank_thread_map.keys(), True
+        rank = self.be.thread_rank_map.get(record.thread_id)
+        if rank is None:
+            return [], False
+        return [rank], self.be.rank_thread_map[rank][0] == record.thread_id
+
+    def consume_record(self, record):
+        """Track whether ranks are running, from a record from GDB.
+
+        Returns True if the record is a stop or resume caused by sampling,
+        which should not be shown.
+
+        """
+        if record.record_type != ASYNC_EXEC:
+            return False
+        ranks, first_thread = self._record_ranks(record)
+        ours = False
+        if ASYNC_EXEC_RUNNING in record.record_subtypes:
+            for rank in ranks:
+                self.running.add(rank)
+                if self.expected_runs.get(rank):
+                    ours = True
+                    self.expected_runs[rank] -= 1
+                    if record.thread_id == "all":
+                        del self.expected_runs[rank]
+        elif ASYNC_EXEC_STOPPED in record.record_subtypes:
+            for rank in ranks:
+                if (self.expected_stops.get(rank) and
+                    record.reason in (None, ASYNC_STOPPED_SIGNAL_RECEIVED)):
+                    ours = True
+                    self.expected_stops[rank] -= 1
+                    if record.thread_id == "all":
+                        del self.expected_stops[rank]
+                    if first_thread:
+                        self._rank_stopped(rank)
+                else:
+                    # A real stop, such as at a breakpoint; leave it stopped.
+                    self.running.discard(rank)
+                    self.expected_stops.pop(rank, None)
+                    if self.round is not None:
+                        self.round.stopping.discard(rank)
+        return ours
+
+    def _rank_stopped(self, rank):
+        """Note that sampling stopped rank."""
+        if self.round is not None and rank in self.round.stopping:
+            self.round.stopping.discard(rank)
+            self.round.stopped.append(rank)
+        else:
+            # The stop came too late for its round.
+            self._resume([rank])
+
+    def _finish(self):
+        """Send the sample counts of every rank to the front-end."""
+        sampling = self.sampling
+        self.sampling = None
+        errors = {}
+        not_sampled = [rank for rank in sampling.ranks
+                       if rank not in sampling.sampled]
+        if not_sampled:
+            errors["No samples; the process was not running."] = Interval(
+                not_sampled)
+        tree = sampling.tree
+        if tree.ranks.empty():
+            tree = None
+        self.comm.send(GDBMessage(STACKTREE_RES_MSG,
+                                  stacktree_id = sampling.sample_id,
+                                  tree = tree, errors = errors,
+                                  ranks = Interval(sampling.ranks)),
+                       self.comm.frontend)
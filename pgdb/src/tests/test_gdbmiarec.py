@@ -0,0 +1,84 @@
+"""Tests for aggregating records across ranks."""
+
+import os, sys, cPickle, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mi.gdbmi_parser import GDBMIParser
+from mi.gdbmiarec import combine_records, combine_aggregated_records
+from interval import Interval
+
+def stack_output(func):
+    """Return a stack result with func as the innermost frame."""
+    return ('^done,stack=[frame={{level="0",addr="0x1",func="{0}"}},'
+            'frame={{level="1",addr="0x2",func="main"}}]'.format(func))
+
+def parse(output):
+    """Return the single record parsed from output."""
+    return GDBMIParser().parse_output(output)[0]
+
+# The innermost function of the stack on each of ranks 0-7.
+FUNCS = ["poll", "poll", "wait", "poll", "send", "wait", "poll", "poll"]
+
+class AggregationTest(unittest.TestCase):
+    """Records combined across ranks reconstruct each rank's record."""
+
+    def setUp(self):
+        self.records = [parse(stack_output(func)) for func in FUNCS]
+
+    def test_round_trip(self):
+        arecs = combine_records(self.records, range(len(FUNCS)))
+        self.assertEqual(len(arecs), 1)
+        arec = arecs[0]
+        self.assertEqual(arec.get_ranks(), Interval([(0, 7)]))
+        for rank, record in enumerate(self.records):
+            self.assertEqual(arec.get_record(rank), record)
+
+    def test_record_classes(self):
+        arec = combine_records(self.records, range(len(FUNCS)))[0]
+        classes = arec.get_record_classes()
+        self.assertEqual(len(classes), 3)
+        for func in set(FUNCS):
+            ranks = Interval([r for r, f in enumerate(FUNCS) if f == func])
+            self.assertEqual(classes[parse(stack_output(func))], ranks)
+
+    def test_overlapping_ranks_kept_separate(self):
+        records = [parse('~"a\\n"'), parse('~"b\\n"'), parse('~"c\\n"')]
+        arecs = combine_records(records, [0, 0, 1])
+        self.assertEqual(len(arecs), 2)
+        self.assertEqual(sorted(str(arec.get_ranks()) for arec in arecs),
+                         ["0", "0-1"])
+
+class CombineAggregatedTest(unittest.TestCase):
+    """Merging children's aggregated records, as done in the MRNet tree."""
+
+    def test_k_way_merge(self):
+        records = [parse(stack_output(func)) for func in FUNCS]
+        # Each child covers two ranks, and sends its records pickled.
+        children = []
+        for start in range(0, len(FUNCS), 2):
+            arecs = combine_records(records[start:start + 2],
+                                    [start, start + 1])
+            children += cPickle.loads(cPickle.dumps(arecs, 0))
+        merged = combine_aggregated_records(children)
+        self.assertEqual(len(merged), 1)
+        arec = merged[0]
+        self.assertEqual(arec.get_ranks(), Interval([(0, 7)]))
+        for rank, record in enumerate(records):
+            self.assertEqual(arec.get_record(rank), record)
+        self.assertEqual(len(arec.get_record_classes()), 3)
+
+    def test_same_type_overlapping_ranks(self):
+        first = combine_records([parse(stack_output("poll"))] * 2, [0, 1])
+        second = combine_records([parse(stack_output("wait"))], [1])
+        merged = combine_aggregated_records(first + second)
+        self.assertEqual(len(merged), 2)
+        self.assertEqual(merged[0].get_ranks(), Interval([(0, 1)]))
+        self.assertEqual(merged[1].get_ranks(), Interval([1]))
+
+    def test_different_types(self):
+        stack = combine_records([parse(stack_output("poll"))], [0])
+        stream = combine_records([parse('~"text\\n"')], [1])
+        merged = combine_aggregated_records(stack + stream)
+        self.assertEqual(len(merged), 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Tests for the front-end output history."""
+
+import os, sys, tempfile, cPickle, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mi.gdbmi_parser import GDBMIParser
+from mi.gdbmiarec import combine_records
+from interval import Interval
+from history import OutputHistory
+
+STACK_OUTPUT = ('^done,stack=[frame={level="0",addr="0x1",func="poll"},'
+                'frame={level="1",addr="0x2",func="main"}]')
+
+class StackRecordTest(unittest.TestCase):
+    """Stack results have the integer stack depth as a subtype."""
+
+    def test_add_and_search_stack_record(self):
+        records = GDBMIParser().parse_output(STACK_OUTPUT)
+        arecs = combine_records(records, [Interval([0, 1])])
+        history = OutputHistory(10)
+        history.add(arecs[0])
+        results = history.search([("type", "stack")])
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][3], Interval([0, 1]))
+        self.assertEqual(len(history.search([("type", "2")])), 1)
+        self.assertEqual(len(history.search([("func", "poll")])), 1)
+
+class SpillTest(unittest.TestCase):
+    """Items beyond the in-memory length are spilled and read back."""
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def test_spilled_items_load_back(self):
+        history = OutputHistory(2, self.path)
+        for i in range(5):
+            records = GDBMIParser().parse_output(
+                '~"line {0}\\n"'.format(i))
+            history.add(combine_records(records, [Interval([i])])[0])
+        self.assertEqual(len(history), 5)
+        self.assertEqual(len(history.spill_index), 3)
+        for i in range(5):
+            arec = history[i]
+            self.assertEqual(arec.get_ranks(), Interval([4 - i]))
+            record = arec.get_record(4 - i)
+            self.assertEqual(record.string, '"line {0}\\n"'.format(4 - i))
+        history.close()
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_spilled_items_stay_searchable(self):
+        history = OutputHistory(1, self.path)
+        for i, func in enumerate(["poll", "wait", "poll"]):
+            records = GDBMIParser().parse_output(STACK_OUTPUT.replace(
+                "poll", func))
+            history.add(combine_records(records, [Interval([i])])[0])
+        self.assertEqual(len(history.spill_index), 2)
+        results = history.search([("func", "poll")])
+        self.assertEqual([(item, ranks) for item, _, _, ranks in results],
+                         [(0, Interval([2])), (2, Interval([0]))])
+        self.assertEqual(history[2].get_ranks(), Interval([0]))
+        self.assertEqual(len(history.search([("func", "wa*")], Interval([0]))),
+                         0)
+        history.close()
+
+    def test_dropped_items_leave_index(self):
+        history = OutputHistory(2)
+        for i in range(4):
+            records = GDBMIParser().parse_output(STACK_OUTPUT)
+            history.add(combine_records(records, [Interval([i])])[0])
+        self.assertEqual(len(history), 2)
+        results = history.search([("type", "stack")])
+        self.assertEqual([item for item, _, _, _ in results], [0, 1])
+
+    def test_record_classes_not_pickled(self):
+        records = GDBMIParser().parse_output(STACK_OUTPUT)
+        arec = combine_records(records, [Interval([0, 1])])[0]
+        arec.get_record_classes()
+        copy = cPickle.loads(cPickle.dumps(arec, cPickle.HIGHEST_PROTOCOL))
+        self.assertFalse("_record_classes" in copy.__getstate__())
+        self.assertEqual(copy.get_record_classes().values(),
+                         [Interval([0, 1])])
+
+if __name__ == "__main__":
+    unittest.main()
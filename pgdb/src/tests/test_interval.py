@@ -0,0 +1,51 @@
+"""Tests for rank Intervals."""
+
+import os, sys, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from interval import Interval
+
+class ConstructionTest(unittest.TestCase):
+    """Overlapping and repeated input is merged."""
+
+    def test_repeated_integers(self):
+        self.assertEqual(Interval([3, 1, 2, 2, 3, 7]).intervals,
+                         [(1, 3), (7, 7)])
+
+    def test_overlapping_tuples(self):
+        self.assertEqual(Interval([(5, 9), (0, 3), (2, 6), (11, 12)]).intervals,
+                         [(0, 9), (11, 12)])
+
+    def test_contained_tuple(self):
+        self.assertEqual(Interval([(0, 10), (2, 4)]).intervals, [(0, 10)])
+
+class OperationTest(unittest.TestCase):
+    """Set operations on Intervals."""
+
+    def test_union_with_empty(self):
+        a = Interval([(0, 3)])
+        empty = Interval([])
+        self.assertEqual(a + empty, a)
+        self.assertEqual(empty + a, a)
+        self.assertTrue(isinstance(a + empty, Interval))
+
+    def test_union(self):
+        self.assertEqual(Interval([(0, 2), (8, 9)]) + Interval([(3, 5)]),
+                         Interval([(0, 5), (8, 9)]))
+
+    def test_difference(self):
+        a = Interval([(0, 10)])
+        self.assertEqual(a - Interval([(2, 3), (12, 15)]),
+                         Interval([(0, 1), (4, 10)]))
+        self.assertEqual(Interval([(0, 1), (20, 30)]) - Interval([(5, 6)]),
+                         Interval([(0, 1), (20, 30)]))
+
+    def test_intersect(self):
+        self.assertEqual(Interval([(0, 10)]).intersect(Interval([(5, 15)])),
+                         Interval([(5, 10)]))
+
+    def test_equality_needs_same_length(self):
+        self.assertNotEqual(Interval([(0, 1)]), Interval([(0, 1), (3, 4)]))
+        self.assertNotEqual(Interval([(0, 1), (3, 4)]), Interval([(0, 1)]))
+
+if __name__ == "__main__":
+    unittest.main()
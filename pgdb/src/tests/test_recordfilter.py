@@ -0,0 +1,30 @@
+"""Tests for back-end record filters."""
+
+import os, sys, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from mi.gdbmi_parser import GDBMIParser
+from interval import Interval
+from recordfilter import RecordFilter
+
+STACK_OUTPUT = ('^done,stack=[frame={level="0",addr="0x1",func="poll"},'
+                'frame={level="1",addr="0x2",func="main"}]')
+
+class TypeFilterTest(unittest.TestCase):
+    """Type filters on stack results, which have an integer subtype."""
+
+    def setUp(self):
+        self.record = GDBMIParser().parse_output(STACK_OUTPUT)[0]
+
+    def test_type_filter_drops_stack_record(self):
+        record_filter = RecordFilter([("type", "stack")])
+        self.assertEqual(record_filter.apply(self.record, 3), None)
+        self.assertEqual(record_filter.dropped, 1)
+
+    def test_type_filter_keeps_other_records(self):
+        record_filter = RecordFilter([("type", "breakpoint-modified")])
+        ranks = Interval([0, 1])
+        self.assertEqual(record_filter.apply(self.record, ranks), ranks)
+        self.assertEqual(record_filter.dropped, 0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+"""Tests for merging stacks into call trees."""
+
+import os, sys, unittest
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from interval import Interval
+from stacktree import CallTree, combine_stacktree_results
+
+def tree(stacks):
+    """Return a CallTree of stacks, a list of (labels, rank) tuples."""
+    root = CallTree()
+    for labels, rank in stacks:
+        root.add_stack(labels, Interval([rank]))
+    return root
+
+class CallTreeTest(unittest.TestCase):
+    """Call trees built on different back-ends merge into one."""
+
+    def test_merge(self):
+        first = tree([(["main", "solve", "MPI_Wait"], 0),
+                      (["main", "solve", "MPI_Wait"], 1)])
+        second = tree([(["main", "solve", "MPI_Wait"], 2),
+                       (["main", "io", "write"], 3)])
+        third = tree([(["main", "solve", "compute"], 4)])
+        merged, errors = combine_stacktree_results(
+            [(first, {}), (None, {"No stack.": Interval([5])}),
+             (second, {}), (third, {"No stack.": Interval([6])})])
+        self.assertEqual(errors, {"No stack.": Interval([(5, 6)])})
+        self.assertEqual(merged.ranks, Interval([(0, 4)]))
+        self.assertEqual(merged.count, 5)
+        main = merged.children["main"]
+        self.assertEqual(sorted(main.children), ["io", "solve"])
+        solve = main.children["solve"]
+        self.assertEqual(solve.ranks, Interval([0, 1, 2, 4]))
+        self.assertEqual(solve.children["MPI_Wait"].ranks,
+                         Interval([(0, 2)]))
+        self.assertEqual(solve.children["compute"].ranks, Interval([4]))
+        self.assertEqual(main.children["io"].children["write"].ranks,
+                         Interval([3]))
+
+    def test_pretty_print_shows_differing_ranks(self):
+        root = tree([(["main", "a"], 0), (["main", "b"], 1)])
+        self.assertEqual(root.pretty_print(),
+                         ["main [0-1]", "   a [0]", "   b [1]"])
+
+    def test_sample_counts(self):
+        root = CallTree()
+        root.add_stack(["main", "a"], Interval([0]), 3)
+        other = CallTree()
+        other.add_stack(["main", "a"], Interval([1]), 2)
+        root.merge_many([other])
+        self.assertEqual(root.children["main"].children["a"].count, 5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+"""Comparing the values of an expression across ranks.
+
+Each back-end evaluates the expression on its ranks and reduces every value
+to a digest. The maps from digests to the ranks that have them are merged in
+the MRNet tree, so the front-end learns which ranks have equal values without
+receiving any of them. It then fetches one value for each distinct digest,
+from a single rank that has it, so the data moved depends on the number of
+distinct values, not on the number of ranks. The fetch is sent only to the
+ranks that were chosen to send values.
+
+"""
+
+import hashlib, time
+from conf import gdbconf
+from mi.commands import Command
+from mi.gdbmi_records import RESULT_CLASS_ERROR
+from interval import Interval
+from cmdbatch import CommandRequest, CommandBatcher
+from gdb_shared import *
+
+def value_digest(value):
+    """Return the digest of a value string."""
+    if isinstance(value, unicode):
+        value = value.encode("utf-8")
+    return hashlib.sha1(value).hexdigest()
+
+def _merge_ranks(into, other):
+    """Merge a map to Intervals of ranks into another."""
+    for key, ranks in other.iteritems():
+        if key in into:
+            into[key] = into[key] + ranks
+        else:
+            into[key] = ranks
+
+def combine_varcompare_results(results):
+    """Combine varcompare results from disjoint sets of ranks.
+
+    results is a list of (digests, values, errors) tuples, where digests maps
+    value digests to the Interval of ranks with that value, values maps
+    digests to the values fetched for them, and errors maps error messages to
+    the Interval of ranks that got them. Returns one such tuple.
+
+    """
+    digests = {}
+    values = {}
+    errors = {}
+    for other_digests, other_values, other_errors in results:
+        _merge_ranks(digests, other_digests)
+        values.update(other_values)
+        _merge_ranks(errors, other_errors)
+    return digests, values, errors
+
+class _VarcompareRequest(CommandRequest):
+    """The state of one varcompare across the local ranks.
+
+    The print elements limit of each rank is saved while the value is
+    evaluated without it, and restored afterward. The limits and digests of
+    the values are indexed by rank, and the values by digest.
+
+    """
+
+    def __init__(self, varcompare_id, expr, ranks):
+        """Initialize the request varcompare_id for expression expr on ranks."""
+        CommandRequest.__init__(self, ranks)
+        self.varcompare_id = varcompare_id
+        self.expr = expr
+        self.limits = {}
+        self.digests = {}
+        self.values = {}
+
+class VariableComparer(CommandBatcher):
+    """Compare the values of expressions across ranks on the back-end.
+
+    Values are kept, one per distinct digest, from when the digests are sent
+    until the front-end fetches the ones it needs. Requests without digests
+    keep nothing. The front-end fetches only from some back-ends, so values
+    not fetched within gdbconf.varcompare_fetch_timeout seconds are discarded.
+
+    """
+
+    def __init__(self, be):
+        """Initialization.
+
+        be is the GDBBE associated with this.
+
+        """
+        CommandBatcher.__init__(self, be)
+        # Values awaiting a fetch, indexed by varcompare ID, as a tuple of
+        # the time they were kept and a map from digests to values.
+        self.values = {}
+
+    def varcompare_handler(self, msg):
+        """Handle a varcompare message.
+
+        The message has the fields
+        ranks - the ranks to query.
+        expr - the expression to compare.
+        varcompare_id - an ID for the request, returned with the result.
+        fetch - None to compute digests, or a map from digests to the rank
+        whose value to send for each.
+
+        """
+        if msg.fetch is not None:
+            self._fetch(msg)
+            return
+        self._expire()
+        ranks = list(msg.ranks.intersect(self.comm.get_mpiranks()))
+        if not ranks:
+            return
+        req = _VarcompareRequest(msg.varcompare_id, msg.expr, ranks)
+        commands = []
+        for rank in ranks:
+            # Evaluate the whole value, not just the first elements of arrays.
+            commands.append((Command("gdb-show", args = ("print elements",)),
+                             rank, "limit"))
+            commands.append((Command("gdb-set", args = ("print elements 0",)),
+                             rank, None))
+            commands.append((Command("data-evaluate-expression",
+                                     args = ('"' + msg.expr + '"',)),
+                             rank, "value"))
+        self._issue(req, commands, self._evaluate_result, self._restore)
+
+    def _evaluate_result(self, req, record, rank, data):
+        """Record the print elements limit or the digest of the value."""
+        if data is None:
+            # Result of gdb-set.
+            return
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+        elif data == "limit":
+            req.limits[rank] = record.results.get("value", "200")
+        else:
+            value = record.results.get("value", "")
+            digest = value_digest(value)
+            req.digests[rank] = digest
+            req.values[digest] = value
+
+    def _restore(self, req):
+        """Restore the print elements limit on every rank."""
+        commands = []
+        for rank, limit in req.limits.iteritems():
+            if limit == "unlimited":
+                limit = "0"
+            commands.append((Command("gdb-set",
+                                     args = ("print elements " + limit,)),
+                             rank, None))
+        self._issue(req, commands, lambda req, record, rank, data: None,
+                    self._finish)
+
+    def _finish(self, req):
+        """Send the digests of every rank to the front-end."""
+        digests = {}
+        errors = {}
+        for rank in req.ranks:
+            if rank in req.errors:
+                errors.setdefault(req.errors[rank], []).append(rank)
+            else:
+                digests.setdefault(req.digests[rank], []).append(rank)
+        digests = dict((digest, Interval(ranks))
+                       for digest, ranks in digests.iteritems())
+        errors = dict((msg, Interval(ranks))
+                      for msg, ranks in errors.iteritems())
+        if digests:
+            self.values[req.varcompare_id] = (time.time(), req.values)
+        self.comm.send(GDBMessage(VARCOMPARE_RES_MSG,
+                                  varcompare_id = req.varcompare_id,
+                                  digests = digests, values = {},
+                                  errors = errors, ranks = Interval(req.ranks)),
+                       self.comm.frontend)
+
+    def _fetch(self, msg):
+        """Send the values the front-end asked for from our ranks.
+
+        The kept values of the request are discarded, since the front-end
+        fetches them only once.
+
+        """
+        local = self.comm.get_mpiranks()
+        stored = self.values.pop(msg.varcompare_id, (None, {}))[1]
+        values = dict((digest, stored[digest])
+                      for digest, rank in msg.fetch.iteritems()
+                      if rank in local and digest in stored)
+        if values:
+            self.comm.send(GDBMessage(VARCOMPARE_RES_MSG,
+                                      varcompare_id = msg.varcompare_id,
+                                      digests = {}, values = values, errors = {},
+                                      ranks = Interval(list(local))),
+                           self.comm.frontend)
+
+    def _expire(self):
+        """Discard kept values that were never fetched."""
+        expired = time.time() - gdbconf.varcompare_fetch_timeout
+        for varcompare_id, (kept, values) in self.values.items():
+            if kept < expired:
+                del self.values[varcompare_id]
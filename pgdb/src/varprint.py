@@ -5,13 +5,78 @@ and the like.
 
 """
 
+import sys, copy
 from conf import gdbconf
 from mi.commands import Command
 from mi.varobj import VariableObjectManager
+from mi.gdbmi_records import RESULT_CLASS_ERROR, ASYNC_EXEC_RUNNING
+from mi.gdbmiarec import AggregatedVariableObject
+from interval import Interval
+from cmdbatch import CommandRequest, CommandBatcher
 from gdb_shared import *
 
-class VariablePrinter:
-    """Manage variable printing on the back-end."""
+def _child_list(results):
+    """Return the list of children from var-list-children results."""
+    children = results.get("children", [])
+    if isinstance(children, dict):
+        # The parser gives a single child as a dict, several as a list.
+        children = children.get("child", [])
+        if isinstance(children, dict):
+            children = [children]
+    return children
+
+def _varobj_depth(name):
+    """Return the depth of a varobj name, not counting pseudochildren."""
+    return len([part for part in name.split(".")
+                if part not in VariableObjectManager.pseudochildren])
+
+class _VarprintRequest(CommandRequest):
+    """The state of one varprint across all the local ranks.
+
+    The variable objects are expanded a level at a time. frontier is the
+    list of (rank, varobj, max_children) tuples to list in the next level,
+    for every rank.
+
+    When a range of children is printed, the variable itself is found and
+    expanded as usual, except for its children. The range is then listed a
+    page at a time: each page's children are listed and expanded, and the
+    page is sent before the next one is started.
+
+    """
+
+    def __init__(self, varprint_id, name, ranks, child_range = None):
+        """Initialize the request varprint_id for variable name on ranks.
+
+        child_range, if given, is a (from, to) tuple of the children of the
+        variable to print, which are listed and sent in pages.
+
+        """
+        CommandRequest.__init__(self, ranks)
+        self.varprint_id = varprint_id
+        self.name = name
+        self.child_range = child_range
+        # The pages left to list, the page being listed, and the short names
+        # of its children on each rank, indexed by rank.
+        self.pages = None
+        self.page = None
+        self.page_children = {}
+        self.name_depth = _varobj_depth(name)
+        # Variable objects on the branch to name are listed this deep.
+        self.branch_depth = gdbconf.varprint_max_depth + self.name_depth
+        # Depth each rank started listing at, indexed by rank.
+        self.root_depths = {}
+        self.frontier = []
+
+class VariablePrinter(CommandBatcher):
+    """Manage variable printing on the back-end.
+
+    Every step of a varprint is done for all local ranks at once: the
+    commands for every rank are sent to GDB in one batch, and the next step
+    starts once all their results have arrived. Expanding the children of a
+    variable proceeds breadth-first, so printing a variable takes about as
+    many round trips to GDB as the depth printed.
+
+    """
 
     def __init__(self, be):
         """Initialization.
@@ -19,12 +84,31 @@ class VariablePrinter:
         be is the GDBBE associated with this.
 
         """
-        self.be = be
-        self.comm = be.comm
+        CommandBatcher.__init__(self, be)
         self.varobjs = be.varobjs
-        self.run_gdb_command = be.run_gdb_command
-        self.varprint_id = 0
-        self.varprint_stacks = {}
+        # Generation of each rank's inferior, bumped every time it resumes.
+        # Variable objects need updating only if they were last updated in
+        # an earlier generation.
+        self.generations = dict((rank, 0) for rank in self.varobjs)
+        # Number of varprints run, to track when roots were last printed.
+        self.view_count = 0
+        # Pages of children already listed, indexed by rank, then by (varobj
+        # name, from, to). Each entry is the generation the page was listed
+        # in and the short names of its children.
+        self.page_cache = dict((rank, {}) for rank in self.varobjs)
+        self.record_handler.add_type_handler(self._watch_running,
+                                             set([ASYNC_EXEC_RUNNING]))
+
+    def _watch_running(self, record, **kwargs):
+        """Bump the generation of the ranks that resumed running."""
+        try:
+            ranks = [self.be.thread_rank_map[int(record.thread_id)]]
+        except (AttributeError, KeyError, TypeError, ValueError):
+            # Typically "all" threads.
+            ranks = self.generations.keys()
+        for rank in ranks:
+            self.generations[rank] += 1
+        return True
 
     def varprint_handler(self, msg):
         """Handle the varprint message and begin the varprint sequence.
@@ -32,184 +116,320 @@ class VariablePrinter:
         The message has the fields
         ranks - the ranks to query.
         name - the name of the variable.
+        varprint_id - an ID for the request, returned with the result.
+        child_range - None, or a (from, to) tuple of the children to print.
+
+        To varprint, we first update the cached varobjs under the variable's
+        root, if its rank has run since they were last updated. Then we find
+        the variable object, or its closest ancestor, creating the root if we
+        have neither, and list children level by level until the tree has
+        been expanded. The results of every rank are then sent together, or
+        for ranges of children, a page at a time.
 
-        To varprint, we first run varprint_update, to update our cached varobjs.
-        Then we run another handler that checks if we have the variable object already.
-        If not, we do a depth-first search and eventually return the result.
+        Roots that have not been printed recently are frozen, so GDB does not
+        update them; they are thawed when printed again.
 
         """
-        for rank in msg.ranks.intersect(self.comm.get_mpiranks()):
-            self.varprint_update(msg.name, rank)
-
-    def varprint_handler2(self, name, rank):
-        """Follow-up varprint handler after udating, starts the DFS."""
-        # Check if we already have the variable object.
-        varobj = self.varobjs[rank].get_var_obj(name)
-        if varobj:
-            if not varobj.listed or varobj.more_children:
-                # If we explicitly list this variable, print all of its children.
-                self.varprint_start_no_create(rank, varobj, name,
-                                              max_children = sys.maxsize, reset_maxes = True)
-            else:
-                self.comm.send(GDBMessage(VARPRINT_RES_MSG, varobj = varobj, rank = rank, err = False), self.comm.frontend)
-        else:
-            # We do not. Start from the closest ancestor we have.
-            ancestor = self.varobjs[rank].get_lowest_ancestor(name)
-            if ancestor:
-                # Start by listing the children of the ancestor.
-                self.varprint_start_no_create(rank, ancestor, name)
-            else:
-                self.varprint_start(rank, name)
-
-    def varprint_update(self, name, rank):
-        """Check for updates on any of our variable objects."""
-        def _update_handler(record):
-            if "changelist" not in record.results:
-                print "Got a bad update record."
-                return True
-            for change in record.results["changelist"]:
-                varobj = self.varobjs[rank].get_var_obj(change["name"])
-                if varobj:
-                    # Potentially, a variable object could be manually created that we're not tracking.
-                    if "in_scope" in change:
-                        if change["in_scope"] in ["false", "invalid"]:
-                            self.varobjs[rank].del_var_obj(varobj)
-                            del varobj # This probably isn't necessary.
-                            return False
-                    if "type_changed" in change and change["type_changed"] == "true":
-                        self.varobjs[rank].del_var_obj(varobj)
-                        del varobj
-                        return False
-                    if "value" in change:
-                        varobj.value = change["value"]
-                    if "dynamic" in change:
-                        varobj.is_dynamic = change["dynamic"]
-                    if "displayhint" in change:
-                        varobj.display_hint = change["displayhint"]
-                    if "num_new_children" in change:
-                        new_num = int(change["new_num_children"])
-                        if new_num < len(varobj.children):
-                            # There has been a removal, so we no longer have child information.
-                            varobj.children = []
-                            varobj.listed = False
-                            varobj.has_more = False
-                        else:
-                            if "new_children" in change:
-                                for child in change["new_children"]:
-                                    varobj = VariableObjectManager.create_var_obj(child)
-                                    if not varobj:
-                                        print "Could not create child varobj!"
-                                        return True
-                                    if not self.varobjs[rank].add_var_obj(varobj):
-                                        print "Could not add child varobj!"
-                                        return True
-            self.varprint_handler2(name, rank)
-        tokens = self.run_gdb_command(Command("var-update", args = ("1", "*")), rank)
-        self.be.add_token_handler(tokens[rank], _update_handler)
-
-    def varprint_start(self, rank, name, max_depth = gdbconf.varprint_max_depth,
-                       max_children = gdbconf.varprint_max_children, reset_maxes = False):
-        """Start a varprint command sequence by creating the varobj in GDB."""
-        v_id = self.varprint_id
-        self.varprint_id += 1
-        base_name = VariableObjectManager.get_base_name(name)
-        branch_depth = max_depth + VariableObjectManager.get_name_depth(name)
-        def _list_handler(record):
-            return self.varprint_dfs(record, rank, v_id, name, max_depth = max_depth,
-                                     max_children = max_children, reset_maxes = False,
-                                     branch_depth = branch_depth, branch_name = name)
-        def _create_handler(record):
-            varobj = VariableObjectManager.create_var_obj(record.results)
+        ranks = list(msg.ranks.intersect(self.comm.get_mpiranks()))
+        if not ranks:
+            return
+        self.view_count += 1
+        req = _VarprintRequest(msg.varprint_id, msg.name, ranks,
+                               msg.child_range)
+        root_name = VariableObjectManager.get_base_name(msg.name)
+        commands = []
+        for rank in ranks:
+            for root in self.varobjs[rank].varobjs.itervalues():
+                if (not root.frozen and root.name != root_name and
+                    self.view_count - root.last_viewed > gdbconf.varprint_freeze_age):
+                    commands.append((Command("var-set-frozen",
+                                             args = ('"' + root.name + '"', "1")),
+                                     rank, None))
+                    root.frozen = True
+            root = self.varobjs[rank].get_var_obj(root_name)
+            if root is None:
+                continue
+            root.last_viewed = self.view_count
+            if root.frozen:
+                commands.append((Command("var-set-frozen",
+                                         args = ('"' + root.name + '"', "0")),
+                                 rank, None))
+                root.frozen = False
+            if root.generation != self.generations[rank]:
+                commands.append((Command("var-update",
+                                         args = ("1", '"' + root.name + '"')),
+                                 rank, (root, self.generations[rank])))
+        self._issue(req, commands, self._update_result, self._resolve)
+
+    def _update_result(self, req, record, rank, data):
+        """Apply the changes from var-update to our cached varobjs.
+
+        data is the root updated and the generation it was updated in, or
+        None for other commands sent with the update.
+
+        """
+        if data is None:
+            return
+        root, generation = data
+        varobjs = self.varobjs[rank]
+        if (RESULT_CLASS_ERROR in record.record_subtypes or
+            "changelist" not in record.results):
+            # Without an update, we cannot trust the cached varobjs.
+            varobjs.del_var_obj(root)
+            return
+        root.generation = generation
+        for change in record.results["changelist"]:
+            varobj = varobjs.get_var_obj(change["name"])
             if not varobj:
-                # Bad variable name.
-                return True
-            if not self.varobjs[rank].add_var_obj(varobj):
-                print "Could not add varobj."
-            if int(varobj.num_child) > 0 or varobj.is_dynamic:
-                # Set up our stack.
-                self.varprint_stacks[v_id] = [(varobj, 0)]
-                tokens = self.run_gdb_command(Command("var-list-children", args = ("1", record.results["name"])),
-                                              rank)
-                self.be.add_token_handler(tokens[rank], _list_handler)
-            else:
-                self.comm.send(GDBMessage(VARPRINT_RES_MSG, varobj = varobj, rank = rank, err = False), self.comm.frontend)
-        tokens = self.run_gdb_command(Command("var-create", args = (base_name, "*", base_name)), rank)
-        self.be.add_token_handler(tokens[rank], _create_handler)
-
-    def varprint_start_no_create(self, rank, varobj, name, max_depth = gdbconf.varprint_max_depth,
-                                 max_children = gdbconf.varprint_max_children, reset_maxes = False):
-        """Start a varprint sequence where we have already created the variable object."""
-        v_id = self.varprint_id
-        self.varprint_id += 1
-        self.varprint_stacks[v_id] = [(varobj, 0)]
-        branch_depth = max_depth = VariableObjectManager.get_name_depth(name)
-        def _list_handler(record):
-            return self.varprint_dfs(record, rank, v_id, name, max_depth = max_depth,
-                                     max_children = max_children, reset_maxes = reset_maxes,
-                                     branch_depth = branch_depth, branch_name = name)
-        tokens = self.run_gdb_command(Command("var-list-children", args = ("1", '"' + varobj.name + '"')), rank)
-        self.be.add_token_handler(tokens[rank], _list_handler)
-
-    def varprint_dfs(self, record, rank, v_id, name, max_depth = gdbconf.varprint_max_depth,
-                     max_children = gdbconf.varprint_max_children,
-                     reset_maxes = False, branch_depth = None, branch_name = None):
-        """Do the depth-first search for expanding a variable object's children."""
-        cur_varobj, parent_depth = self.varprint_stacks[v_id].pop()
-        cur_varobj.listed = True
-        if "has_more" not in record.results:
-            self.comm.send(GDBMessage(VARPRINT_RES_MSG, rank = rank, err = True, msg = "Got bad variable data."), self.comm.frontend)
-        elif "children" in record.results:
-            if len(record.results["children"]) > max_children:
-                cur_varobj.more_children = True
-            for child_tup in record.results["children"][:max_children]:
-                child = child_tup[1]
-                varobj = VariableObjectManager.create_var_obj(child)
-                if not varobj:
-                    print "Could not create child varobj!"
-                    return True
-                if not self.varobjs[rank].add_var_obj(varobj):
-                    print "Could not add child varobj!"
-                    return True
-                if int(varobj.num_child) > 0 or varobj.is_dynamic:
-                    # Only potentially push if the varobj can have children.
-                    do_listing = True
-                    if parent_depth > max_depth:
-                        # If the depth of the parent of this node is greater than five,
-                        # we want to terminate the search of this branch, unless this
-                        # node is a pseduo-child, or we want to go deeper on one branch.
-                        if branch_name and VariableObjectManager.same_branch(varobj.name, branch_name):
-                            if parent_depth > branch_depth and not VariableObjectManager.is_pseudochild(varobj):
-                                do_listing = False
-                        elif not VariableObjectManager.is_pseudochild(varobj):
-                            do_listing = False
-                    # Don't list null-pointers.
-                    if varobj.vartype and varobj.value and varobj.vartype[-1] == "*":
-                        try:
-                            if int(varobj.value, 0) == 0:
-                                do_listing = False
-                        except ValueError: pass
-                    # Do not evaluate children further when there's an excessive number.
-                    if len(record.results["children"]) > 128:
-                        do_listing = False
-                    # Add to the stack to list if we meet the requirements.
-                    if do_listing:
-                        self.varprint_stacks[v_id].append((varobj, parent_depth + 1))
-        if not self.varprint_stacks[v_id]:
-            to_send = self.varobjs[rank].get_var_obj(name)
-            if to_send:
-                self.comm.send(GDBMessage(VARPRINT_RES_MSG, varobj = to_send, rank = rank, err = False), self.comm.frontend)
+                # Potentially, a variable object could be manually created that we're not tracking.
+                continue
+            if change.get("in_scope") in ["false", "invalid"]:
+                varobjs.del_var_obj(varobj)
+                continue
+            if change.get("type_changed") == "true":
+                varobjs.del_var_obj(varobj)
+                continue
+            if "value" in change:
+                varobj.value = change["value"]
+            if "dynamic" in change:
+                varobj.is_dynamic = change["dynamic"]
+            if "displayhint" in change:
+                varobj.display_hint = change["displayhint"]
+            if "new_num_children" in change:
+                new_num = int(change["new_num_children"])
+                if new_num < len(varobj.children):
+                    # There has been a removal, so we no longer have child information.
+                    varobjs.clear_children(varobj)
+                    varobj.listed = False
+                    varobj.has_more = False
+                else:
+                    for child in change.get("new_children", []):
+                        child_varobj = VariableObjectManager.create_var_obj(child)
+                        if child_varobj:
+                            varobjs.add_var_obj(child_varobj)
+
+    def _resolve(self, req):
+        """Find where to start listing on each rank, creating roots as needed."""
+        to_create = []
+        for rank in req.ranks:
+            if rank in req.errors:
+                continue
+            varobj = self.varobjs[rank].get_var_obj(req.name)
+            if varobj:
+                req.root_depths[rank] = req.name_depth
+                if req.child_range is not None:
+                    # The children are listed by page.
+                    continue
+                if not varobj.listed or varobj.more_children:
+                    # If we explicitly list this variable, print all of its children.
+                    req.frontier.append((rank, varobj, sys.maxsize))
+                continue
+            # Start from the closest ancestor we have.
+            ancestor = self.varobjs[rank].get_lowest_ancestor(req.name)
+            if ancestor:
+                req.root_depths[rank] = _varobj_depth(ancestor.name)
+                req.frontier.append((rank, ancestor,
+                                     gdbconf.varprint_max_children))
             else:
-                self.comm.send(GDBMessage(VARPRINT_RES_MSG, rank = rank, err = True, msg = "Variable does not exist."), self.comm.frontend)
+                to_create.append(rank)
+        if to_create:
+            base_name = VariableObjectManager.get_base_name(req.name)
+            self._issue(req, [(Command("var-create",
+                                       args = (base_name, "*", base_name)),
+                               rank, None) for rank in to_create],
+                        self._create_result, self._expand)
         else:
-            to_list, depth = self.varprint_stacks[v_id][-1]
-            if reset_maxes:
-                def _list_handler(record):
-                    return self.varprint_dfs(record, rank, v_id, name, branch_depth = branch_depth,
-                                             branch_name = branch_name)
+            self._expand(req)
+
+    def _create_result(self, req, record, rank, data):
+        """Add the varobj created by var-create."""
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+            return
+        varobj = VariableObjectManager.create_var_obj(record.results)
+        if not varobj or not self.varobjs[rank].add_var_obj(varobj):
+            req.fail(rank, "Could not add varobj.")
+            return
+        varobj.generation = self.generations[rank]
+        varobj.last_viewed = self.view_count
+        req.root_depths[rank] = 1
+        if not self._is_range_target(req, varobj):
+            req.frontier.append((rank, varobj, gdbconf.varprint_max_children))
+
+    @staticmethod
+    def _is_range_target(req, varobj):
+        """Return whether varobj is a variable whose children are paged."""
+        return (req.child_range is not None and
+                VariableObjectManager.get_short_path(varobj.name) == req.name)
+
+    def _should_list(self, req, rank, varobj, num_siblings):
+        """Return whether to list the children of a newly-listed varobj."""
+        if not (int(varobj.num_child) > 0 or varobj.is_dynamic):
+            return False
+        # Do not evaluate children further when there's an excessive number.
+        if num_siblings > 128:
+            return False
+        # Don't list null-pointers.
+        if varobj.vartype and varobj.value and varobj.vartype[-1] == "*":
+            try:
+                if int(varobj.value, 0) == 0:
+                    return False
+            except ValueError: pass
+        # Pseudochildren do not add depth, so are listed along with their
+        # parents. We go deeper on the branch to the variable we print.
+        depth = _varobj_depth(varobj.name)
+        if depth < req.root_depths[rank] + gdbconf.varprint_max_depth:
+            return True
+        return (depth < req.branch_depth and
+                VariableObjectManager.same_branch(varobj.name, req.name))
+
+    def _expand(self, req):
+        """List the children of every varobj in the frontier, for all ranks."""
+        frontier = [entry for entry in req.frontier if entry[0] not in req.errors]
+        req.frontier = []
+        if not frontier:
+            self._finish(req)
+            return
+        self._issue(req, [(Command("var-list-children",
+                                   args = ("1", '"' + varobj.name + '"')),
+                           rank, (varobj, max_children))
+                          for rank, varobj, max_children in frontier],
+                    self._list_result, self._expand)
+
+    def _list_result(self, req, record, rank, data):
+        """Add the children from var-list-children and extend the frontier."""
+        varobj, max_children = data
+        if (RESULT_CLASS_ERROR in record.record_subtypes or
+            "has_more" not in record.results):
+            req.fail(rank, "Got bad variable data.")
+            return
+        varobj.listed = True
+        children = _child_list(record.results)
+        varobj.more_children = len(children) > max_children
+        for child in children[:max_children]:
+            child_varobj = VariableObjectManager.create_var_obj(child)
+            if not child_varobj or not self.varobjs[rank].add_var_obj(child_varobj):
+                req.fail(rank, "Could not add child varobj.")
+                return
+            if (self._should_list(req, rank, child_varobj, len(children)) and
+                not self._is_range_target(req, child_varobj)):
+                req.frontier.append((rank, child_varobj,
+                                     gdbconf.varprint_max_children))
+
+    def _next_page(self, req):
+        """List the children in the next page of the range, for all ranks.
+
+        Pages listed in the current generation of a rank are not listed
+        again. The first page also limits var-update to the range.
+
+        """
+        req.page = req.pages.pop(0)
+        req.page_children = {}
+        commands = []
+        for rank in req.ranks:
+            if rank in req.errors:
+                continue
+            varobj = self.varobjs[rank].get_var_obj(req.name)
+            if varobj is None:
+                req.fail(rank, "Variable does not exist.")
+                continue
+            name = '"' + varobj.name + '"'
+            if req.page[0] == req.child_range[0]:
+                commands.append((Command("var-set-update-range",
+                                         args = (name, req.child_range[0],
+                                                 req.child_range[1])),
+                                 rank, None))
+            cached = self.page_cache[rank].get((varobj.name,) + req.page)
+            if cached is not None and cached[0] == self.generations[rank]:
+                req.page_children[rank] = cached[1]
             else:
-                def _list_handler(record):
-                    return self.varprint_dfs(record, rank, v_id, name, max_depth = max_depth,
-                                             max_children = max_children, reset_maxes = reset_maxes,
-                                             branch_depth = branch_depth, branch_name = branch_name)
-            tokens = self.run_gdb_command(Command("var-list-children", args = ("1", '"' + to_list.name + '"')), rank)
-            self.be.add_token_handler(tokens[rank], _list_handler)
+                commands.append((Command("var-list-children",
+                                         args = ("1", name, req.page[0],
+                                                 req.page[1])),
+                                 rank, varobj))
+        self._issue(req, commands, self._page_result, self._expand)
+
+    def _page_result(self, req, record, rank, data):
+        """Add the children in a page and extend the frontier."""
+        if data is None:
+            # Result of var-set-update-range.
+            return
+        if (RESULT_CLASS_ERROR in record.record_subtypes or
+            "has_more" not in record.results):
+            req.fail(rank, "Got bad variable data.")
+            return
+        children = _child_list(record.results)
+        names = []
+        for child in children:
+            child_varobj = VariableObjectManager.create_var_obj(child)
+            if not child_varobj or not self.varobjs[rank].add_var_obj(child_varobj):
+                req.fail(rank, "Could not add child varobj.")
+                return
+            names.append(child_varobj.get_name())
+            if self._should_list(req, rank, child_varobj, len(children)):
+                req.frontier.append((rank, child_varobj,
+                                     gdbconf.varprint_max_children))
+        req.page_children[rank] = names
+        self.page_cache[rank][(data.name,) + req.page] = (
+            self.generations[rank], names)
+
+    def _finish(self, req):
+        """Send the results once a varprint, or a page of one, is expanded.
+
+        For ranges of children, this sends the current page, if any, and
+        starts the next.
+
+        """
+        if req.child_range is None:
+            self._send_result(req)
+            return
+        if req.pages is None:
+            start, end = req.child_range
+            req.pages = [(i, min(i + gdbconf.varprint_page_size, end))
+                         for i in range(start, end, gdbconf.varprint_page_size)]
+        if req.page is not None or not req.pages:
+            self._send_result(req, last = not req.pages)
+        if req.pages:
+            self._next_page(req)
+
+    def _send_result(self, req, last = True):
+        """Send the results for every rank to the front-end in one message.
+
+        The variable object trees of the ranks are aggregated, so that the
+        ranks that have identical trees share them. For a page of children,
+        the variable is sent with just the children in the page.
+
+        """
+        varobjs = []
+        ranks = []
+        # Maps error messages to the ranks that got them.
+        errors = {}
+        for rank in req.ranks:
+            varobj = None
+            if rank not in req.errors:
+                varobj = self.varobjs[rank].get_var_obj(req.name)
+                if varobj is None:
+                    req.fail(rank, "Variable does not exist.")
+            if varobj is None:
+                errors.setdefault(req.errors[rank], []).append(rank)
+                continue
+            if req.page is not None:
+                page_varobj = copy.copy(varobj)
+                page_varobj.children = dict(
+                    (name, varobj.children[name])
+                    for name in req.page_children.get(rank, [])
+                    if name in varobj.children)
+                page_varobj.more_children = False
+                varobj = page_varobj
+            varobjs.append(varobj)
+            ranks.append(rank)
+        tree = None
+        if varobjs:
+            tree = AggregatedVariableObject(varobjs, ranks)
+        errors = dict((msg, Interval(err_ranks))
+                      for msg, err_ranks in errors.iteritems())
+        self.comm.send(GDBMessage(VARPRINT_RES_MSG, varprint_id = req.varprint_id,
+                                  varobj = tree, errors = errors,
+                                  ranks = Interval(req.ranks), page = req.page,
+                                  last = last),
+                       self.comm.frontend)
@@ -0,0 +1,374 @@
+"""Summaries of numeric arrays for the varstat command.
+
+The back-end reads an array directly from the inferior's memory and
+summarizes it, rather than listing its elements through variable objects.
+Summaries from different ranks are merged in the MRNet tree and on the
+front-end, so only one summary reaches the front-end.
+
+"""
+
+import math, array, binascii, bisect
+from conf import gdbconf
+from mi.commands import Command
+from mi.gdbmi_records import RESULT_CLASS_ERROR
+from interval import Interval
+from cmdbatch import CommandRequest, CommandBatcher
+from gdb_shared import *
+
+# Maps element types to array module type codes.
+ELEMENT_TYPES = {
+    "double": "d",
+    "float": "f",
+    "char": "b",
+    "signed char": "b",
+    "unsigned char": "B",
+    "short": "h",
+    "unsigned short": "H",
+    "int": "i",
+    "unsigned int": "I",
+    "long": "l",
+    "unsigned long": "L",
+    "int8_t": "b",
+    "uint8_t": "B",
+    "int16_t": "h",
+    "uint16_t": "H",
+    "int32_t": "i",
+    "uint32_t": "I",
+    "real(kind=4)": "f",
+    "real(kind=8)": "d",
+    "integer(kind=4)": "i",
+    }
+# 64-bit integers are only supported when a long is 64 bits.
+if array.array("l").itemsize == 8:
+    ELEMENT_TYPES.update({
+        "long long": "l",
+        "unsigned long long": "L",
+        "int64_t": "l",
+        "uint64_t": "L",
+        "size_t": "L",
+        "integer(kind=8)": "l",
+        })
+
+def element_type_code(type_name):
+    """Return the array type code for an element type, or None."""
+    words = [word for word in type_name.split()
+             if word not in ("const", "volatile")]
+    return ELEMENT_TYPES.get(" ".join(words))
+
+class ArraySummary:
+    """A mergeable summary of the values of an array on some ranks.
+
+    count is the number of elements, nan and inf the number that are NaN or
+    infinite, and total the sum of the rest. minimum and maximum are the
+    smallest and largest finite values, with the Intervals of the ranks that
+    have them. histogram maps (sign, exponent) buckets to counts; bucket
+    (1, e) holds values in [2**(e-1), 2**e), (-1, e) the corresponding
+    negative values, and (0, 0) zeros.
+
+    """
+
+    def __init__(self, ranks):
+        """Initialize an empty summary for ranks."""
+        self.ranks = Interval(ranks)
+        self.count = 0
+        self.nan = 0
+        self.inf = 0
+        self.total = 0
+        self.minimum = None
+        self.min_ranks = Interval([])
+        self.maximum = None
+        self.max_ranks = Interval([])
+        self.histogram = {}
+
+    def _add_bucket(self, bucket, count):
+        """Add count values to a histogram bucket."""
+        if count:
+            self.histogram[bucket] = self.histogram.get(bucket, 0) + count
+
+    def _add_buckets(self, values, sign):
+        """Add sorted positive values to the buckets with sign.
+
+        This costs a bisection per bucket, rather than work per value.
+
+        """
+        i = 0
+        while i < len(values):
+            exponent = math.frexp(values[i])[1]
+            j = bisect.bisect_left(values, math.ldexp(1.0, exponent), i)
+            self._add_bucket((sign, exponent), j - i)
+            i = j
+
+    def _set_extreme(self, value, ranks, is_min):
+        """Update the minimum or maximum with value from ranks."""
+        current = self.minimum if is_min else self.maximum
+        if current is None or (value < current if is_min else value > current):
+            current_ranks = ranks
+            current = value
+        elif value == current:
+            current_ranks = (self.min_ranks if is_min else self.max_ranks) + ranks
+        else:
+            return
+        if is_min:
+            self.minimum, self.min_ranks = current, current_ranks
+        else:
+            self.maximum, self.max_ranks = current, current_ranks
+
+    def add_values(self, values):
+        """Add an array of values from the summary's ranks.
+
+        The work on each value is done by builtins; the values are sorted
+        once, and the histogram and extremes are found from the sorted
+        values.
+
+        """
+        self.count += len(values)
+        # NaNs and infinities are the only values for which x - x != 0.
+        finite = [x for x in values if x - x == 0]
+        if len(finite) != len(values):
+            nan = len([x for x in values if x != x])
+            self.nan += nan
+            self.inf += len(values) - len(finite) - nan
+        if not finite:
+            return
+        finite.sort()
+        self._set_extreme(finite[0], self.ranks, True)
+        self._set_extreme(finite[-1], self.ranks, False)
+        if isinstance(finite[0], float):
+            self.total += math.fsum(finite)
+        else:
+            self.total += sum(finite)
+        zero_start = bisect.bisect_left(finite, 0)
+        zero_end = bisect.bisect_right(finite, 0, zero_start)
+        self._add_bucket((0, 0), zero_end - zero_start)
+        self._add_buckets(finite[zero_end:], 1)
+        negatives = [-x for x in finite[:zero_start]]
+        negatives.reverse()
+        self._add_buckets(negatives, -1)
+
+    def merge(self, other):
+        """Merge the summary for other, disjoint, ranks into this one."""
+        self.ranks = self.ranks + other.ranks
+        self.count += other.count
+        self.nan += other.nan
+        self.inf += other.inf
+        self.total += other.total
+        if other.minimum is not None:
+            self._set_extreme(other.minimum, other.min_ranks, True)
+            self._set_extreme(other.maximum, other.max_ranks, False)
+        for bucket, count in other.histogram.iteritems():
+            self._add_bucket(bucket, count)
+
+    def mean(self):
+        """Return the mean of the finite values, or None."""
+        finite = self.count - self.nan - self.inf
+        if not finite:
+            return None
+        return float(self.total) / finite
+
+    @staticmethod
+    def _bucket_str(bucket):
+        """Return a string giving the range of a histogram bucket."""
+        sign, exponent = bucket
+        if sign == 0:
+            return "0"
+        low = math.ldexp(1.0, exponent - 1)
+        high = math.ldexp(1.0, exponent)
+        if sign > 0:
+            return "[{0:g}, {1:g})".format(low, high)
+        return "(-{1:g}, -{0:g}]".format(low, high)
+
+    def pretty_print(self, name):
+        """Return a list of lines describing the summary of array name."""
+        lines = ["{0}: {1} elements".format(name, self.count)]
+        if self.minimum is not None:
+            lines.append("   min = {0} [{1}], max = {2} [{3}], mean = {4:g}".format(
+                self.minimum, self.min_ranks, self.maximum, self.max_ranks,
+                self.mean()))
+        lines.append("   NaN = {0}, Inf = {1}".format(self.nan, self.inf))
+        for bucket in sorted(self.histogram,
+                             key=lambda b: (b[0], b[0] * b[1])):
+            lines.append("   {0}: {1}".format(self._bucket_str(bucket),
+                                              self.histogram[bucket]))
+        return lines
+
+def combine_varstat_results(results):
+    """Combine varstat results from disjoint sets of ranks.
+
+    results is a list of (summary, errors) tuples, where summary is an
+    ArraySummary or None, and errors maps error messages to the Interval of
+    ranks that got them. Returns one such tuple.
+
+    """
+    summary = None
+    errors = {}
+    for other, other_errors in results:
+        if other is not None:
+            if summary is None:
+                summary = other
+            else:
+                summary.merge(other)
+        for msg, ranks in other_errors.iteritems():
+            if msg in errors:
+                errors[msg] = errors[msg] + ranks
+            else:
+                errors[msg] = ranks
+    return summary, errors
+
+class _VarstatRequest(CommandRequest):
+    """The state of one varstat across the local ranks.
+
+    The element type, address of the first element, and number of elements
+    of the array on each rank are indexed by rank, as are the type of the
+    array expression, when no count is given, and the names of the
+    temporary variable objects used to find the types.
+
+    """
+
+    def __init__(self, varstat_id, expr, count, ranks):
+        """Initialize the request varstat_id for array expr on ranks.
+
+        count is the number of elements, or None to use the array's size.
+
+        """
+        CommandRequest.__init__(self, ranks)
+        self.varstat_id = varstat_id
+        self.expr = expr
+        self.types = {}
+        self.addresses = {}
+        self.counts = dict((rank, count) for rank in ranks)
+        self.array_types = {}
+        self.temp_names = {}
+        self.summaries = {}
+
+class VariableStatistics(CommandBatcher):
+    """Summarize numeric arrays on the back-end.
+
+    This takes two steps for all local ranks. The first finds the element
+    type, with a temporary variable object, and the address and size of the
+    array. Without a count, the type of the array is found the same way, and
+    pointers are rejected since their size is not that of the array. The second reads the array with data-read-memory-bytes, in
+    chunks of gdbconf.varstat_chunk_size bytes, each of which is summarized
+    as it arrives.
+
+    """
+
+    def varstat_handler(self, msg):
+        """Handle a varstat message.
+
+        The message has the fields
+        ranks - the ranks to query.
+        expr - the array expression.
+        count - the number of elements, or None for the size of the array.
+        varstat_id - an ID for the request, returned with the result.
+
+        """
+        ranks = list(msg.ranks.intersect(self.comm.get_mpiranks()))
+        if not ranks:
+            return
+        req = _VarstatRequest(msg.varstat_id, msg.expr, msg.count, ranks)
+        first = "({0})[0]".format(msg.expr)
+        commands = []
+        for rank in ranks:
+            if msg.count is None:
+                # Pointers have no size to take the count from.
+                commands.append((Command("var-create",
+                                         args = ("-", "*", '"' + msg.expr + '"')),
+                                 rank, "array_type"))
+            commands.append((Command("var-create", args = ("-", "*", '"' + first + '"')),
+                             rank, "type"))
+            commands.append((Command("data-evaluate-expression",
+                                     args = ('"(unsigned long)&' + first + '"',)),
+                             rank, "address"))
+            if msg.count is None:
+                commands.append((Command("data-evaluate-expression",
+                                         args = ('"sizeof({0})/sizeof({1})"'.format(
+                                             msg.expr, first),)),
+                                 rank, "count"))
+        self._issue(req, commands, self._resolve_result, self._read)
+
+    def _resolve_result(self, req, record, rank, data):
+        """Record the type, address, or size of the array on rank."""
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+        elif data in ("type", "array_type"):
+            req.temp_names.setdefault(rank, []).append(record.results["name"])
+            if data == "type":
+                req.types[rank] = record.results.get("type", "")
+            else:
+                req.array_types[rank] = record.results.get("type", "")
+        else:
+            try:
+                value = int(record.results["value"].split()[-1], 0)
+            except (KeyError, IndexError, ValueError):
+                req.fail(rank, "Could not find the {0} of the array.".format(data))
+                return
+            if data == "address":
+                req.addresses[rank] = value
+            else:
+                req.counts[rank] = value
+
+    def _read(self, req):
+        """Read the array on every rank, and delete the temporary varobjs."""
+        chunk_size = gdbconf.varstat_chunk_size
+        commands = []
+        for rank in req.ranks:
+            for name in req.temp_names.get(rank, []):
+                commands.append((Command("var-delete", args = (name,)),
+                                 rank, None))
+            if rank in req.errors:
+                continue
+            if req.array_types.get(rank, "").rstrip().endswith("*"):
+                req.fail(rank, "{0} is a pointer; give the number of elements.".format(
+                    req.expr))
+                continue
+            code = element_type_code(req.types[rank])
+            if code is None:
+                req.fail(rank, "Unsupported element type {0}.".format(
+                    req.types[rank]))
+                continue
+            if req.counts[rank] <= 0:
+                req.fail(rank, "Bad number of elements.")
+                continue
+            req.summaries[rank] = ArraySummary(rank)
+            itemsize = array.array(code).itemsize
+            size = req.counts[rank] * itemsize
+            # Keep every chunk a whole number of elements.
+            chunk = max(chunk_size - chunk_size % itemsize, itemsize)
+            for offset in range(0, size, chunk):
+                commands.append((Command("data-read-memory-bytes",
+                                         args = (req.addresses[rank] + offset,
+                                                 min(chunk, size - offset))),
+                                 rank, code))
+        self._issue(req, commands, self._read_result, self._finish)
+
+    def _read_result(self, req, record, rank, data):
+        """Summarize one chunk of the array on rank."""
+        if data is None:
+            # Result of var-delete.
+            return
+        if RESULT_CLASS_ERROR in record.record_subtypes:
+            req.fail(rank, record.msg)
+            return
+        for block in record.results.get("memory", []):
+            values = array.array(data)
+            contents = binascii.unhexlify(block["contents"])
+            values.fromstring(contents[:len(contents) - len(contents) % values.itemsize])
+            req.summaries[rank].add_values(values)
+
+    def _finish(self, req):
+        """Send the merged summary of every rank to the front-end."""
+        summaries = []
+        # Maps error messages to the ranks that got them.
+        errors = {}
+        for rank in req.ranks:
+            if rank in req.errors:
+                errors.setdefault(req.errors[rank], []).append(rank)
+            else:
+                summaries.append((req.summaries[rank], {}))
+        summary, _ = combine_varstat_results(summaries)
+        errors = dict((msg, Interval(err_ranks))
+                      for msg, err_ranks in errors.iteritems())
+        self.comm.send(GDBMessage(VARSTAT_RES_MSG, varstat_id = req.varstat_id,
+                                  summary = summary, errors = errors,
+                                  ranks = Interval(req.ranks)),
+                       self.comm.frontend)